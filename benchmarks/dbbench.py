@@ -0,0 +1,458 @@
+"""
+Micro-benchmarks for database.py
+
+Seeds a local Postgres with a realistic dataset and times the public
+database.py functions at each data size. Results are written as JSON and can
+be compared against a baseline run.
+
+Usage:
+  DATABASE_URL=postgresql://localhost/hackathon_bench \\
+  python -m benchmarks.dbbench --sizes 1000,10000 --out bench.json
+
+  # after a change: fail (exit 1) if anything got >15% slower
+  python -m benchmarks.dbbench --sizes 1000,10000 --out new.json --baseline bench.json
+
+  # compare two existing result files
+  python -m benchmarks.dbbench --compare bench.json new.json
+
+Sizes are numbers of users; teams, submissions and audit rows scale with them.
+Seeding is incremental, so the largest size costs the most only once. Use a
+dedicated database: the benchmark writes to it.
+"""
+
+import os
+import sys
+import json
+import time
+import random
+import asyncio
+import argparse
+import functools
+import platform
+import statistics
+import subprocess
+from datetime import datetime, timedelta, timezone
+from typing import Callable, Dict, List, Optional, Tuple
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import database as db
+from state_store import DirectStateStore
+from benchmarks.loadgen import check_database_url, percentile
+
+TEAM_SIZE = 4
+HACKATHONS = 5
+STAGES_PER_HACKATHON = 3
+SUBMISSION_RATE = 0.7
+
+# Functions that read whole tables run fewer iterations
+HEAVY = {'get_all_active_users', 'get_all_consented_users', 'get_all_submissions',
+         'get_stats', 'reconcile_stats', 'get_stage_submissions', 'get_hackathon_participants',
+         'stream_consented_users', 'stream_consented_users (export)', 'stream_hackathon_participants'}
+
+# Not timed: pool and lifecycle plumbing
+SKIPPED = {'create_tables', 'close_pool', 'get_pool', 'get_read_pool', 'start_cache_listener', 'stop_cache_listener'}
+
+# Telegram ids for users created per call by write benchmarks, clear of the seeded range
+FRESH_ID_OFFSET = 500_000_000
+
+
+class Dataset:
+    """Everything seeded so far, plus random pickers for benchmark arguments."""
+
+    def __init__(self, id_base: int):
+        self.id_base = id_base
+        self.users = 0
+        self.user_uuids: List[str] = []
+        self.hackathons: List[str] = []
+        self.stages: List[str] = []
+        self.teams: List[dict] = []
+        self.fresh_ids = id_base + FRESH_ID_OFFSET
+        # DRAFT hackathon with two stages for the admin writes, so seeded data stays as is
+        self.scratch: Optional[dict] = None
+        self.rng = random.Random(42)
+
+    def telegram_id(self) -> int:
+        return self.id_base + self.rng.randrange(self.users)
+
+    def team(self) -> dict:
+        return self.rng.choice(self.teams)
+
+    def stage(self) -> str:
+        return self.rng.choice(self.stages)
+
+    def fresh_telegram_id(self) -> int:
+        self.fresh_ids += 1
+        return self.fresh_ids
+
+
+async def _bounded(coros, limit: int = 8) -> list:
+    semaphore = asyncio.Semaphore(limit)
+
+    async def run(coro):
+        async with semaphore:
+            return await coro
+    return await asyncio.gather(*(run(c) for c in coros))
+
+
+async def _seed_user(tid: int) -> str:
+    user = await db.add_user(telegram_id=tid, first_name="Bench", username=f"bench{tid}", last_name=f"User{tid % 100000}")
+    await db.set_user_consent(tid, True)
+    await db.update_user(tid, language=random.choice(('uz', 'ru', 'en')), email=f"bench{tid}@example.com",
+                         location="Tashkent", pinfl=f"{tid % 10 ** 14:014d}", registration_complete=True)
+    await db.log_action(tid, 'completed_registration', {})
+    return str(user['id'])
+
+
+async def seed(data: Dataset, users: int) -> None:
+    """Grow the dataset to `users` users with teams, submissions and audit rows."""
+    now = datetime.now()
+    if not data.hackathons:
+        for h in range(HACKATHONS):
+            hackathon = await db.create_hackathon(
+                name=f"Bench hackathon {h + 1}", description="Benchmark data", status='ACTIVE',
+                start_date=now.date(), end_date=(now + timedelta(days=30)).date(),
+                registration_deadline=now + timedelta(days=30), name_ru=f"Хакатон {h + 1}", name_en=f"Hackathon {h + 1}",
+            )
+            data.hackathons.append(str(hackathon['id']))
+            for s in range(STAGES_PER_HACKATHON):
+                stage = await db.create_stage(
+                    data.hackathons[-1], s + 1, f"Stage {s + 1}", task_description="Benchmark task",
+                    start_date=now, deadline=now + timedelta(days=7 * (s + 1)),
+                    name_ru=f"Этап {s + 1}", name_en=f"Stage {s + 1}",
+                )
+                data.stages.append(str(stage['id']))
+            await db.activate_stage(data.stages[-STAGES_PER_HACKATHON])
+
+    first = data.users
+    new_ids = [data.id_base + i for i in range(first, users)]
+    data.user_uuids += await _bounded(_seed_user(tid) for tid in new_ids)
+    data.users = users
+
+    # Every TEAM_SIZE-th new user owns a team in one hackathon; the rest join it
+    owners = new_ids[::TEAM_SIZE]
+    hackathons = [data.hackathons[(first + i) % HACKATHONS] for i in range(len(owners))]
+    teams = await _bounded(
+        db.create_team(h, f"Bench team {tid}", owner_id=tid, field="Fintech")
+        for tid, h in zip(owners, hackathons)
+    )
+    await _bounded(
+        db.add_team_member(team['id'], tid)
+        for i, team in enumerate(teams)
+        for tid in new_ids[i * TEAM_SIZE + 1:(i + 1) * TEAM_SIZE]
+    )
+
+    submissions = []
+    for team, owner in zip(teams, owners):
+        team = dict(team, owner_telegram_id=owner)
+        data.teams.append(team)
+        h = data.hackathons.index(team['hackathon_id'])
+        for stage_id in data.stages[h * STAGES_PER_HACKATHON:(h + 1) * STAGES_PER_HACKATHON]:
+            if data.rng.random() < SUBMISSION_RATE:
+                submissions.append(db.create_submission(team['id'], stage_id, owner,
+                                                        content="https://github.com/bench/solution"))
+    await _bounded(submissions)
+
+
+async def _drain(stream) -> int:
+    count = 0
+    async for _ in stream:
+        count += 1
+    return count
+
+
+class Prepared:
+    """Case whose arguments (fresh users, teams) are created untimed before the timed calls."""
+
+    def __init__(self, prepare: Callable, run: Callable):
+        self.prepare = prepare
+        self.run = run
+
+
+async def _fresh_user(data: Dataset) -> int:
+    tid = data.fresh_telegram_id()
+    await _seed_user(tid)
+    return tid
+
+
+async def _fresh_team(data: Dataset, members: int = 0) -> Tuple[dict, List[int]]:
+    owner = await _fresh_user(data)
+    team = await db.create_team(data.rng.choice(data.hackathons), f"Bench team {owner}", owner_id=owner)
+    tids = [await _fresh_user(data) for _ in range(members)]
+    for tid in tids:
+        await db.add_team_member(team['id'], tid)
+    return team, tids
+
+
+async def _scratch(data: Dataset) -> dict:
+    if data.scratch is None:
+        now = datetime.now()
+        hackathon = await db.create_hackathon(name="Bench scratch", description="Admin write benchmarks")
+        stages = [await db.create_stage(hackathon['id'], s + 1, f"Scratch {s + 1}", start_date=now,
+                                        deadline=now + timedelta(days=7)) for s in range(2)]
+        data.scratch = {'hackathon': str(hackathon['id']), 'stages': [str(s['id']) for s in stages]}
+    return data.scratch
+
+
+def _write_cases(data: Dataset) -> Dict[str, Prepared]:
+    async def new_id():
+        return (data.fresh_telegram_id(),)
+
+    async def user():
+        return (await _fresh_user(data),)
+
+    async def team_and_user():
+        team, _ = await _fresh_team(data)
+        return team, await _fresh_user(data)
+
+    async def team_with_member():
+        team, (member,) = await _fresh_team(data, members=1)
+        return team['id'], member
+
+    async def scratch_stage():
+        scratch = await _scratch(data)
+        return (data.rng.choice(scratch['stages']),)
+
+    async def scratch_hackathon():
+        return ((await _scratch(data))['hackathon'],)
+
+    async def nothing():
+        return ()
+
+    return {
+        'add_user': Prepared(new_id, lambda tid: db.add_user(telegram_id=tid, first_name="Bench", username=f"bench{tid}")),
+        'create_team': Prepared(
+            user, lambda tid: db.create_team(data.rng.choice(data.hackathons), f"Bench team {tid}", owner_id=tid)),
+        'add_team_member': Prepared(team_and_user, lambda team, tid: db.add_team_member(team['id'], tid)),
+        'join_team_by_code': Prepared(team_and_user, lambda team, tid: db.join_team_by_code(team['code'], tid)),
+        'leave_team': Prepared(team_with_member, db.leave_team),
+        'remove_team_member': Prepared(team_with_member, db.remove_team_member),
+        'update_member_role': Prepared(team_with_member, lambda team_id, tid: db.update_member_role(
+            team_id, tid, 'DESIGNER')),
+        'set_admin': Prepared(user, lambda tid: db.set_admin(tid, False)),
+        'set_user_password': Prepared(user, db.set_user_password),
+        'clear_registration_state': Prepared(user, db.clear_registration_state),
+        'create_hackathon': Prepared(nothing, lambda: db.create_hackathon(
+            name="Bench draft", description="Benchmark data")),
+        'create_stage': Prepared(scratch_hackathon, lambda hid: db.create_stage(
+            hid, 3, "Bench stage", task_description="Benchmark task")),
+        'activate_stage': Prepared(scratch_stage, db.activate_stage),
+        'update_hackathon_status': Prepared(scratch_hackathon, lambda hid: db.update_hackathon_status(hid, 'DRAFT')),
+    }
+
+
+async def _uncached(fn, *args):
+    """Call with the read caches emptied first, to time the query behind them."""
+    db._invalidate_caches()
+    return await fn(*args)
+
+
+def build_cases(data: Dataset) -> Dict[str, Callable]:
+    """One zero-argument coroutine factory per benchmarked database.py function."""
+    def team_member_id():
+        return data.team()['owner_telegram_id']
+
+    def create_submission():
+        team = data.team()
+        return db.create_submission(team['id'], data.stage(), team['owner_telegram_id'],
+                                    content="https://github.com/bench/v2")
+
+    return {
+        'get_user': lambda: db.get_user(data.telegram_id()),
+        'get_session_user': lambda: db.get_session_user(data.telegram_id()),
+        'get_user_profile': lambda: db.get_user_profile(data.telegram_id()),
+        'get_user_by_id': lambda: db.get_user_by_id(data.rng.choice(data.user_uuids)),
+        'get_user_by_email': lambda: db.get_user_by_email(f"bench{data.telegram_id()}@example.com"),
+        'get_user_password': lambda: db.get_user_password(data.telegram_id()),
+        'update_user': lambda: db.update_user(data.telegram_id(), location="Samarkand"),
+        'set_user_consent': lambda: db.set_user_consent(data.telegram_id(), True),
+        'has_user_consented': lambda: db.has_user_consented(data.telegram_id()),
+        'is_admin': lambda: db.is_admin(data.telegram_id()),
+        'get_all_active_users': lambda: db.get_all_active_users(),
+        'get_all_consented_users': lambda: db.get_all_consented_users(),
+        'stream_consented_users': lambda: _drain(db.stream_consented_users()),
+        'stream_consented_users (export)': lambda: _drain(db.stream_consented_users(
+            ('telegram_id', 'username', 'first_name', 'last_name', 'phone', 'pinfl', 'created_at'))),
+        'get_hackathon': lambda: db.get_hackathon(data.rng.choice(data.hackathons)),
+        'get_active_hackathons': lambda: db.get_active_hackathons(),
+        'get_active_hackathons (uncached)': lambda: _uncached(db.get_active_hackathons),
+        'get_stage': lambda: db.get_stage(data.stage()),
+        'get_stage (uncached)': lambda: _uncached(db.get_stage, data.stage()),
+        'get_stages': lambda: db.get_stages(data.rng.choice(data.hackathons)),
+        'get_active_stage': lambda: db.get_active_stage(data.rng.choice(data.hackathons)),
+        'get_stage_view': lambda: db.get_stage_view(data.stage(), team_member_id()),
+        'get_team': lambda: db.get_team(data.team()['id']),
+        'get_team_by_code': lambda: db.get_team_by_code(data.team()['code']),
+        'get_team_by_code (uncached)': lambda: _uncached(db.get_team_by_code, data.team()['code']),
+        'check_team_join': lambda: db.check_team_join(data.team()['code'], data.telegram_id()),
+        'get_user_teams': lambda: db.get_user_teams(data.telegram_id()),
+        'get_user_teams (uncached)': lambda: _uncached(db.get_user_teams, data.telegram_id()),
+        'get_user_team_for_hackathon': lambda: db.get_user_team_for_hackathon(
+            data.telegram_id(), data.rng.choice(data.hackathons)),
+        'get_team_members': lambda: db.get_team_members(data.team()['id']),
+        'create_submission': create_submission,
+        'get_submission': lambda: db.get_submission(data.team()['id'], data.stage()),
+        'get_stage_submissions': lambda: db.get_stage_submissions(data.stage()),
+        'get_all_submissions': lambda: db.get_all_submissions(),
+        'get_submissions_page': lambda: db.get_submissions_page(),
+        'set_registration_state': lambda: db.set_registration_state(
+            data.telegram_id(), 'reg_email', {'draft': {'first_name': 'Bench'}}),
+        'get_registration_state': lambda: db.get_registration_state(data.telegram_id()),
+        'get_hackathon_participants': lambda: db.get_hackathon_participants(data.rng.choice(data.hackathons)),
+        'stream_hackathon_participants': lambda: _drain(
+            db.stream_hackathon_participants(data.rng.choice(data.hackathons))),
+        'log_action': lambda: db.log_action(data.telegram_id(), 'bench', {'k': 'v'}),
+        'get_stats': lambda: db.get_stats(),
+        'reconcile_stats': lambda: db.reconcile_stats(),
+        'get_stats_history': lambda: db.get_stats_history(datetime.now(timezone.utc) - timedelta(days=7)),
+        'record_stats_sample': lambda: db.record_stats_sample(300),
+        'downsample_stats_samples': lambda: db.downsample_stats_samples(),
+        **_write_cases(data),
+    }
+
+
+def uncovered(cases: Dict[str, Callable]) -> List[str]:
+    """Public coroutine functions of database.py that have no benchmark yet."""
+    names = []
+    for name in dir(db):
+        fn = getattr(db, name)
+        if name.startswith('_') or not asyncio.iscoroutinefunction(fn) or getattr(fn, '__module__', '') != db.__name__:
+            continue
+        if name not in cases and name not in SKIPPED:
+            names.append(name)
+    return names
+
+
+async def time_case(case, iterations: int, warmup: int) -> dict:
+    if isinstance(case, Prepared):
+        # Set up every call first, so setup queries are neither timed nor counted
+        calls = [functools.partial(case.run, *await case.prepare()) for _ in range(warmup + iterations)]
+    else:
+        calls = [case] * (warmup + iterations)
+    for call in calls[:warmup]:
+        await call()
+    db.reset_query_stats()
+    samples = []
+    for call in calls[warmup:]:
+        started = time.perf_counter()
+        await call()
+        samples.append(time.perf_counter() - started)
+    samples.sort()
+    queries = db.get_query_stats()['functions']
+    return {
+        'iterations': iterations,
+        'mean': statistics.fmean(samples),
+        'p50': percentile(samples, 0.50),
+        'p95': percentile(samples, 0.95),
+        'p99': percentile(samples, 0.99),
+        'ops': iterations / sum(samples),
+        'queries_per_call': sum(q['calls'] for q in queries.values()) / iterations,
+        'rows_per_call': sum(q['rows'] for q in queries.values()) / iterations,
+    }
+
+
+async def run_bench(args) -> dict:
+    # Measure the database, not the in-memory state cache
+    db.set_state_store(DirectStateStore(db.PostgresStateBackend()))
+    await db.create_tables()
+    data = Dataset(args.id_base or int(time.time()) * 1000)
+    cases = build_cases(data)
+    if args.only:
+        cases = {name: fn for name, fn in cases.items() if name in args.only}
+
+    results = {}
+    for size in args.sizes:
+        started = time.perf_counter()
+        await seed(data, size)
+        print(f"Seeded {size} users in {time.perf_counter() - started:.1f}s")
+        results[str(size)] = {}
+        for name, factory in cases.items():
+            iterations = max(5, args.iterations // 10) if name in HEAVY else args.iterations
+            results[str(size)][name] = await time_case(factory, iterations, args.warmup)
+            r = results[str(size)][name]
+            print(f"  {name:<30} p50 {r['p50'] * 1000:8.2f}ms  p95 {r['p95'] * 1000:8.2f}ms  "
+                  f"{r['queries_per_call']:.1f} q/call")
+
+    missing = uncovered(build_cases(data))
+    if missing:
+        print(f"\nNo benchmark yet for: {', '.join(missing)}")
+    await db.close_pool()
+    return {'meta': _meta(args), 'results': results}
+
+
+def _meta(args) -> dict:
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                                cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip()
+    except OSError:
+        commit = ''
+    return {
+        'commit': commit,
+        'created_at': datetime.now(timezone.utc).isoformat(),
+        'python': platform.python_version(),
+        'sizes': args.sizes,
+        'iterations': args.iterations,
+        'pool': {'min_size': db.DB_POOL_MIN_SIZE, 'max_size': db.DB_POOL_MAX_SIZE},
+    }
+
+
+def compare(baseline: dict, current: dict, threshold: float = 0.15, noise_floor: float = 0.0002) -> int:
+    """Print p50 changes per size and function; return the number of regressions."""
+    regressions = 0
+    print(f"\nBaseline {baseline['meta'].get('commit') or '?'} -> current {current['meta'].get('commit') or '?'}")
+    print(f"{'size':>7}  {'function':<30}{'base p50':>10}{'new p50':>10}{'change':>9}")
+    for size, cases in current['results'].items():
+        base_cases = baseline['results'].get(size, {})
+        for name, new in cases.items():
+            base = base_cases.get(name)
+            if not base:
+                continue
+            change = new['p50'] / base['p50'] - 1 if base['p50'] else 0.0
+            mark = ''
+            if abs(new['p50'] - base['p50']) >= noise_floor:
+                if change > threshold:
+                    mark = '  REGRESSION'
+                    regressions += 1
+                elif change < -threshold:
+                    mark = '  faster'
+            print(f"{size:>7}  {name:<30}{base['p50'] * 1000:>9.2f}ms{new['p50'] * 1000:>8.2f}ms"
+                  f"{change * 100:>+8.1f}%{mark}")
+    print(f"\n{regressions} regression(s) over {threshold * 100:.0f}%")
+    return regressions
+
+
+def _load(path: str) -> dict:
+    with open(path) as f:
+        return json.load(f)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark database.py functions across data sizes")
+    parser.add_argument('--sizes', default='1000', help="comma-separated user counts, ascending")
+    parser.add_argument('--iterations', type=int, default=200, help="timed calls per function")
+    parser.add_argument('--warmup', type=int, default=10, help="untimed calls per function")
+    parser.add_argument('--only', help="comma-separated function names to run")
+    parser.add_argument('--id-base', type=int, default=0, help="first telegram id (default: derived from time)")
+    parser.add_argument('--out', default='bench.json', help="where to write results")
+    parser.add_argument('--baseline', help="compare against this result file after the run")
+    parser.add_argument('--threshold', type=float, default=0.15, help="p50 slowdown that counts as a regression")
+    parser.add_argument('--compare', nargs=2, metavar=('BASELINE', 'CURRENT'), help="only compare two result files")
+    parser.add_argument('--allow-remote', action='store_true', help="allow a non-local DATABASE_URL")
+    args = parser.parse_args(argv)
+
+    if args.compare:
+        sys.exit(1 if compare(_load(args.compare[0]), _load(args.compare[1]), args.threshold) else 0)
+
+    args.sizes = sorted(int(s) for s in args.sizes.split(','))
+    args.only = set(args.only.split(',')) if args.only else None
+    check_database_url(db.DATABASE_URL, args.allow_remote)
+    result = asyncio.run(run_bench(args))
+    with open(args.out, 'w') as f:
+        json.dump(result, f, indent=2)
+    print(f"\nResults written to {args.out}")
+    if args.baseline:
+        sys.exit(1 if compare(_load(args.baseline), result, args.threshold) else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,115 @@
+"""
+Offline Telegram doubles for benchmarks
+FakeBot answers Bot API calls locally; UpdateFactory builds realistic updates
+"""
+
+import time
+import asyncio
+import itertools
+from collections import Counter
+from typing import Any, Dict, Optional
+
+from telegram import Update
+from telegram.ext import ExtBot
+
+BOT_USER = {
+    'id': 1,
+    'is_bot': True,
+    'first_name': 'Hackathon Bot',
+    'username': 'hackathon_load_bot',
+    'can_join_groups': True,
+    'can_read_all_group_messages': False,
+    'supports_inline_queries': False,
+}
+
+
+class FakeBot(ExtBot):
+    """
+    Bot that never leaves the process.
+
+    Every Bot API call is counted per method and answered with the smallest
+    payload PTB accepts. `api_latency` adds a fixed delay per call to model the
+    round trip to api.telegram.org.
+    """
+
+    def __init__(self, token: str = '0:loadtest', api_latency: float = 0.0, **kwargs):
+        super().__init__(token, **kwargs)
+        with self._unfrozen():
+            self._api_latency = api_latency
+            self._message_ids = itertools.count(1)
+            self.calls: Counter = Counter()
+
+    async def _post(self, endpoint: str, data: Optional[Dict[str, Any]] = None, *args, **kwargs) -> Any:
+        self.calls[endpoint] += 1
+        if self._api_latency:
+            await asyncio.sleep(self._api_latency)
+        if endpoint == 'getMe':
+            return dict(BOT_USER)
+        if endpoint.startswith(('send', 'edit', 'copy', 'forward')):
+            data = data or {}
+            if endpoint.startswith('edit') and 'inline_message_id' in data:
+                return True
+            return {
+                'message_id': data.get('message_id') or next(self._message_ids),
+                'date': int(time.time()),
+                'chat': {'id': data.get('chat_id', 0), 'type': 'private'},
+                'from': BOT_USER,
+                'text': str(data.get('text', '')),
+            }
+        return True
+
+
+class UpdateFactory:
+    """Builds private-chat updates the way Telegram delivers them."""
+
+    def __init__(self, bot: ExtBot):
+        self.bot = bot
+        self._ids = itertools.count(1)
+
+    def _user(self, telegram_id: int) -> dict:
+        return {'id': telegram_id, 'is_bot': False, 'first_name': 'Load',
+                'last_name': f'User{telegram_id % 100000}', 'username': f'load{telegram_id}',
+                'language_code': 'en'}
+
+    def _message(self, telegram_id: int, **fields) -> dict:
+        return dict({
+            'message_id': next(self._ids),
+            'date': int(time.time()),
+            'chat': {'id': telegram_id, 'type': 'private'},
+            'from': self._user(telegram_id),
+        }, **fields)
+
+    def _update(self, **fields) -> Update:
+        return Update.de_json(dict({'update_id': next(self._ids)}, **fields), self.bot)
+
+    def text(self, telegram_id: int, text: str) -> Update:
+        return self._update(message=self._message(telegram_id, text=text))
+
+    def command(self, telegram_id: int, command: str, *args: str) -> Update:
+        text = ' '.join((f'/{command}',) + args)
+        entity = {'type': 'bot_command', 'offset': 0, 'length': len(command) + 1}
+        return self._update(message=self._message(telegram_id, text=text, entities=[entity]))
+
+    def callback(self, telegram_id: int, data: str) -> Update:
+        message = self._message(telegram_id, text='…')
+        message['from'] = BOT_USER
+        return self._update(callback_query={
+            'id': str(next(self._ids)),
+            'from': self._user(telegram_id),
+            'chat_instance': str(telegram_id),
+            'message': message,
+            'data': data,
+        })
+
+    def contact(self, telegram_id: int, phone: str) -> Update:
+        return self._update(message=self._message(telegram_id, contact={
+            'phone_number': phone, 'first_name': 'Load', 'user_id': telegram_id,
+        }))
+
+    def document(self, telegram_id: int, file_name: str = 'solution.zip',
+                 mime_type: str = 'application/zip', size: int = 524288) -> Update:
+        n = next(self._ids)
+        return self._update(message=self._message(telegram_id, document={
+            'file_id': f'BQACAgload{n}', 'file_unique_id': f'load{n}',
+            'file_name': file_name, 'mime_type': mime_type, 'file_size': size,
+        }))
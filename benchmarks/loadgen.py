@@ -0,0 +1,266 @@
+"""
+Synthetic load generator for Hackathon Bot
+
+Drives the real handlers (bot.register_handlers) with generated updates for
+the main flows against a local Postgres (or the in-memory backend with
+--memory), with Telegram replaced by FakeBot:
+
+  /start -> language -> offer -> 8 registration steps -> create or join team
+  -> open stage -> submit link -> submit file
+
+Usage:
+  DATABASE_URL=postgresql://localhost/hackathon_load \\
+  python -m benchmarks.loadgen --users 500 --concurrency 50 --team-size 4
+
+  # handler-only numbers, no database needed (e.g. in CI)
+  python -m benchmarks.loadgen --users 500 --memory
+
+Concurrency is the number of updates in flight at once. Every run seeds its
+own hackathon and uses fresh telegram ids, so runs don't interfere.
+"""
+
+import os
+import sys
+import json
+import time
+import asyncio
+import argparse
+import statistics
+from collections import defaultdict
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional
+from urllib.parse import urlparse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("BOT_TOKEN", "0:loadtest")
+
+from telegram.ext import Application
+
+import bot
+from repository import db, use_memory
+from benchmarks.fakes import FakeBot, UpdateFactory
+
+LOCAL_HOSTS = {'localhost', '127.0.0.1', '::1', 'postgres', 'db'}
+
+
+class LoadRun:
+    """One load-test run: seeded hackathon, virtual users and latency samples."""
+
+    def __init__(self, application: Application, concurrency: int, think_time: float = 0.0):
+        self.application = application
+        self.updates = UpdateFactory(application.bot)
+        self.semaphore = asyncio.Semaphore(concurrency)
+        self.think_time = think_time
+        self.samples: Dict[str, List[float]] = defaultdict(list)
+        self.errors: Dict[str, int] = defaultdict(int)
+        self.team_codes: Dict[int, asyncio.Future] = {}
+        self.hackathon_id = None
+        self.stage_id = None
+        self._current_step: Dict[int, str] = {}
+
+    async def seed(self, run_label: str) -> None:
+        now = datetime.now()
+        hackathon = await db.create_hackathon(
+            name=f"Load test {run_label}", description="Synthetic load", status='ACTIVE',
+            start_date=now.date(), end_date=(now + timedelta(days=7)).date(),
+            registration_deadline=now + timedelta(days=7),
+        )
+        self.hackathon_id = str(hackathon['id'])
+        stage = await db.create_stage(
+            self.hackathon_id, 1, "Stage 1", task_description="Build something fast",
+            start_date=now, deadline=now + timedelta(days=7),
+        )
+        self.stage_id = str(stage['id'])
+        await db.activate_stage(self.stage_id)
+
+    async def send(self, step: str, update) -> None:
+        telegram_id = update.effective_user.id
+        async with self.semaphore:
+            self._current_step[telegram_id] = step
+            started = time.perf_counter()
+            await self.application.process_update(update)
+            self.samples[step].append(time.perf_counter() - started)
+        if self.think_time:
+            await asyncio.sleep(self.think_time)
+
+    async def on_error(self, update, context) -> None:
+        telegram_id = update.effective_user.id if update and update.effective_user else None
+        self.errors[self._current_step.get(telegram_id, 'unknown')] += 1
+
+    async def register(self, uid: int) -> None:
+        u = self.updates
+        await self.send('start', u.command(uid, 'start'))
+        await self.send('language', u.callback(uid, 'lang_en'))
+        await self.send('offer_agree', u.callback(uid, 'offer_agree'))
+        await self.send('reg_first_name', u.text(uid, 'load'))
+        await self.send('reg_last_name', u.text(uid, f'user {uid % 100000}'))
+        await self.send('reg_birth_date', u.text(uid, '15.04.2001'))
+        await self.send('reg_gender', u.callback(uid, 'gender_male'))
+        await self.send('reg_location', u.text(uid, 'Tashkent'))
+        await self.send('reg_phone', u.contact(uid, f'+99890{uid % 10000000:07d}'))
+        await self.send('reg_email', u.text(uid, f'load{uid}@example.com'))
+        await self.send('reg_pinfl', u.text(uid, f'{uid % 10 ** 14:014d}'))
+
+    async def create_team(self, uid: int) -> None:
+        u = self.updates
+        await self.send('create_team', u.callback(uid, f'create_team_{self.hackathon_id}'))
+        await self.send('team_name', u.text(uid, f'Team {uid % 100000}'))
+        await self.send('team_role', u.text(uid, 'Team lead'))
+        await self.send('team_field', u.text(uid, 'Fintech'))
+        await self.send('team_portfolio', u.text(uid, 'https://github.com/example/portfolio'))
+
+    async def join_team(self, uid: int, code: str) -> None:
+        u = self.updates
+        await self.send('join_team', u.callback(uid, f'join_team_{self.hackathon_id}'))
+        await self.send('team_code', u.text(uid, code))
+        await self.send('team_role_select', u.callback(uid, 'team_role_BACKEND'))
+
+    async def submit(self, uid: int, team_id: str) -> None:
+        u = self.updates
+        await self.send('stage_view', u.callback(uid, f'stage_{self.stage_id}'))
+        await self.send('submit', u.callback(uid, f'submit_{self.stage_id}_{team_id}'))
+        await self.send('submit_link', u.text(uid, 'https://github.com/example/solution'))
+        await self.send('submit', u.callback(uid, f'submit_{self.stage_id}_{team_id}'))
+        await self.send('submit_file', u.document(uid))
+
+    async def team_owner(self, uid: int, team_index: int) -> None:
+        code = self.team_codes.setdefault(team_index, asyncio.get_running_loop().create_future())
+        try:
+            await self.register(uid)
+            await self.create_team(uid)
+            team = await db.get_user_team_for_hackathon(uid, self.hackathon_id)
+        except Exception as e:
+            code.set_exception(e)
+            raise
+        code.set_result(team['code'] if team else None)
+        if team:
+            await self.submit(uid, str(team['id']))
+
+    async def team_member(self, uid: int, team_index: int) -> None:
+        await self.register(uid)
+        code = await self.team_codes.setdefault(team_index, asyncio.get_running_loop().create_future())
+        if code:
+            await self.join_team(uid, code)
+
+
+def check_database_url(db_url: Optional[str], allow_remote: bool) -> None:
+    if not db_url:
+        raise SystemExit("DATABASE_URL is not set; point it at a local Postgres with the bot schema")
+    host = urlparse(db_url).hostname or 'localhost'
+    if host not in LOCAL_HOSTS and not allow_remote:
+        raise SystemExit(f"Refusing to load-test non-local database host '{host}' (use --allow-remote)")
+
+
+def percentile(sorted_values: List[float], q: float) -> float:
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, max(0, round(q * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+def summarize(run: LoadRun, wall_time: float) -> dict:
+    steps = {}
+    for step, values in run.samples.items():
+        values = sorted(values)
+        steps[step] = {
+            'count': len(values),
+            'errors': run.errors.get(step, 0),
+            'mean': statistics.fmean(values),
+            'p50': percentile(values, 0.50),
+            'p95': percentile(values, 0.95),
+            'p99': percentile(values, 0.99),
+            'max': values[-1],
+        }
+    total = sum(s['count'] for s in steps.values())
+    all_values = sorted(v for values in run.samples.values() for v in values)
+    return {
+        'updates': total,
+        'errors': sum(run.errors.values()),
+        'wall_time': wall_time,
+        'throughput': total / wall_time if wall_time else 0.0,
+        'p50': percentile(all_values, 0.50),
+        'p95': percentile(all_values, 0.95),
+        'p99': percentile(all_values, 0.99),
+        'api_calls': dict(run.application.bot.calls),
+        'steps': steps,
+    }
+
+
+def print_report(summary: dict) -> None:
+    print(f"\n{summary['updates']} updates in {summary['wall_time']:.2f}s "
+          f"-> {summary['throughput']:.1f} updates/s, {summary['errors']} errors")
+    print(f"latency p50 {summary['p50'] * 1000:.1f}ms  p95 {summary['p95'] * 1000:.1f}ms  "
+          f"p99 {summary['p99'] * 1000:.1f}ms")
+    print(f"\n{'step':<26}{'count':>7}{'err':>5}{'mean':>9}{'p50':>9}{'p95':>9}{'p99':>9}{'max':>9}  (ms)")
+    for step, s in summary['steps'].items():
+        print(f"{step:<26}{s['count']:>7}{s['errors']:>5}{s['mean'] * 1000:>9.1f}{s['p50'] * 1000:>9.1f}"
+              f"{s['p95'] * 1000:>9.1f}{s['p99'] * 1000:>9.1f}{s['max'] * 1000:>9.1f}")
+    calls = ', '.join(f"{k}={v}" for k, v in sorted(summary['api_calls'].items()))
+    print(f"\nBot API calls: {calls}")
+
+
+async def build_application(api_latency: float = 0.0) -> Application:
+    """Application wired exactly like bot.main, but talking to FakeBot."""
+    application = Application.builder().bot(FakeBot(api_latency=api_latency)).updater(None).build()
+    bot.register_handlers(application)
+    await application.initialize()
+    return application
+
+
+async def run_load(args) -> dict:
+    application = await build_application(args.api_latency_ms / 1000)
+    await db.create_tables()
+    run = LoadRun(application, args.concurrency, args.think_ms / 1000)
+    application.add_error_handler(run.on_error)
+
+    run_label = datetime.now().strftime('%Y%m%d-%H%M%S')
+    await run.seed(run_label)
+    id_base = args.id_base or int(time.time()) * 1000
+
+    tasks = []
+    for i in range(args.users):
+        uid = id_base + i
+        team_index, position = divmod(i, args.team_size)
+        flow = run.team_owner if position == 0 else run.team_member
+        tasks.append(flow(uid, team_index))
+
+    started = time.perf_counter()
+    results = await asyncio.gather(*tasks, return_exceptions=True)
+    wall_time = time.perf_counter() - started
+
+    failed = [r for r in results if isinstance(r, Exception)]
+    if failed:
+        print(f"{len(failed)} virtual users aborted, first error: {failed[0]!r}")
+
+    await db.get_state_store().flush()
+    await application.shutdown()
+    await db.close_pool()
+    return summarize(run, wall_time)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Load-test the bot handlers against a local database")
+    parser.add_argument('--users', type=int, default=100, help="virtual users to run through the flows")
+    parser.add_argument('--concurrency', type=int, default=20, help="updates in flight at once")
+    parser.add_argument('--team-size', type=int, default=4, help="first user of each group creates the team")
+    parser.add_argument('--think-ms', type=float, default=0, help="pause between a user's updates")
+    parser.add_argument('--api-latency-ms', type=float, default=0, help="simulated Bot API round trip")
+    parser.add_argument('--id-base', type=int, default=0, help="first telegram id (default: derived from time)")
+    parser.add_argument('--json', help="also write the summary to this file")
+    parser.add_argument('--allow-remote', action='store_true', help="allow a non-local DATABASE_URL")
+    parser.add_argument('--memory', action='store_true', help="use the in-memory backend instead of Postgres")
+    args = parser.parse_args(argv)
+
+    if args.memory:
+        use_memory()
+    else:
+        check_database_url(db.DATABASE_URL, args.allow_remote)
+    summary = asyncio.run(run_load(args))
+    print_report(summary)
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(summary, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,275 @@
+"""
+Replay a recorded update trace through the bot handlers
+
+Feeds a trace written by utils/recorder.py back through the real handlers
+(FakeBot instead of Telegram) against a local database, or the in-memory
+backend with --memory, keeping the original inter-arrival times scaled by --speed.
+
+Usage:
+  DATABASE_URL=postgresql://localhost/hackathon_load \\
+  python -m benchmarks.replay traces/updates-20250301.jsonl.gz --speed 10 --provision
+
+  # only the deadline hour, as fast as the bot can take it
+  python -m benchmarks.replay trace.jsonl.gz --from 7200 --to 10800 --speed 0
+
+Updates of one user are processed in order; different users run concurrently.
+With --provision, users first seen mid-trace are created as fully registered,
+and hackathon/stage/team ids in callback data are mapped to entities seeded
+for the replay, so submissions and team views hit real rows instead of
+"not found" paths.
+"""
+
+import os
+import re
+import sys
+import gzip
+import json
+import time
+import asyncio
+import argparse
+from collections import defaultdict
+from datetime import datetime, timedelta
+from typing import Dict, Iterator, List, Optional, Tuple
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("BOT_TOKEN", "0:loadtest")
+
+from telegram import Update
+
+from repository import db, use_memory
+from benchmarks.loadgen import build_application, check_database_url, print_report, summarize, percentile
+from utils.instrumentation import callback_route
+
+_UUID_RE = re.compile(r'[0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12}')
+
+# Which entity each id in a callback refers to, by callback prefix
+_CALLBACK_IDS = (
+    ('view_submission_', ('stage', 'team')),
+    ('submit_', ('stage', 'team')),
+    ('stage_', ('stage',)),
+    ('create_team_', ('hackathon',)),
+    ('join_team_', ('hackathon',)),
+    ('register_', ('hackathon',)),
+    ('hackathon_', ('hackathon',)),
+    ('remove_members_', ('team',)),
+    ('remove_member_', ('team', None)),
+    ('confirm_leave_', ('team',)),
+    ('leave_team_', ('team',)),
+    ('team_', ('team',)),
+)
+
+
+def read_trace(path: str, start: float = 0.0, end: Optional[float] = None) -> Iterator[Tuple[float, dict]]:
+    """Yield (offset, update dict) for records within [start, end)."""
+    opener = gzip.open if path.endswith('.gz') else open
+    with opener(path, 'rt', encoding='utf-8') as f:
+        for line in f:
+            record = json.loads(line)
+            if 'update' not in record:
+                continue
+            t = record['t']
+            if t < start:
+                continue
+            if end is not None and t >= end:
+                break
+            yield t - start, record['update']
+
+
+def update_label(update: Update) -> str:
+    """Same labels as the handler metrics, so replay and production numbers line up."""
+    if update.callback_query:
+        return f"callback:{callback_route(update.callback_query.data)}"
+    message = update.effective_message
+    if message is None:
+        return 'other'
+    if message.text and message.text.startswith('/'):
+        return message.text.split()[0].split('@')[0]
+    if message.contact:
+        return 'contact'
+    if message.text:
+        return 'message'
+    return 'file'
+
+
+class ReplayWorld:
+    """Maps traced hackathon/stage/team ids and users onto rows created for the replay."""
+
+    def __init__(self):
+        self.hackathon_id: Optional[str] = None
+        self.stages: Dict[str, str] = {}
+        self.teams: Dict[str, str] = {}
+        self.members: set = set()
+        self.known_users: set = set()
+
+    async def seed(self) -> None:
+        now = datetime.now()
+        hackathon = await db.create_hackathon(
+            name=f"Replay {now:%Y%m%d-%H%M%S}", description="Trace replay", status='ACTIVE',
+            start_date=now.date(), end_date=(now + timedelta(days=7)).date(),
+            registration_deadline=now + timedelta(days=7),
+        )
+        self.hackathon_id = str(hackathon['id'])
+
+    async def ensure_user(self, update: Update) -> None:
+        user = update.effective_user
+        if user is None or user.id in self.known_users:
+            return
+        self.known_users.add(user.id)
+        message = update.effective_message
+        if message and message.text and message.text.startswith('/start'):
+            return
+        if await db.get_session_user(user.id):
+            return
+        await db.add_user(telegram_id=user.id, first_name=user.first_name or "User",
+                          username=user.username, last_name=user.last_name)
+        await db.set_user_consent(user.id, True)
+        await db.update_user(user.id, language='en', registration_complete=True)
+
+    async def _stage(self, traced_id: str) -> str:
+        if traced_id not in self.stages:
+            now = datetime.now()
+            stage = await db.create_stage(
+                self.hackathon_id, len(self.stages) + 1, f"Stage {len(self.stages) + 1}",
+                task_description="Replayed stage", start_date=now, deadline=now + timedelta(days=7),
+            )
+            self.stages[traced_id] = str(stage['id'])
+            await db.activate_stage(self.stages[traced_id])
+        return self.stages[traced_id]
+
+    async def _team(self, traced_id: str, telegram_id: int) -> str:
+        team_id = self.teams.get(traced_id)
+        if team_id is None:
+            team = await db.create_team(self.hackathon_id, f"Replay {traced_id[:8]}", owner_id=telegram_id)
+            team_id = self.teams[traced_id] = str(team['id'])
+            self.members.add((team_id, telegram_id))
+        elif (team_id, telegram_id) not in self.members:
+            await db.add_team_member(team_id, telegram_id)
+            self.members.add((team_id, telegram_id))
+        return team_id
+
+    async def remap(self, data: dict, telegram_id: int) -> None:
+        query = data.get('callback_query')
+        if not query or not query.get('data') or query['data'].startswith('admin_'):
+            return
+        callback = query['data']
+        kinds = next((k for prefix, k in _CALLBACK_IDS if callback.startswith(prefix)), None)
+        if not kinds:
+            return
+        ids = _UUID_RE.findall(callback)
+        for kind, traced_id in zip(kinds, ids):
+            if kind == 'hackathon':
+                mapped = self.hackathon_id
+            elif kind == 'stage':
+                mapped = await self._stage(traced_id)
+            elif kind == 'team':
+                mapped = await self._team(traced_id, telegram_id)
+            else:
+                continue
+            callback = callback.replace(traced_id, mapped, 1)
+        query['data'] = callback
+
+
+class ReplayRun:
+    def __init__(self, application, world: Optional[ReplayWorld], concurrency: int):
+        self.application = application
+        self.world = world
+        self.semaphore = asyncio.Semaphore(concurrency) if concurrency else None
+        self.samples: Dict[str, List[float]] = defaultdict(list)
+        self.errors: Dict[str, int] = defaultdict(int)
+        self.lag: List[float] = []
+        self._locks: Dict[int, asyncio.Lock] = defaultdict(asyncio.Lock)
+        self._labels: Dict[int, str] = {}
+
+    async def on_error(self, update, context) -> None:
+        if isinstance(update, Update):
+            self.errors[self._labels.get(update.update_id, 'other')] += 1
+
+    async def feed(self, data: dict, due: float) -> None:
+        user = (data.get('message') or data.get('callback_query') or data.get('edited_message') or {}).get('from', {})
+        async with self._locks[user.get('id', 0)]:
+            if self.world:
+                await self.world.remap(data, user.get('id', 0))
+            update = Update.de_json(data, self.application.bot)
+            if self.world:
+                await self.world.ensure_user(update)
+            label = self._labels[update.update_id] = update_label(update)
+            if self.semaphore:
+                await self.semaphore.acquire()
+            try:
+                self.lag.append(max(0.0, time.perf_counter() - due))
+                started = time.perf_counter()
+                await self.application.process_update(update)
+                self.samples[label].append(time.perf_counter() - started)
+            finally:
+                if self.semaphore:
+                    self.semaphore.release()
+
+
+async def replay(args) -> dict:
+    application = await build_application(args.api_latency_ms / 1000)
+    await db.create_tables()
+    world = None
+    if args.provision:
+        world = ReplayWorld()
+        await world.seed()
+    run = ReplayRun(application, world, args.concurrency)
+    application.add_error_handler(run.on_error)
+
+    tasks = []
+    started = time.perf_counter()
+    for i, (offset, data) in enumerate(read_trace(args.trace, args.start, args.end)):
+        if args.limit and i >= args.limit:
+            break
+        due = started + (offset / args.speed if args.speed else 0.0)
+        delay = due - time.perf_counter()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        tasks.append(asyncio.create_task(run.feed(data, due)))
+    results = await asyncio.gather(*tasks, return_exceptions=True)
+    wall_time = time.perf_counter() - started
+
+    failed = [r for r in results if isinstance(r, Exception)]
+    if failed:
+        print(f"{len(failed)} updates could not be replayed, first error: {failed[0]!r}")
+
+    await db.get_state_store().flush()
+    await application.shutdown()
+    await db.close_pool()
+
+    summary = summarize(run, wall_time)
+    lag = sorted(run.lag)
+    summary['schedule_lag'] = {'p50': percentile(lag, 0.50), 'p95': percentile(lag, 0.95),
+                               'max': lag[-1] if lag else 0.0}
+    return summary
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Replay a recorded update trace against a local database")
+    parser.add_argument('trace', help="trace written by RECORD_UPDATES (.jsonl or .jsonl.gz)")
+    parser.add_argument('--speed', type=float, default=1.0, help="time scale; 1 = real time, 0 = no waiting")
+    parser.add_argument('--from', dest='start', type=float, default=0.0, help="start at this trace offset (s)")
+    parser.add_argument('--to', dest='end', type=float, default=None, help="stop at this trace offset (s)")
+    parser.add_argument('--limit', type=int, default=0, help="replay at most this many updates")
+    parser.add_argument('--concurrency', type=int, default=0, help="cap on updates in flight (0 = none)")
+    parser.add_argument('--provision', action='store_true', help="create missing users/entities and remap ids")
+    parser.add_argument('--api-latency-ms', type=float, default=0, help="simulated Bot API round trip")
+    parser.add_argument('--json', help="also write the summary to this file")
+    parser.add_argument('--allow-remote', action='store_true', help="allow a non-local DATABASE_URL")
+    parser.add_argument('--memory', action='store_true', help="use the in-memory backend instead of Postgres")
+    args = parser.parse_args(argv)
+
+    if args.memory:
+        use_memory()
+    else:
+        check_database_url(db.DATABASE_URL, args.allow_remote)
+    summary = asyncio.run(replay(args))
+    print_report(summary)
+    lag = summary['schedule_lag']
+    print(f"Schedule lag p50 {lag['p50'] * 1000:.1f}ms  p95 {lag['p95'] * 1000:.1f}ms  max {lag['max'] * 1000:.1f}ms")
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(summary, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
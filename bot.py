@@ -13,6 +13,8 @@ Features:
 
 import os
 import sys
+import time
+import asyncio
 import logging
 from datetime import datetime
 
@@ -22,13 +24,24 @@ from telegram.ext import (
     CommandHandler,
     MessageHandler,
     CallbackQueryHandler,
+    TypeHandler,
     filters,
     ContextTypes
 )
 
 sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
 
-import database as db
+from repository import db
+from utils import metrics
+from utils.watchdog import start_watchdog
+from utils.recorder import create_recorder
+from utils.instrumentation import (
+    InstrumentedRequest,
+    callback_route,
+    timed_handler,
+    track_handler,
+    watch_application
+)
 from handlers.main_handlers import (
     start_command,
     help_command,
@@ -41,6 +54,8 @@ from handlers.main_handlers import (
 from handlers.admin_handlers import (
     admin_command,
     stats_command,
+    dbstats_command,
+    trend_command,
     broadcast_command,
     export_users_command,
     export_teams_command,
@@ -66,6 +81,12 @@ BOT_TOKEN = os.getenv("BOT_TOKEN") or os.getenv("TELEGRAM_BOT_TOKEN")
 if not BOT_TOKEN:
     raise ValueError("BOT_TOKEN environment variable is not set!")
 
+METRICS_PORT = os.getenv("METRICS_PORT")
+# Seconds between recounts of the /stats counters; 0 disables
+STATS_RECONCILE_INTERVAL = float(os.getenv("STATS_RECONCILE_INTERVAL", "3600"))
+# Seconds between /trend samples of the /stats counters; 0 disables
+STATS_SAMPLE_INTERVAL = int(os.getenv("STATS_SAMPLE_INTERVAL", "300"))
+
 LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO")
 logging.basicConfig(
     format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
@@ -91,23 +112,35 @@ async def error_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
 async def message_router(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Route messages - check admin handlers first."""
-    handled = await handle_admin_message(update, context)
-    if not handled:
-        await handle_message(update, context)
+    with track_handler('message'):
+        async with db.unit_of_work(label='message'):
+            handled = await handle_admin_message(update, context)
+            if not handled:
+                await handle_message(update, context)
 
 
 async def callback_router(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Route callbacks."""
     data = update.callback_query.data
-    if data.startswith('admin_'):
-        await handle_admin_callback(update, context)
-    else:
-        await handle_callback(update, context)
+    route = f"callback:{callback_route(data)}"
+    with track_handler(route):
+        async with db.unit_of_work(label=route):
+            if data.startswith('admin_'):
+                await handle_admin_callback(update, context)
+            else:
+                await handle_callback(update, context)
 
 
 async def file_router(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Route file uploads."""
-    await handle_file(update, context)
+    with track_handler('file'):
+        async with db.unit_of_work(label='file'):
+            await handle_file(update, context)
+
+
+def command(name: str, callback) -> CommandHandler:
+    """CommandHandler whose callback is timed as `/name`."""
+    return CommandHandler(name, timed_handler(f"/{name}", callback))
 
 
 async def setup_commands(application: Application):
@@ -119,16 +152,52 @@ async def setup_commands(application: Application):
     logger.info("Bot commands set up")
 
 
+async def reconcile_stats_periodically(interval: float):
+    """Correct any drift in the trigger-maintained /stats counters."""
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            await db.reconcile_stats()
+        except Exception as e:
+            logger.error(f"Stats reconciliation failed: {e}")
+
+
+async def sample_stats_periodically(interval: int):
+    """Record the /stats counters once per bucket for /trend; downsample old samples hourly."""
+    last_downsample = 0.0
+    while True:
+        try:
+            await db.record_stats_sample(interval)
+            if time.monotonic() - last_downsample >= 3600:
+                await db.downsample_stats_samples()
+                last_downsample = time.monotonic()
+        except Exception as e:
+            logger.error(f"Stats sampling failed: {e}")
+        # Wake just after the next bucket starts
+        await asyncio.sleep(interval - time.time() % interval + 1)
+
+
 async def on_startup(application: Application):
     """Run on startup."""
     logger.info("🚀 Bot starting...")
     try:
         await db.create_tables()
+        await db.start_cache_listener()
         logger.info("✅ Database ready")
     except Exception as e:
         logger.error(f"❌ Database init failed: {e}")
         raise
     await setup_commands(application)
+    application.bot_data['watchdog'] = start_watchdog()
+    if STATS_RECONCILE_INTERVAL > 0:
+        application.bot_data['stats_reconciler'] = asyncio.create_task(
+            reconcile_stats_periodically(STATS_RECONCILE_INTERVAL))
+    if STATS_SAMPLE_INTERVAL > 0:
+        application.bot_data['stats_sampler'] = asyncio.create_task(
+            sample_stats_periodically(STATS_SAMPLE_INTERVAL))
+    if METRICS_PORT:
+        watch_application(application)
+        application.bot_data['metrics_server'] = await metrics.start_http_server(int(METRICS_PORT))
     bot_info = await application.bot.get_me()
     logger.info(f"✅ Bot: @{bot_info.username}")
     logger.info(f"📅 Started: {datetime.now().isoformat()}")
@@ -137,54 +206,58 @@ async def on_startup(application: Application):
 async def on_shutdown(application: Application):
     """Run on shutdown."""
     logger.info("🛑 Bot shutting down...")
+    watchdog = application.bot_data.pop('watchdog', None)
+    if watchdog is not None:
+        await watchdog.stop()
+    for name in ('stats_reconciler', 'stats_sampler'):
+        task = application.bot_data.pop(name, None)
+        if task is not None:
+            task.cancel()
+    server = application.bot_data.pop('metrics_server', None)
+    if server is not None:
+        server.close()
+        await server.wait_closed()
+    recorder = application.bot_data.pop('recorder', None)
+    if recorder is not None:
+        recorder.stop()
     await db.close_pool()
     logger.info("✅ Database closed")
 
 
-def main():
-    """Main function."""
-    logger.info("=" * 50)
-    logger.info("CBU Coding Hackathon Bot")
-    logger.info("=" * 50)
-    
-    application = (
-        Application.builder()
-        .token(BOT_TOKEN)
-        .post_init(on_startup)
-        .post_shutdown(on_shutdown)
-        .build()
-    )
-    
+def register_handlers(application: Application):
+    """Attach every command, callback, message and error handler."""
     # User commands
-    application.add_handler(CommandHandler("start", start_command))
-    application.add_handler(CommandHandler("help", help_command))
-    application.add_handler(CommandHandler("settings", settings_command))
+    application.add_handler(command("start", start_command))
+    application.add_handler(command("help", help_command))
+    application.add_handler(command("settings", settings_command))
     
     # Admin commands
-    application.add_handler(CommandHandler("admin", admin_command))
-    application.add_handler(CommandHandler("stats", stats_command))
-    application.add_handler(CommandHandler("broadcast", broadcast_command))
-    application.add_handler(CommandHandler("export_users", export_users_command))
-    application.add_handler(CommandHandler("export_teams", export_teams_command))
-    application.add_handler(CommandHandler("export_members", export_members_command))
-    application.add_handler(CommandHandler("export_submissions", export_submissions_command))
-    application.add_handler(CommandHandler("addadmin", add_admin_command))
-    application.add_handler(CommandHandler("removeadmin", remove_admin_command))
-    application.add_handler(CommandHandler("create_hackathon", create_hackathon_command))
-    application.add_handler(CommandHandler("create_stage", create_stage_command))
-    application.add_handler(CommandHandler("activate_stage", activate_stage_command))
-    application.add_handler(CommandHandler("notify_hackathon", notify_hackathon_command))
-    application.add_handler(CommandHandler("download", download_submission_command))
-    application.add_handler(CommandHandler("submissions", list_submissions_command))
-    application.add_handler(CommandHandler("export_files", export_all_files_command))
-    application.add_handler(CommandHandler("export_team", export_team_files_command))
-    application.add_handler(CommandHandler("export_stage", export_stage_files_command))
+    application.add_handler(command("admin", admin_command))
+    application.add_handler(command("stats", stats_command))
+    application.add_handler(command("dbstats", dbstats_command))
+    application.add_handler(command("trend", trend_command))
+    application.add_handler(command("broadcast", broadcast_command))
+    application.add_handler(command("export_users", export_users_command))
+    application.add_handler(command("export_teams", export_teams_command))
+    application.add_handler(command("export_members", export_members_command))
+    application.add_handler(command("export_submissions", export_submissions_command))
+    application.add_handler(command("addadmin", add_admin_command))
+    application.add_handler(command("removeadmin", remove_admin_command))
+    application.add_handler(command("create_hackathon", create_hackathon_command))
+    application.add_handler(command("create_stage", create_stage_command))
+    application.add_handler(command("activate_stage", activate_stage_command))
+    application.add_handler(command("notify_hackathon", notify_hackathon_command))
+    application.add_handler(command("download", download_submission_command))
+    application.add_handler(command("submissions", list_submissions_command))
+    application.add_handler(command("export_files", export_all_files_command))
+    application.add_handler(command("export_team", export_team_files_command))
+    application.add_handler(command("export_stage", export_stage_files_command))
     
     # Callback handler
     application.add_handler(CallbackQueryHandler(callback_router))
     
     # Contact handler
-    application.add_handler(MessageHandler(filters.CONTACT, handle_contact))
+    application.add_handler(MessageHandler(filters.CONTACT, timed_handler('contact', handle_contact)))
     
     # File handlers
     application.add_handler(MessageHandler(
@@ -197,6 +270,31 @@ def main():
     
     # Error handler
     application.add_error_handler(error_handler)
+
+
+def main():
+    """Main function."""
+    logger.info("=" * 50)
+    logger.info("CBU Coding Hackathon Bot")
+    logger.info("=" * 50)
+    
+    application = (
+        Application.builder()
+        .token(BOT_TOKEN)
+        .request(InstrumentedRequest(connection_pool_size=256))
+        .get_updates_request(InstrumentedRequest())
+        .post_init(on_startup)
+        .post_shutdown(on_shutdown)
+        .build()
+    )
+    register_handlers(application)
+    
+    recorder = create_recorder()
+    if recorder:
+        # Group -1 sees every update before the routers in group 0
+        application.add_handler(TypeHandler(Update, recorder.record), group=-1)
+        application.bot_data['recorder'] = recorder
+        recorder.start()
     
     logger.info("Starting polling...")
     application.run_polling(allowed_updates=Update.ALL_TYPES, drop_pending_updates=True)
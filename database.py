@@ -5,26 +5,81 @@ Production-ready PostgreSQL with UUID primary keys
 """
 
 import os
+import sys
 import json
+import time
+import asyncio
+import logging
+import functools
+import contextlib
 import random
 import string
 import base64
-from datetime import datetime
-from typing import Optional, List, Dict, Any
+import struct
+from collections import OrderedDict
+from datetime import datetime, timedelta, timezone
+from typing import Optional, List, Dict, Any, AsyncIterator, Sequence
 from contextlib import asynccontextmanager
+from contextvars import ContextVar
 import asyncpg
 from asyncpg import Pool
 from uuid import UUID
 
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+from state_store import StateBackend, StateStore, DirectStateStore, CachedStateStore
+from models import Model, User, Hackathon, Stage, Team, Member, Submission
+import migrations
+from utils import metrics
+
+logger = logging.getLogger(__name__)
+
 DATABASE_URL = os.getenv("DATABASE_URL")
+# Optional read replica for reporting/admin queries (see read_only)
+DATABASE_READ_URL = os.getenv("DATABASE_READ_URL")
+READ_POOL_RETRY_SECONDS = float(os.getenv("READ_POOL_RETRY_SECONDS", "30"))
 ADMIN_IDS = os.getenv("ADMIN_IDS", "")
+# "memory": cached state with coalesced writes (single replica), "postgres": no local cache
+STATE_STORE = os.getenv("STATE_STORE", "memory").lower()
+STATE_CACHE_SIZE = int(os.getenv("STATE_CACHE_SIZE", "10000"))
+STATE_FLUSH_DELAY = float(os.getenv("STATE_FLUSH_DELAY", "0.5"))
+
+# Connection pool settings
+DB_POOL_MIN_SIZE = int(os.getenv("DB_POOL_MIN_SIZE", "2"))
+DB_POOL_MAX_SIZE = int(os.getenv("DB_POOL_MAX_SIZE", "10"))
+DB_COMMAND_TIMEOUT = float(os.getenv("DB_COMMAND_TIMEOUT", "60"))
+DB_MAX_INACTIVE_CONNECTION_LIFETIME = float(os.getenv("DB_MAX_INACTIVE_CONNECTION_LIFETIME", "300"))
+DB_STATEMENT_CACHE_SIZE = int(os.getenv("DB_STATEMENT_CACHE_SIZE", "0"))
+
+# Query profiling ("0" disables it); statements slower than the threshold are logged
+DB_PROFILE = os.getenv("DB_PROFILE", "1") != "0"
+DB_SLOW_QUERY_MS = float(os.getenv("DB_SLOW_QUERY_MS", "500"))
 _pool: Optional[Pool] = None
+_read_pool: Optional[Pool] = None
+_read_pool_failed_at: float = 0.0
+# Held while a pool is created, so concurrent first callers share one pool
+_pool_lock = asyncio.Lock()
+_read_pool_lock = asyncio.Lock()
 
 # Valid values for fields
 HACKATON_STATUS = ['DRAFT', 'OPEN_TO_REGISTRATION', 'ACTIVE', 'FINISHED', 'ARCHIVED']
 USER_ROLES = ['ADMIN', 'PARTICIPANT']
 TEAM_ROLES = ['BACKEND', 'FRONTEND', 'DESIGNER', 'PROJECT_MANAGER']
 LANGUAGES = ['uz', 'en', 'ru']
+MAX_TEAM_SIZE = 5
+
+
+class TeamJoinResult:
+    """Outcome reasons returned by check_team_join / join_team_by_code."""
+    JOINED = "joined"
+    CAN_JOIN = "can_join"
+    INVALID_CODE = "invalid_code"
+    TEAM_FULL = "team_full"
+    ALREADY_REGISTERED = "already_registered"
+    USER_NOT_FOUND = "user_not_found"
 
 
 def get_env_admin_ids() -> set:
@@ -36,44 +91,695 @@ def get_env_admin_ids() -> set:
         return set()
 
 
+def _normalize_url(db_url: str) -> str:
+    if db_url.startswith("postgres://"):
+        db_url = db_url.replace("postgres://", "postgresql://", 1)
+    return db_url
+
+
+# ============================================================================
+# ROWS AND CODECS
+# ============================================================================
+
+def json_dumps(value) -> str:
+    if orjson is not None:
+        return orjson.dumps(value, default=json_serializer, option=orjson.OPT_NON_STR_KEYS).decode()
+    return json.dumps(value, default=json_serializer)
+
+
+json_loads = orjson.loads if orjson is not None else json.loads
+
+# Names the bot used before adopting the web team's schema, resolved by Row
+# when the record has no column of that name
+ROW_ALIASES = {
+    'team_id': 'group_id',
+    'stage_id': 'hackaton_task_id',
+    'hackathon_id': 'hackaton_id',
+    'start_date': 'starts_at',
+    'end_date': 'ends_at',
+    'location': 'living_place',
+}
+_MISSING = object()
+
+
+class Row(asyncpg.Record):
+    """Record class of every pool connection: read-only mapping plus ROW_ALIASES."""
+
+    __slots__ = ()
+
+    def __getitem__(self, key):
+        try:
+            return super().__getitem__(key)
+        except KeyError:
+            if key not in ROW_ALIASES:
+                raise
+            return super().__getitem__(ROW_ALIASES[key])
+
+    def get(self, key, default=None):
+        value = super().get(key, _MISSING)
+        if value is _MISSING:
+            alias = ROW_ALIASES.get(key)
+            value = super().get(alias, default) if alias else default
+        return value
+
+    def __contains__(self, key) -> bool:
+        return super().__contains__(key) or super().__contains__(ROW_ALIASES.get(key))
+
+
+async def _init_connection(conn) -> None:
+    """UUIDs decode to str and json/jsonb to Python objects, so rows need no post-processing."""
+    await conn.set_type_codec('uuid', schema='pg_catalog', encoder=str, decoder=str, format='text')
+    for name in ('json', 'jsonb'):
+        await conn.set_type_codec(name, schema='pg_catalog', encoder=json_dumps, decoder=json_loads,
+                                  format='text')
+
+
+async def _create_pool(db_url: str) -> Pool:
+    return await asyncpg.create_pool(
+        _normalize_url(db_url),
+        min_size=DB_POOL_MIN_SIZE,
+        max_size=DB_POOL_MAX_SIZE,
+        command_timeout=DB_COMMAND_TIMEOUT,
+        max_inactive_connection_lifetime=DB_MAX_INACTIVE_CONNECTION_LIFETIME,
+        statement_cache_size=DB_STATEMENT_CACHE_SIZE,
+        init=_init_connection,
+        record_class=Row
+    )
+
+
 async def get_pool() -> Pool:
     global _pool
     if _pool is None:
-        if not DATABASE_URL:
-            raise ValueError("DATABASE_URL environment variable is not set")
-        db_url = DATABASE_URL
-        if db_url.startswith("postgres://"):
-            db_url = db_url.replace("postgres://", "postgresql://", 1)
-        _pool = await asyncpg.create_pool(db_url, min_size=2, max_size=10, command_timeout=60, statement_cache_size=0)
+        async with _pool_lock:
+            if _pool is None:
+                if not DATABASE_URL:
+                    raise ValueError("DATABASE_URL environment variable is not set")
+                _pool = await _create_pool(DATABASE_URL)
     return _pool
 
 
+async def get_read_pool() -> Pool:
+    """Replica pool; falls back to the primary when no replica is configured or reachable."""
+    global _read_pool, _read_pool_failed_at
+    if not DATABASE_READ_URL:
+        return await get_pool()
+    if _read_pool is None:
+        if time.monotonic() - _read_pool_failed_at < READ_POOL_RETRY_SECONDS:
+            return await get_pool()
+        async with _read_pool_lock:
+            # Another caller may have created it, or just failed to, while we waited
+            if _read_pool is None:
+                if time.monotonic() - _read_pool_failed_at < READ_POOL_RETRY_SECONDS:
+                    return await get_pool()
+                try:
+                    _read_pool = await _create_pool(DATABASE_READ_URL)
+                except (OSError, asyncpg.PostgresError) as e:
+                    logger.warning(f"Read replica unavailable, using primary: {e}")
+                    _read_pool_failed_at = time.monotonic()
+                    return await get_pool()
+    return _read_pool
+
+
+# ============================================================================
+# READ ROUTING
+# ============================================================================
+
+_use_replica: ContextVar[bool] = ContextVar('db_use_replica', default=False)
+_force_primary: ContextVar[bool] = ContextVar('db_force_primary', default=False)
+
+
+def read_only(func):
+    """
+    Mark a query function as safe to serve from the read replica.
+
+    Only for reports and bulk reads that tolerate replication lag; anything
+    a user reads back right after writing it stays on the primary.
+    """
+    @functools.wraps(func)
+    async def wrapper(*args, **kwargs):
+        token = _use_replica.set(True)
+        try:
+            return await func(*args, **kwargs)
+        finally:
+            _use_replica.reset(token)
+    return wrapper
+
+
+@contextlib.contextmanager
+def primary_reads():
+    """Read-your-writes override: read_only calls inside this block use the primary."""
+    token = _force_primary.set(True)
+    try:
+        yield
+    finally:
+        _force_primary.reset(token)
+
+
+# ============================================================================
+# POOL INSTRUMENTATION
+# ============================================================================
+
+POOL_ACQUIRE_WAIT = metrics.histogram(
+    'db_pool_acquire_wait_seconds', 'Time spent waiting for a pooled connection', ('caller',))
+POOL_HOLD_TIME = metrics.histogram(
+    'db_pool_hold_seconds', 'Time a pooled connection was held before release', ('caller',))
+POOL_IN_USE = metrics.histogram(
+    'db_pool_in_use_connections', 'Connections in use right after an acquire', ('caller',),
+    buckets=tuple(range(1, 101)))
+
+_CONTEXTLIB_FILE = contextlib.__file__
+
+
+# Plumbing between a query function and the pool
+_NOT_CALLERS = ('get_connection', 'get_read_connection', '_caller_name', '_stream_keyset')
+
+
+def _caller_name() -> str:
+    """Name of the database.py function (or other code) that asked for a connection."""
+    frame = sys._getframe(1)
+    while frame is not None:
+        code = frame.f_code
+        if code.co_filename != _CONTEXTLIB_FILE and code.co_name not in _NOT_CALLERS:
+            return code.co_qualname
+        frame = frame.f_back
+    return 'unknown'
+
+
+async def _acquire(pool: Pool, caller: str):
+    started = time.perf_counter()
+    conn = await pool.acquire()
+    acquired_at = time.perf_counter()
+    POOL_ACQUIRE_WAIT.labels(caller).observe(acquired_at - started)
+    POOL_IN_USE.labels(caller).observe(pool.get_size() - pool.get_idle_size())
+    return conn, acquired_at
+
+
+async def _release(pool: Pool, conn, caller: str, acquired_at: float) -> None:
+    POOL_HOLD_TIME.labels(caller).observe(time.perf_counter() - acquired_at)
+    await pool.release(conn)
+
+
+# ============================================================================
+# QUERY PROFILING
+# ============================================================================
+
+QUERY_LATENCY = metrics.histogram(
+    'db_query_seconds', 'Query latency per database.py function', ('function',))
+STATEMENT_LATENCY = metrics.histogram(
+    'db_statement_seconds', 'Query latency per SQL statement', ('statement',))
+QUERY_ROWS = metrics.counter(
+    'db_query_rows_total', 'Rows returned per database.py function', ('function',))
+QUERY_BYTES = metrics.counter(
+    'db_query_decoded_bytes_total', 'Approximate bytes decoded per database.py function', ('function',))
+STATEMENT_ROWS = metrics.counter(
+    'db_statement_rows_total', 'Rows returned per SQL statement', ('statement',))
+STATEMENT_BYTES = metrics.counter(
+    'db_statement_decoded_bytes_total', 'Approximate bytes decoded per SQL statement', ('statement',))
+
+_statement_keys: Dict[str, str] = {}
+
+
+def _statement_key(query: str) -> str:
+    key = _statement_keys.get(query)
+    if key is None:
+        key = ' '.join(query.split())[:160]
+        if len(_statement_keys) < 2000:
+            _statement_keys[query] = key
+    return key
+
+
+def _estimate_bytes(records) -> int:
+    total = 0
+    for record in records:
+        for value in record.values():
+            if isinstance(value, (str, bytes)):
+                total += len(value)
+            else:
+                total += 8
+    return total
+
+
+def _redact_params(args) -> str:
+    return ', '.join(f"${i}=<{type(a).__name__}>" for i, a in enumerate(args, 1))
+
+
+def _record_query(caller: str, query: str, args, result, elapsed: float) -> None:
+    # fetch -> list, fetchrow -> Record/None, fetchval -> scalar, execute -> status string
+    if isinstance(result, list):
+        rows, size = len(result), _estimate_bytes(result)
+    elif isinstance(result, asyncpg.Record):
+        rows, size = 1, _estimate_bytes((result,))
+    elif result is None or isinstance(result, str):
+        rows, size = 0, 0
+    else:
+        rows, size = 1, 8
+
+    key = _statement_key(query)
+    QUERY_LATENCY.labels(caller).observe(elapsed)
+    STATEMENT_LATENCY.labels(key).observe(elapsed)
+    QUERY_ROWS.labels(caller).inc(rows)
+    QUERY_BYTES.labels(caller).inc(size)
+    STATEMENT_ROWS.labels(key).inc(rows)
+    STATEMENT_BYTES.labels(key).inc(size)
+
+    if elapsed * 1000 >= DB_SLOW_QUERY_MS:
+        logger.warning(f"Slow query {elapsed * 1000:.0f}ms in {caller}: {key} [{_redact_params(args)}]")
+
+
+class _ProfiledConnection:
+    """Connection proxy that times every query and attributes it to the calling function."""
+    __slots__ = ('_conn', '_caller')
+
+    def __init__(self, conn, caller: str):
+        self._conn = conn
+        self._caller = caller
+
+    def __getattr__(self, name):
+        return getattr(self._conn, name)
+
+    async def _run(self, method: str, query: str, args, kwargs):
+        started = time.perf_counter()
+        result = await getattr(self._conn, method)(query, *args, **kwargs)
+        _record_query(self._caller, query, args, result, time.perf_counter() - started)
+        return result
+
+    async def fetch(self, query: str, *args, **kwargs):
+        return await self._run('fetch', query, args, kwargs)
+
+    async def fetchrow(self, query: str, *args, **kwargs):
+        return await self._run('fetchrow', query, args, kwargs)
+
+    async def fetchval(self, query: str, *args, **kwargs):
+        return await self._run('fetchval', query, args, kwargs)
+
+    async def execute(self, query: str, *args, **kwargs):
+        return await self._run('execute', query, args, kwargs)
+
+    async def executemany(self, query: str, args, **kwargs):
+        started = time.perf_counter()
+        result = await self._conn.executemany(query, args, **kwargs)
+        _record_query(self._caller, query, (), None, time.perf_counter() - started)
+        return result
+
+
+def _profiled(conn, caller: str):
+    return _ProfiledConnection(conn, caller) if DB_PROFILE else conn
+
+
+def get_query_stats() -> Dict[str, Any]:
+    """Call count, latency percentiles, rows and decoded bytes per function and per statement."""
+    def collect(latency, rows, size):
+        result = {}
+        for (label,), hist in latency.items():
+            entry = hist.summary()
+            entry['calls'] = entry.pop('count')
+            entry['total'] = entry.pop('sum')
+            entry['rows'] = int(rows.labels(label).value)
+            entry['bytes'] = int(size.labels(label).value)
+            result[label] = entry
+        return result
+
+    return {
+        'functions': collect(QUERY_LATENCY, QUERY_ROWS, QUERY_BYTES),
+        'statements': collect(STATEMENT_LATENCY, STATEMENT_ROWS, STATEMENT_BYTES),
+    }
+
+
+def reset_query_stats() -> None:
+    for metric in (QUERY_LATENCY, STATEMENT_LATENCY, QUERY_ROWS, QUERY_BYTES, STATEMENT_ROWS, STATEMENT_BYTES):
+        metric.reset()
+
+
+def get_pool_stats() -> Dict[str, Any]:
+    """Pool size plus acquire-wait / hold-time / in-use percentiles per caller."""
+    stats = {
+        'min_size': DB_POOL_MIN_SIZE,
+        'max_size': DB_POOL_MAX_SIZE,
+        'size': _pool.get_size() if _pool else 0,
+        'idle': _pool.get_idle_size() if _pool else 0,
+        'callers': {},
+    }
+    stats['in_use'] = stats['size'] - stats['idle']
+    if _read_pool:
+        stats['replica'] = {'size': _read_pool.get_size(), 'idle': _read_pool.get_idle_size()}
+    for (caller,), wait in POOL_ACQUIRE_WAIT.items():
+        hold = POOL_HOLD_TIME.labels(caller)
+        in_use = POOL_IN_USE.labels(caller)
+        stats['callers'][caller] = {
+            'acquires': wait.count,
+            'wait_p50': wait.percentile(0.50),
+            'wait_p95': wait.percentile(0.95),
+            'wait_p99': wait.percentile(0.99),
+            'hold_p50': hold.percentile(0.50),
+            'hold_p95': hold.percentile(0.95),
+            'hold_p99': hold.percentile(0.99),
+            'in_use_p95': in_use.percentile(0.95),
+        }
+    return stats
+
+
+POOL_CONNECTIONS = metrics.gauge(
+    'db_pool_connections', 'Pool connections by state', ('pool', 'state'))
+STATE_STORE_PENDING = metrics.gauge(
+    'state_store_pending_writes', 'Registration states waiting to be flushed')
+
+
+def _collect_pool_metrics() -> None:
+    stats = get_pool_stats()
+    POOL_CONNECTIONS.labels('primary', 'in_use').set(stats['in_use'])
+    POOL_CONNECTIONS.labels('primary', 'idle').set(stats['idle'])
+    POOL_CONNECTIONS.labels('primary', 'max').set(stats['max_size'])
+    if 'replica' in stats:
+        replica = stats['replica']
+        POOL_CONNECTIONS.labels('replica', 'in_use').set(replica['size'] - replica['idle'])
+        POOL_CONNECTIONS.labels('replica', 'idle').set(replica['idle'])
+    STATE_STORE_PENDING.set(get_state_store().stats().get('pending', 0))
+
+
+metrics.add_collector(_collect_pool_metrics)
+
+
+class _UnitOfWork:
+    """Connection shared by every DB call made while handling one update."""
+
+    def __init__(self, transaction: bool, label: str = None):
+        self.transaction = transaction
+        self.label = label
+        self.pool_label = None
+        self.conn = None
+        self.closed = False
+        self.acquired_at = 0.0
+        self._tx = None
+
+    async def connection(self, caller: str):
+        # Acquired lazily so updates that never touch the DB don't take a connection
+        if self.conn is None:
+            # Pool stats per handler route, or per the DB function that needed the connection first
+            if self.pool_label is None:
+                self.pool_label = f"{self.label or caller} (unit of work)"
+            pool = await get_pool()
+            self.conn, self.acquired_at = await _acquire(pool, self.pool_label)
+            if self.transaction:
+                self._tx = self.conn.transaction()
+                await self._tx.start()
+        return self.conn
+
+
+_current_uow: ContextVar[Optional[_UnitOfWork]] = ContextVar('db_unit_of_work', default=None)
+
+
+@asynccontextmanager
+async def unit_of_work(transaction: bool = False, label: str = None):
+    """
+    Reuse a single pooled connection for all DB calls inside the block.
+
+    With transaction=True the calls also share one transaction, committed on
+    normal exit and rolled back on error. Nested blocks join the outer one.
+    `label` names the connection in the pool stats (e.g. the handler route).
+    Wrap Telegram API loops in outside_unit_of_work() so they don't hold it.
+    """
+    uow = _current_uow.get()
+    if uow is not None and not uow.closed:
+        yield uow
+        return
+
+    uow = _UnitOfWork(transaction, label)
+    token = _current_uow.set(uow)
+    try:
+        yield uow
+        if uow._tx is not None:
+            await uow._tx.commit()
+    except BaseException:
+        if uow._tx is not None:
+            await uow._tx.rollback()
+        raise
+    finally:
+        _current_uow.reset(token)
+        uow.closed = True
+        if uow.conn is not None:
+            await _release(await get_pool(), uow.conn, uow.pool_label, uow.acquired_at)
+
+
+@asynccontextmanager
+async def outside_unit_of_work():
+    """
+    Give the current unit of work's connection back to the pool for the block,
+    e.g. around a broadcast's send loop. DB calls inside take short-lived
+    connections of their own; after the block the unit of work re-acquires
+    lazily if it needs one. A transactional unit of work keeps its connection.
+    """
+    uow = _current_uow.get()
+    if uow is None or uow.closed or uow.transaction:
+        yield
+        return
+    if uow.conn is not None:
+        conn, uow.conn = uow.conn, None
+        await _release(await get_pool(), conn, uow.pool_label, uow.acquired_at)
+    token = _current_uow.set(None)
+    try:
+        yield
+    finally:
+        _current_uow.reset(token)
+
+
+def _routed_to_replica() -> bool:
+    return bool(DATABASE_READ_URL) and _use_replica.get() and not _force_primary.get()
+
+
 @asynccontextmanager
 async def get_connection():
+    caller = _caller_name()
+    if _routed_to_replica():
+        async with _replica_connection(caller) as conn:
+            yield _profiled(conn, caller)
+        return
+    uow = _current_uow.get()
+    if uow is not None and not uow.closed:
+        yield _profiled(await uow.connection(caller), caller)
+        return
     pool = await get_pool()
-    async with pool.acquire() as conn:
+    conn, acquired_at = await _acquire(pool, caller)
+    try:
+        yield _profiled(conn, caller)
+    finally:
+        await _release(pool, conn, caller, acquired_at)
+
+
+@asynccontextmanager
+async def _replica_connection(caller: str):
+    pool = await get_read_pool()
+    label = f"{caller} (replica)" if pool is _read_pool else caller
+    try:
+        conn, acquired_at = await _acquire(pool, label)
+    except (OSError, asyncpg.PostgresConnectionError, asyncpg.CannotConnectNowError) as e:
+        logger.warning(f"Replica acquire failed for {caller}, using primary: {e}")
+        pool, label = await get_pool(), caller
+        conn, acquired_at = await _acquire(pool, label)
+    try:
         yield conn
+    finally:
+        await _release(pool, conn, label, acquired_at)
+
+
+@asynccontextmanager
+async def get_read_connection():
+    """Connection for ad-hoc reporting queries, served by the replica when configured."""
+    token = _use_replica.set(True)
+    try:
+        async with get_connection() as conn:
+            yield conn
+    finally:
+        _use_replica.reset(token)
 
 
 async def close_pool():
-    global _pool
+    global _pool, _read_pool
+    await stop_cache_listener()
+    await _state_store.flush()
+    if _read_pool:
+        await _read_pool.close()
+        _read_pool = None
     if _pool:
         await _pool.close()
         _pool = None
 
 
+# ============================================================================
+# READ CACHES
+# ============================================================================
+
+# Seconds a cached hackathon/stage is trusted; bounds how long an edit made
+# outside the bot (web admin, manual SQL) stays unseen. 0 disables the cache
+CATALOG_CACHE_TTL = float(os.getenv("CATALOG_CACHE_TTL", "60"))
+# Team join codes: active codes for TEAM_CODE_CACHE_TTL seconds, unknown ones
+# (mistyped codes) for TEAM_CODE_MISS_TTL so a team created elsewhere shows up quickly
+TEAM_CODE_CACHE_TTL = float(os.getenv("TEAM_CODE_CACHE_TTL", "300"))
+TEAM_CODE_MISS_TTL = float(os.getenv("TEAM_CODE_MISS_TTL", "10"))
+# Each user's teams (hackathon, role, lead flag), loaded on first use
+MEMBERSHIP_CACHE_TTL = float(os.getenv("MEMBERSHIP_CACHE_TTL", "60"))
+MEMBERSHIP_CACHE_SIZE = int(os.getenv("MEMBERSHIP_CACHE_SIZE", "10000"))
+# Invalidations reach every replica through NOTIFY on this channel. LISTEN
+# needs a session, so behind a transaction-mode pooler point CACHE_LISTEN_URL
+# straight at Postgres
+CACHE_CHANNEL = 'bot_cache_invalidate'
+CACHE_LISTEN_URL = os.getenv("CACHE_LISTEN_URL") or DATABASE_URL
+CACHE_LISTEN_RETRY_SECONDS = 30.0
+# Seconds between pings on the LISTEN connection; an idle socket won't notice a dead server
+CACHE_LISTEN_KEEPALIVE = 30.0
+
+CACHE_LOOKUPS = metrics.counter(
+    'db_cache_lookups_total', 'Read cache lookups by cache and result', ('cache', 'result'))
+
+_caches: Dict[str, "ReadCache"] = {}
+
+
+class ReadCache:
+    """
+    Bounded, process-local read-through cache with a TTL per entry.
+
+    Values are shared by every caller, so they must be immutable (models,
+    tuples). Read `generation` before querying and pass it to put(): a fill
+    that started before an invalidation is dropped instead of caching stale rows.
+    """
+
+    def __init__(self, name: str, ttl: float, max_entries: int = 10000, key_type=str):
+        self.name = name
+        self.ttl = ttl
+        self.max_entries = max_entries
+        # Converts the key of a NOTIFY payload back to the type callers use
+        self.key_type = key_type
+        self.generation = 0
+        self._entries: "OrderedDict[Any, tuple]" = OrderedDict()
+        _caches[name] = self
+
+    def get(self, key):
+        """Cached value (None included) or _MISSING."""
+        entry = self._entries.get(key)
+        if entry is not None:
+            if entry[0] > time.monotonic():
+                self._entries.move_to_end(key)
+                CACHE_LOOKUPS.labels(self.name, 'hit').inc()
+                return entry[1]
+            del self._entries[key]
+        CACHE_LOOKUPS.labels(self.name, 'miss').inc()
+        return _MISSING
+
+    def put(self, key, value, generation: int, ttl: float = None) -> None:
+        ttl = self.ttl if ttl is None else ttl
+        if ttl <= 0 or generation != self.generation:
+            return
+        self._entries[key] = (time.monotonic() + ttl, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def invalidate(self, key=_MISSING) -> None:
+        self.generation += 1
+        if key is _MISSING:
+            self._entries.clear()
+        else:
+            self._entries.pop(key, None)
+
+
+_catalog_cache = ReadCache('catalog', CATALOG_CACHE_TTL)
+_team_code_cache = ReadCache('team_code', TEAM_CODE_CACHE_TTL)
+_membership_cache = ReadCache('membership', MEMBERSHIP_CACHE_TTL, MEMBERSHIP_CACHE_SIZE, key_type=int)
+
+
+async def _announce_invalidation(conn, cache: ReadCache, key: str = None) -> None:
+    """
+    Drop the entry here now and on every replica (this one included, which
+    also covers a fill that raced the write) once the transaction commits.
+    """
+    if key is None:
+        cache.invalidate()
+    else:
+        cache.invalidate(key)
+    payload = cache.name if key is None else f"{cache.name}:{key}"
+    await conn.execute('SELECT pg_notify($1, $2)', CACHE_CHANNEL, payload)
+
+
+def _on_cache_notification(conn, pid, channel, payload: str) -> None:
+    name, _, key = payload.partition(':')
+    cache = _caches.get(name)
+    if cache is None:
+        return
+    if key:
+        cache.invalidate(cache.key_type(key))
+    else:
+        cache.invalidate()
+
+
+def _invalidate_caches() -> None:
+    for cache in _caches.values():
+        cache.invalidate()
+
+
+_listener_task: Optional[asyncio.Task] = None
+
+
+async def _listen_for_invalidations() -> None:
+    while True:
+        try:
+            conn = await asyncpg.connect(_normalize_url(CACHE_LISTEN_URL))
+        except (OSError, asyncpg.PostgresError) as e:
+            logger.warning(f"Cache listener can't connect, relying on TTLs: {e}")
+            await asyncio.sleep(CACHE_LISTEN_RETRY_SECONDS)
+            continue
+        try:
+            await conn.add_listener(CACHE_CHANNEL, _on_cache_notification)
+            # Anything may have changed while nobody was listening
+            _invalidate_caches()
+            while True:
+                await asyncio.sleep(CACHE_LISTEN_KEEPALIVE)
+                await conn.execute('SELECT 1', timeout=10)
+        except (OSError, asyncio.TimeoutError, asyncpg.PostgresError, asyncpg.InterfaceError) as e:
+            logger.warning(f"Cache listener lost its connection, reconnecting in "
+                           f"{CACHE_LISTEN_RETRY_SECONDS:.0f}s: {e!r}")
+            _invalidate_caches()
+        finally:
+            if not conn.is_closed():
+                conn.terminate()
+        # Also covers a server or pooler that accepts connections but refuses LISTEN
+        await asyncio.sleep(CACHE_LISTEN_RETRY_SECONDS)
+
+
+async def start_cache_listener() -> None:
+    """Apply cache invalidations sent by other replicas (reconnects on its own)."""
+    global _listener_task
+    if _listener_task is None and CACHE_LISTEN_URL:
+        _listener_task = asyncio.create_task(_listen_for_invalidations())
+
+
+async def stop_cache_listener() -> None:
+    global _listener_task
+    if _listener_task is not None:
+        _listener_task.cancel()
+        with contextlib.suppress(asyncio.CancelledError):
+            await _listener_task
+        _listener_task = None
+
+
 def _to_dict(record) -> Optional[Dict[str, Any]]:
+    """Mutable copy of a row, for results that get keys added; otherwise return the Row."""
     if record is None:
         return None
-    d = dict(record)
-    for key, value in d.items():
-        if isinstance(value, UUID):
-            d[key] = str(value)
-    return d
+    return dict(record)
+
 
+# Columns the bot reads back, instead of SELECT * over the web team's wider
+# tables (audit columns, fields only the site uses)
+_HACKATON_COLUMNS = ('id', 'name', 'description', 'prize_pool', 'starts_at', 'ends_at',
+                     'registration_deadline', 'status', 'is_active')
+_HACKATON_TASK_COLUMNS = ('id', 'hackaton_id', 'name', 'description', 'stage_number',
+                          'start_date', 'deadline', 'is_active')
+_GROUP_COLUMNS = ('id', 'name', 'code', 'field', 'portfolio_link', 'is_active', 'created_at')
+_SUBMISSION_COLUMNS = ('id', 'group_id', 'hackaton_task_id', 'content', 'submission_type',
+                       'file_id', 'file_name', 'file_type', 'submitted_at')
 
-def _to_dict_list(records) -> List[Dict[str, Any]]:
-    return [_to_dict(r) for r in records]
+
+def _columns(columns: tuple, alias: str = None) -> str:
+    return ', '.join(f'{alias}.{c}' if alias else c for c in columns)
 
 
 def json_serializer(obj):
@@ -81,6 +787,8 @@ def json_serializer(obj):
         return obj.isoformat()
     if isinstance(obj, UUID):
         return str(obj)
+    if isinstance(obj, (asyncpg.Record, Model)):
+        return dict(obj.items())
     raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
 
 
@@ -99,16 +807,10 @@ def decode_password(encoded_password: str) -> str:
 # ============================================================================
 
 async def create_tables():
+    """Bring the schema up to date (migrations.py); no DDL when it already is."""
     async with get_connection() as conn:
-        await conn.execute("""
-            CREATE TABLE IF NOT EXISTS "public"."registration_state" (
-                "telegram_id" BIGINT PRIMARY KEY,
-                "current_step" VARCHAR(50) NOT NULL,
-                "data" JSONB DEFAULT '{}',
-                "updated_at" TIMESTAMP WITH TIME ZONE DEFAULT NOW()
-            )
-        """)
-        print("✅ Database tables verified!")
+        version = await migrations.migrate(conn)
+        print(f"✅ Database schema at version {version}")
 
 
 # ============================================================================
@@ -142,29 +844,41 @@ async def add_user(telegram_id: int, first_name: str, username: str = None,
                 RETURNING *
             """, telegram_id, username, first_name, last_name, email, password)
         
-        return _to_dict(user)
+        return User.from_record(user)
 
 
 async def get_user(telegram_id: int) -> Optional[Dict[str, Any]]:
     async with get_connection() as conn:
-        user = await conn.fetchrow('SELECT * FROM "user" WHERE telegram_id = $1', telegram_id)
-        if user:
-            result = _to_dict(user)
-            result['location'] = result.get('living_place')
-            return result
-        return None
+        return User.from_record(await conn.fetchrow('SELECT * FROM "user" WHERE telegram_id = $1', telegram_id))
+
+
+async def get_session_user(telegram_id: int) -> Optional[Dict[str, Any]]:
+    """The few fields every update needs: id, language, consent and admin flag."""
+    async with get_connection() as conn:
+        return User.from_record(await conn.fetchrow("""
+            SELECT id, telegram_id, language, consent_given,
+                   (is_admin IS TRUE OR telegram_id = ANY($2::bigint[])) AS is_admin
+            FROM "user" WHERE telegram_id = $1
+        """, telegram_id, list(get_env_admin_ids())))
+
+
+async def get_user_profile(telegram_id: int) -> Optional[Dict[str, Any]]:
+    """Fields shown on the "my data" screen."""
+    async with get_connection() as conn:
+        return User.from_record(await conn.fetchrow("""
+            SELECT id, first_name, last_name, birth_date, gender, living_place AS location
+            FROM "user" WHERE telegram_id = $1
+        """, telegram_id))
 
 
 async def get_user_by_id(user_id: str) -> Optional[Dict[str, Any]]:
     async with get_connection() as conn:
-        user = await conn.fetchrow('SELECT * FROM "user" WHERE id = $1', user_id)
-        return _to_dict(user)
+        return User.from_record(await conn.fetchrow('SELECT * FROM "user" WHERE id = $1', user_id))
 
 
 async def get_user_by_email(email: str) -> Optional[Dict[str, Any]]:
     async with get_connection() as conn:
-        user = await conn.fetchrow('SELECT * FROM "user" WHERE email = $1', email)
-        return _to_dict(user)
+        return User.from_record(await conn.fetchrow('SELECT * FROM "user" WHERE email = $1', email))
 
 
 async def update_user(telegram_id: int, **kwargs) -> bool:
@@ -247,16 +961,79 @@ async def has_user_consented(telegram_id: int) -> bool:
         return result is True
 
 
+@read_only
 async def get_all_active_users() -> List[Dict[str, Any]]:
     async with get_connection() as conn:
         users = await conn.fetch('SELECT * FROM "user" WHERE is_active = TRUE ORDER BY created_at')
-        return _to_dict_list(users)
+        return [User.from_record(u) for u in users]
 
 
+@read_only
 async def get_all_consented_users() -> List[Dict[str, Any]]:
     async with get_connection() as conn:
         users = await conn.fetch('SELECT * FROM "user" WHERE is_active = TRUE AND consent_given = TRUE')
-        return _to_dict_list(users)
+        return [User.from_record(u) for u in users]
+
+
+STREAM_CHUNK_SIZE = int(os.getenv("STREAM_CHUNK_SIZE", "1000"))
+
+# Columns the stream_* functions may project; never the password
+USER_STREAM_FIELDS = frozenset({
+    'id', 'telegram_id', 'username', 'first_name', 'last_name', 'email', 'phone', 'birth_date',
+    'gender', 'living_place', 'pinfl', 'language', 'consent_given', 'consent_given_at',
+    'registration_complete', 'is_active', 'is_admin', 'created_at',
+})
+_NIL_UUID = UUID(int=0)
+
+
+def stream_projection(fields: Sequence[str]) -> tuple:
+    """`fields` plus the `id` key streams page on; ValueError outside USER_STREAM_FIELDS."""
+    unknown = set(fields) - USER_STREAM_FIELDS
+    if unknown:
+        raise ValueError(f"Cannot stream user fields: {', '.join(sorted(unknown))}")
+    return tuple(dict.fromkeys(('id', *fields)))
+
+
+async def _stream_keyset(query: str, args: tuple, chunk_size: int) -> AsyncIterator[Dict[str, Any]]:
+    """
+    Yield the rows of `query` a chunk at a time. Its last two parameters are
+    the user id to start after and the chunk size, rows ordered by that id.
+    Each chunk takes its own connection, outside any unit of work the caller
+    is in, and returns it before the rows are yielded, so a slow consumer (a
+    broadcast) holds neither a connection nor an open transaction.
+    """
+    after = _NIL_UUID
+    while True:
+        token = _current_uow.set(None)
+        try:
+            async with get_read_connection() as conn:
+                rows = await conn.fetch(query, *args, after, chunk_size)
+        finally:
+            _current_uow.reset(token)
+        for r in rows:
+            yield User.from_record(r)
+        if len(rows) < chunk_size:
+            return
+        after = rows[-1]['id']
+
+
+async def stream_active_users(fields: Sequence[str] = ('telegram_id',),
+                              chunk_size: int = STREAM_CHUNK_SIZE) -> AsyncIterator[Dict[str, Any]]:
+    columns = ', '.join(f'"{f}"' for f in stream_projection(fields))
+    query = f'SELECT {columns} FROM "user" WHERE is_active = TRUE AND id > $1 ORDER BY id LIMIT $2'
+    async for row in _stream_keyset(query, (), chunk_size):
+        yield row
+
+
+async def stream_consented_users(fields: Sequence[str] = ('telegram_id',),
+                                 chunk_size: int = STREAM_CHUNK_SIZE) -> AsyncIterator[Dict[str, Any]]:
+    columns = ', '.join(f'"{f}"' for f in stream_projection(fields))
+    query = f"""
+        SELECT {columns} FROM "user"
+        WHERE is_active = TRUE AND consent_given = TRUE AND id > $1 ORDER BY id LIMIT $2
+    """
+    async for row in _stream_keyset(query, (), chunk_size):
+        yield row
 
 
 async def is_admin(telegram_id: int) -> bool:
@@ -307,54 +1084,60 @@ async def create_hackathon(name: str, description: str = None, prize_pool: str =
                     VALUES (gen_random_uuid(), $1, 'en', $2, $3, $4)
                 """, hackaton_id, name_en or name, description_en, prize_pool_en)
             
-            result = _to_dict(h)
-            result['start_date'] = result.get('starts_at')
-            result['end_date'] = result.get('ends_at')
-            return result
+            await _announce_invalidation(conn, _catalog_cache)
+            return Hackathon.from_record(h)
+
+
+_HACKATON_LANGUAGES_SQL = 'SELECT lang, name, description, prize_pool FROM "hackaton_language" WHERE hackaton_id = $1'
+
+
+def _hackathon_languages(langs) -> Dict[str, Any]:
+    fields = {}
+    for lang in langs:
+        lang_code = str(lang['lang']).lower()
+        fields[f'name_{lang_code}'] = lang['name']
+        fields[f'description_{lang_code}'] = lang['description']
+        if lang.get('prize_pool'):
+            fields[f'prize_pool_{lang_code}'] = lang['prize_pool']
+    return fields
 
 
 async def get_hackathon(hackathon_id) -> Optional[Dict[str, Any]]:
+    key = ('hackathon', str(hackathon_id))
+    cached = _catalog_cache.get(key)
+    if cached is not _MISSING:
+        return cached
+    generation = _catalog_cache.generation
     async with get_connection() as conn:
-        h = await conn.fetchrow('SELECT * FROM "hackaton" WHERE id = $1::uuid', hackathon_id)
-        if not h:
-            return None
-        
-        result = _to_dict(h)
-        langs = await conn.fetch('SELECT * FROM "hackaton_language" WHERE hackaton_id = $1', hackathon_id)
-        for lang in langs:
-            lang_code = str(lang['lang']).lower()
-            result[f'name_{lang_code}'] = lang['name']
-            result[f'description_{lang_code}'] = lang['description']
-            if lang.get('prize_pool'):
-                result[f'prize_pool_{lang_code}'] = lang['prize_pool']
-        
-        result['start_date'] = result.get('starts_at')
-        result['end_date'] = result.get('ends_at')
-        return result
+        h = await conn.fetchrow(f'SELECT {_columns(_HACKATON_COLUMNS)} FROM "hackaton" WHERE id = $1::uuid', hackathon_id)
+        hackathon = None
+        if h:
+            langs = await conn.fetch(_HACKATON_LANGUAGES_SQL, hackathon_id)
+            hackathon = Hackathon.from_record(h, **_hackathon_languages(langs))
+    _catalog_cache.put(key, hackathon, generation)
+    return hackathon
 
 
 async def get_active_hackathons() -> List[Dict[str, Any]]:
+    cached = _catalog_cache.get('active_hackathons')
+    if cached is not _MISSING:
+        return list(cached)
+    generation = _catalog_cache.generation
     async with get_connection() as conn:
-        hs = await conn.fetch("""
-            SELECT * FROM "hackaton" 
+        hs = await conn.fetch(f"""
+            SELECT {_columns(_HACKATON_COLUMNS)} FROM "hackaton" 
             WHERE is_active = TRUE AND status IN ('OPEN_TO_REGISTRATION', 'ACTIVE')
             ORDER BY starts_at
         """)
         
         results = []
         for h in hs:
-            result = _to_dict(h)
-            langs = await conn.fetch('SELECT * FROM "hackaton_language" WHERE hackaton_id = $1', h['id'])
-            for lang in langs:
-                lang_code = str(lang['lang']).lower()
-                result[f'name_{lang_code}'] = lang['name']
-                result[f'description_{lang_code}'] = lang['description']
-                if lang.get('prize_pool'):
-                    result[f'prize_pool_{lang_code}'] = lang['prize_pool']
-            result['start_date'] = result.get('starts_at')
-            result['end_date'] = result.get('ends_at')
-            results.append(result)
-        return results
+            langs = await conn.fetch(_HACKATON_LANGUAGES_SQL, h['id'])
+            results.append(Hackathon.from_record(h, **_hackathon_languages(langs)))
+    _catalog_cache.put('active_hackathons', tuple(results), generation)
+    for hackathon in results:
+        _catalog_cache.put(('hackathon', hackathon['id']), hackathon, generation)
+    return results
 
 
 async def update_hackathon_status(hackathon_id, status: str) -> bool:
@@ -364,6 +1147,7 @@ async def update_hackathon_status(hackathon_id, status: str) -> bool:
         result = await conn.execute("""
             UPDATE "hackaton" SET status = $2, modified_at = NOW() WHERE id = $1
         """, hackathon_id, status)
+        await _announce_invalidation(conn, _catalog_cache)
         return result == "UPDATE 1"
 
 
@@ -380,6 +1164,19 @@ def get_localized_field(hackathon: dict, field: str, lang: str) -> str:
 # STAGE/TASK OPERATIONS
 # ============================================================================
 
+def _stage_languages(langs) -> Dict[str, Any]:
+    fields = {}
+    for lang in langs:
+        lang_code = str(lang['lang']).lower()
+        if lang_code == 'uz':
+            fields['task_description'] = lang.get('task_description')
+        else:
+            fields[f'name_{lang_code}'] = lang['name']
+            fields[f'description_{lang_code}'] = lang['description']
+            fields[f'task_description_{lang_code}'] = lang.get('task_description')
+    return fields
+
+
 async def create_stage(hackathon_id, stage_number: int, name: str, description: str = None,
                        task_description: str = None, start_date=None, deadline=None,
                        name_ru: str = None, name_en: str = None,
@@ -412,59 +1209,112 @@ async def create_stage(hackathon_id, stage_number: int, name: str, description:
                     VALUES (gen_random_uuid(), $1, 'en', $2, $3, $4)
                 """, task_id, name_en or name, description_en or '', task_description_en)
             
-            return _to_dict(s)
+            await _announce_invalidation(conn, _catalog_cache)
+            return Stage.from_record(s)
+
+
+_STAGE_LANGUAGES_SQL = """
+    SELECT lang, name, description, task_description FROM "hackaton_task_language" WHERE hackaton_task_id = $1
+"""
 
 
 async def get_stage(stage_id) -> Optional[Dict[str, Any]]:
+    key = ('stage', str(stage_id))
+    cached = _catalog_cache.get(key)
+    if cached is not _MISSING:
+        return cached
+    generation = _catalog_cache.generation
     async with get_connection() as conn:
-        s = await conn.fetchrow('SELECT * FROM "hackaton_task" WHERE id = $1', stage_id)
-        if not s:
-            return None
-        
-        result = _to_dict(s)
-        langs = await conn.fetch('SELECT * FROM "hackaton_task_language" WHERE hackaton_task_id = $1', stage_id)
-        for lang in langs:
-            lang_code = str(lang['lang']).lower()
-            if lang_code == 'uz':
-                result['task_description'] = lang.get('task_description')
-            else:
-                result[f'name_{lang_code}'] = lang['name']
-                result[f'description_{lang_code}'] = lang['description']
-                result[f'task_description_{lang_code}'] = lang.get('task_description')
-        return result
+        s = await conn.fetchrow(f'SELECT {_columns(_HACKATON_TASK_COLUMNS)} FROM "hackaton_task" WHERE id = $1', stage_id)
+        stage = None
+        if s:
+            langs = await conn.fetch(_STAGE_LANGUAGES_SQL, stage_id)
+            stage = Stage.from_record(s, **_stage_languages(langs))
+    _catalog_cache.put(key, stage, generation)
+    return stage
 
 
 async def get_stages(hackathon_id) -> List[Dict[str, Any]]:
     async with get_connection() as conn:
-        stages = await conn.fetch("""
-            SELECT * FROM "hackaton_task" WHERE hackaton_id = $1 ORDER BY stage_number
+        stages = await conn.fetch(f"""
+            SELECT {_columns(_HACKATON_TASK_COLUMNS)} FROM "hackaton_task" WHERE hackaton_id = $1 ORDER BY stage_number
         """, hackathon_id)
         
         results = []
         for s in stages:
-            result = _to_dict(s)
-            langs = await conn.fetch('SELECT * FROM "hackaton_task_language" WHERE hackaton_task_id = $1', s['id'])
-            for lang in langs:
-                lang_code = str(lang['lang']).lower()
-                if lang_code == 'uz':
-                    result['task_description'] = lang.get('task_description')
-                else:
-                    result[f'name_{lang_code}'] = lang['name']
-                    result[f'description_{lang_code}'] = lang['description']
-                    result[f'task_description_{lang_code}'] = lang.get('task_description')
-            results.append(result)
+            langs = await conn.fetch(_STAGE_LANGUAGES_SQL, s['id'])
+            results.append(Stage.from_record(s, **_stage_languages(langs)))
         return results
 
 
 async def get_active_stage(hackathon_id) -> Optional[Dict[str, Any]]:
+    key = ('active_stage', str(hackathon_id))
+    stage_id = _catalog_cache.get(key)
+    if stage_id is _MISSING:
+        generation = _catalog_cache.generation
+        async with get_connection() as conn:
+            stage_id = await conn.fetchval("""
+                SELECT id FROM "hackaton_task" WHERE hackaton_id = $1 AND is_active = TRUE 
+                ORDER BY stage_number LIMIT 1
+            """, hackathon_id)
+        _catalog_cache.put(key, stage_id, generation)
+    if stage_id is None:
+        return None
+    return await get_stage(stage_id)
+
+
+async def get_stage_view(stage_id, telegram_id: int) -> Optional[Dict[str, Any]]:
+    """Stage, hackathon names, the user's team and submission status in one query."""
     async with get_connection() as conn:
-        s = await conn.fetchrow("""
-            SELECT * FROM "hackaton_task" WHERE hackaton_id = $1 AND is_active = TRUE 
-            ORDER BY stage_number LIMIT 1
-        """, hackathon_id)
-        if not s:
+        row = await conn.fetchrow(f"""
+            SELECT {_columns(_HACKATON_TASK_COLUMNS, 'ht')}, ht.hackaton_id AS hackathon_id, h.name AS hackathon_name,
+                   (SELECT json_agg(json_build_object('lang', hl.lang, 'name', hl.name))
+                      FROM "hackaton_language" hl WHERE hl.hackaton_id = h.id) AS hackathon_langs,
+                   (SELECT json_agg(json_build_object('lang', tl.lang, 'name', tl.name,
+                                                      'description', tl.description,
+                                                      'task_description', tl.task_description))
+                      FROM "hackaton_task_language" tl WHERE tl.hackaton_task_id = ht.id) AS stage_langs,
+                   ut.id AS team_id,
+                   sub.id AS submission_id,
+                   COALESCE(ht.deadline < NOW(), FALSE) AS deadline_passed
+            FROM "hackaton_task" ht
+            JOIN "hackaton" h ON h.id = ht.hackaton_id
+            LEFT JOIN LATERAL (
+                SELECT g.id FROM "group" g
+                JOIN "group_user" gu ON g.id = gu.group_id
+                JOIN "user" u ON gu.user_id = u.id
+                JOIN "hackaton_group" hg ON g.id = hg.group_id
+                WHERE u.telegram_id = $2 AND hg.hackaton_id = ht.hackaton_id AND g.is_active = TRUE
+                LIMIT 1
+            ) ut ON TRUE
+            LEFT JOIN "submission" sub ON sub.group_id = ut.id AND sub.hackaton_task_id = ht.id
+            WHERE ht.id = $1
+            LIMIT 1
+        """, stage_id, telegram_id)
+        if not row:
             return None
-        return await get_stage(s['id'])
+
+        result = _to_dict(row)
+        stage_langs = result.pop('stage_langs')
+        hackathon_langs = result.pop('hackathon_langs')
+        result.update(_stage_languages(stage_langs or []))
+
+        hackathon = {'id': result['hackathon_id'], 'name': result['hackathon_name']}
+        for lang in hackathon_langs or []:
+            hackathon[f"name_{str(lang['lang']).lower()}"] = lang['name']
+        result['hackathon'] = hackathon
+        result['has_submission'] = result['submission_id'] is not None
+        return result
+
+
+def is_stage_deadline_passed(stage: Dict[str, Any]) -> bool:
+    """Deadline check for a stage (or stage view) row without another query."""
+    if stage.get('deadline_passed'):
+        return True
+    deadline = stage.get('deadline')
+    if not deadline:
+        return False
+    return datetime.now(deadline.tzinfo) > deadline
 
 
 async def activate_stage(stage_id) -> bool:
@@ -475,6 +1325,7 @@ async def activate_stage(stage_id) -> bool:
                 return False
             await conn.execute('UPDATE "hackaton_task" SET is_active = FALSE WHERE hackaton_id = $1', hid)
             result = await conn.execute('UPDATE "hackaton_task" SET is_active = TRUE WHERE id = $1', stage_id)
+            await _announce_invalidation(conn, _catalog_cache)
             return result == "UPDATE 1"
 
 
@@ -520,16 +1371,16 @@ async def create_team(hackathon_id, name: str, owner_id: int, owner_role: str =
                 VALUES (gen_random_uuid(), $1, $2, NOW())
             """, hackathon_id, group_id)
             
-            result = _to_dict(team)
-            result['hackathon_id'] = str(hackathon_id)
-            result['owner_telegram_id'] = owner_id
-            return result
+            # Drop a cached "no such code" for the new code
+            await _announce_invalidation(conn, _team_code_cache, code)
+            await _announce_invalidation(conn, _membership_cache, owner_id)
+            return Team.from_record(team, hackathon_id=str(hackathon_id), owner_telegram_id=owner_id)
 
 
 async def get_team(team_id) -> Optional[Dict[str, Any]]:
     async with get_connection() as conn:
-        t = await conn.fetchrow("""
-            SELECT g.*, h.name as hackathon_name, hg.hackaton_id as hackathon_id,
+        t = await conn.fetchrow(f"""
+            SELECT {_columns(_GROUP_COLUMNS, 'g')}, h.name as hackathon_name, hg.hackaton_id as hackathon_id,
                    u.telegram_id as owner_telegram_id, u.telegram_id as owner_id
             FROM "group" g
             LEFT JOIN "hackaton_group" hg ON g.id = hg.group_id
@@ -537,13 +1388,17 @@ async def get_team(team_id) -> Optional[Dict[str, Any]]:
             LEFT JOIN "user" u ON g.owner_id = u.id
             WHERE g.id = $1
         """, team_id)
-        return _to_dict(t)
+        return Team.from_record(t)
 
 
 async def get_team_by_code(code: str) -> Optional[Dict[str, Any]]:
+    cached = _team_code_cache.get(code)
+    if cached is not _MISSING:
+        return cached
+    generation = _team_code_cache.generation
     async with get_connection() as conn:
-        t = await conn.fetchrow("""
-            SELECT g.*, h.name as hackathon_name, hg.hackaton_id as hackathon_id,
+        t = await conn.fetchrow(f"""
+            SELECT {_columns(_GROUP_COLUMNS, 'g')}, h.name as hackathon_name, hg.hackaton_id as hackathon_id,
                    u.telegram_id as owner_telegram_id, u.telegram_id as owner_id
             FROM "group" g
             LEFT JOIN "hackaton_group" hg ON g.id = hg.group_id
@@ -551,13 +1406,20 @@ async def get_team_by_code(code: str) -> Optional[Dict[str, Any]]:
             LEFT JOIN "user" u ON g.owner_id = u.id
             WHERE g.code = $1 AND g.is_active = TRUE
         """, code)
-        return _to_dict(t)
+    team = Team.from_record(t)
+    _team_code_cache.put(code, team, generation, ttl=None if team else TEAM_CODE_MISS_TTL)
+    return team
 
 
-async def get_user_teams(telegram_id: int) -> List[Dict[str, Any]]:
+async def _user_memberships(telegram_id: int) -> tuple:
+    """(teams newest first, {hackathon_id: team}) for a user, from the membership cache."""
+    cached = _membership_cache.get(telegram_id)
+    if cached is not _MISSING:
+        return cached
+    generation = _membership_cache.generation
     async with get_connection() as conn:
-        ts = await conn.fetch("""
-            SELECT g.*, h.name as hackathon_name, gu.is_team_lead, 
+        ts = await conn.fetch(f"""
+            SELECT {_columns(_GROUP_COLUMNS, 'g')}, h.name as hackathon_name, gu.is_team_lead, 
                    gu.user_role_in_group as role, hg.hackaton_id as hackathon_id
             FROM "group" g
             JOIN "group_user" gu ON g.id = gu.group_id
@@ -567,20 +1429,24 @@ async def get_user_teams(telegram_id: int) -> List[Dict[str, Any]]:
             WHERE u.telegram_id = $1 AND g.is_active = TRUE
             ORDER BY g.created_at DESC
         """, telegram_id)
-        return _to_dict_list(ts)
+    teams = tuple(Team.from_record(t) for t in ts)
+    by_hackathon = {}
+    for team in teams:
+        if team['hackathon_id'] is not None:
+            by_hackathon.setdefault(team['hackathon_id'], team)
+    memberships = (teams, by_hackathon)
+    _membership_cache.put(telegram_id, memberships, generation)
+    return memberships
+
+
+async def get_user_teams(telegram_id: int) -> List[Dict[str, Any]]:
+    teams, _ = await _user_memberships(telegram_id)
+    return list(teams)
 
 
 async def get_user_team_for_hackathon(telegram_id: int, hackathon_id) -> Optional[Dict[str, Any]]:
-    async with get_connection() as conn:
-        t = await conn.fetchrow("""
-            SELECT g.*, gu.is_team_lead, gu.user_role_in_group as role
-            FROM "group" g
-            JOIN "group_user" gu ON g.id = gu.group_id
-            JOIN "user" u ON gu.user_id = u.id
-            JOIN "hackaton_group" hg ON g.id = hg.group_id
-            WHERE u.telegram_id = $1 AND hg.hackaton_id = $2 AND g.is_active = TRUE
-        """, telegram_id, hackathon_id)
-        return _to_dict(t)
+    _, by_hackathon = await _user_memberships(telegram_id)
+    return by_hackathon.get(str(hackathon_id))
 
 
 async def add_team_member(team_id, user_id: int, role: str = "BACKEND") -> bool:
@@ -594,18 +1460,104 @@ async def add_team_member(team_id, user_id: int, role: str = "BACKEND") -> bool:
                 return False
             
             count = await conn.fetchval('SELECT COUNT(*) FROM "group_user" WHERE group_id = $1', team_id)
-            if count >= 5:
+            if count >= MAX_TEAM_SIZE:
                 return False
             
             await conn.execute("""
                 INSERT INTO "group_user" (id, user_id, group_id, user_role_in_group, is_team_lead, joined_at)
                 VALUES (gen_random_uuid(), $1, $2, $3, FALSE, NOW())
             """, user['id'], team_id, role)
+            await _announce_invalidation(conn, _membership_cache, user_id)
             return True
         except:
             return False
 
 
+_TEAM_BY_CODE_SQL = """
+    SELECT g.id, g.name, hg.hackaton_id AS hackathon_id
+    FROM "group" g
+    JOIN "hackaton_group" hg ON g.id = hg.group_id
+    WHERE g.code = $1 AND g.is_active = TRUE
+    LIMIT 1
+"""
+
+# Validates membership and capacity and, when $5 is true, inserts the member
+# in the same statement. Run after locking the team row so the count is current.
+_TEAM_JOIN_SQL = """
+    WITH u AS (
+        SELECT id FROM "user" WHERE telegram_id = $2
+    ), member_count AS (
+        SELECT COUNT(*) AS n FROM "group_user" WHERE group_id = $1
+    ), existing AS (
+        SELECT 1 FROM "group_user" gu
+        JOIN "group" g ON g.id = gu.group_id
+        JOIN "hackaton_group" hg ON g.id = hg.group_id
+        WHERE gu.user_id = (SELECT id FROM u) AND hg.hackaton_id = $3 AND g.is_active = TRUE
+    ), ins AS (
+        INSERT INTO "group_user" (id, user_id, group_id, user_role_in_group, is_team_lead, joined_at)
+        SELECT gen_random_uuid(), u.id, $1, $4, FALSE, NOW() FROM u
+        WHERE $5 AND (SELECT n FROM member_count) < $6 AND NOT EXISTS (SELECT 1 FROM existing)
+        RETURNING id
+    )
+    SELECT EXISTS (SELECT 1 FROM u) AS user_found,
+           (SELECT n FROM member_count) AS member_count,
+           EXISTS (SELECT 1 FROM existing) AS already_registered,
+           EXISTS (SELECT 1 FROM ins) AS joined
+"""
+
+
+async def _team_join(conn, team, telegram_id: int, role: str, insert: bool) -> Dict[str, Any]:
+    result = {"success": False, "team_id": str(team['id']), "team_name": team['name'],
+              "hackathon_id": str(team['hackathon_id'])}
+    row = await conn.fetchrow(_TEAM_JOIN_SQL, team['id'], telegram_id, team['hackathon_id'],
+                              role, insert, MAX_TEAM_SIZE)
+    if not row['user_found']:
+        result['reason'] = TeamJoinResult.USER_NOT_FOUND
+    elif row['already_registered']:
+        result['reason'] = TeamJoinResult.ALREADY_REGISTERED
+    elif row['member_count'] >= MAX_TEAM_SIZE:
+        result['reason'] = TeamJoinResult.TEAM_FULL
+    elif insert and not row['joined']:
+        result['reason'] = TeamJoinResult.TEAM_FULL
+    else:
+        result['success'] = True
+        result['reason'] = TeamJoinResult.JOINED if insert else TeamJoinResult.CAN_JOIN
+    return result
+
+
+async def check_team_join(code: str, telegram_id: int) -> Dict[str, Any]:
+    """Validate a team code for a user without joining (reason is CAN_JOIN on success)."""
+    team = await get_team_by_code(code)
+    if not team or team.get('hackathon_id') is None:
+        return {"success": False, "reason": TeamJoinResult.INVALID_CODE}
+    async with get_connection() as conn:
+        return await _team_join(conn, team, telegram_id, TEAM_ROLES[0], insert=False)
+
+
+async def join_team_by_code(code: str, telegram_id: int, role: str = "BACKEND") -> Dict[str, Any]:
+    """
+    Atomically join the team with the given code.
+
+    The team row is locked for the duration of the transaction, so concurrent
+    joins on the same code are serialized and can't exceed MAX_TEAM_SIZE.
+    """
+    if role not in TEAM_ROLES:
+        role = "BACKEND"
+    # Known-bad codes are turned away from the cache; valid ones are re-read under the lock
+    if _team_code_cache.get(code) is None:
+        return {"success": False, "reason": TeamJoinResult.INVALID_CODE}
+
+    async with get_connection() as conn:
+        async with conn.transaction():
+            team = await conn.fetchrow(_TEAM_BY_CODE_SQL + " FOR UPDATE OF g", code)
+            if not team:
+                return {"success": False, "reason": TeamJoinResult.INVALID_CODE}
+            result = await _team_join(conn, team, telegram_id, role, insert=True)
+            if result['success']:
+                await _announce_invalidation(conn, _membership_cache, telegram_id)
+            return result
+
+
 async def update_member_role(team_id, user_id: int, role: str) -> bool:
     if role not in TEAM_ROLES:
         return False
@@ -616,26 +1568,22 @@ async def update_member_role(team_id, user_id: int, role: str) -> bool:
         result = await conn.execute("""
             UPDATE "group_user" SET user_role_in_group = $3 WHERE group_id = $1 AND user_id = $2
         """, team_id, user['id'], role)
+        await _announce_invalidation(conn, _membership_cache, user_id)
         return result == "UPDATE 1"
 
 
 async def get_team_members(team_id) -> List[Dict[str, Any]]:
     async with get_connection() as conn:
         ms = await conn.fetch("""
-            SELECT gu.*, u.first_name, u.last_name, u.username, u.telegram_id, u.email,
-                   gu.user_role_in_group as role
+            SELECT gu.id, gu.group_id, gu.is_team_lead, gu.joined_at,
+                   u.first_name, u.last_name, u.username, u.telegram_id, u.email,
+                   u.telegram_id as user_id, gu.user_role_in_group as role
             FROM "group_user" gu
             JOIN "user" u ON gu.user_id = u.id
             WHERE gu.group_id = $1
             ORDER BY gu.is_team_lead DESC, gu.joined_at
         """, team_id)
-        
-        results = []
-        for m in ms:
-            d = _to_dict(m)
-            d['user_id'] = d.get('telegram_id')
-            results.append(d)
-        return results
+        return [Member.from_record(m) for m in ms]
 
 
 async def remove_team_member(team_id, user_id: int) -> bool:
@@ -646,6 +1594,7 @@ async def remove_team_member(team_id, user_id: int) -> bool:
         result = await conn.execute("""
             DELETE FROM "group_user" WHERE group_id = $1 AND user_id = $2 AND is_team_lead = FALSE
         """, team_id, user['id'])
+        await _announce_invalidation(conn, _membership_cache, user_id)
         return result == "DELETE 1"
 
 
@@ -664,10 +1613,22 @@ async def leave_team(team_id, user_id: int) -> Dict[str, Any]:
                 return {"success": False, "reason": "not_member"}
             
             if member['is_team_lead']:
-                await conn.execute('UPDATE "group" SET is_active = FALSE, modified_at = NOW() WHERE id = $1', team_id)
+                code = await conn.fetchval("""
+                    UPDATE "group" SET is_active = FALSE, modified_at = NOW() WHERE id = $1 RETURNING code
+                """, team_id)
+                if code:
+                    await _announce_invalidation(conn, _team_code_cache, code)
+                # The team drops out of every member's list
+                members = await conn.fetch("""
+                    SELECT u.telegram_id FROM "group_user" gu JOIN "user" u ON u.id = gu.user_id
+                    WHERE gu.group_id = $1
+                """, team_id)
+                for m in members:
+                    await _announce_invalidation(conn, _membership_cache, m['telegram_id'])
                 return {"success": True, "team_deactivated": True}
             else:
                 await conn.execute('DELETE FROM "group_user" WHERE group_id = $1 AND user_id = $2', team_id, user['id'])
+                await _announce_invalidation(conn, _membership_cache, user_id)
                 return {"success": True, "team_deactivated": False}
 
 
@@ -701,41 +1662,29 @@ async def create_submission(team_id, stage_id, submitted_by: int, content: str =
                 RETURNING *
             """, team_id, stage_id, content, submission_type, file_id, file_name, file_type, user_uuid)
         
-        result = _to_dict(s)
-        result['team_id'] = result.get('group_id')
-        result['stage_id'] = result.get('hackaton_task_id')
-        return result
+        return Submission.from_record(s)
 
 
 async def get_submission(team_id, stage_id) -> Optional[Dict[str, Any]]:
     async with get_connection() as conn:
-        s = await conn.fetchrow("""
-            SELECT * FROM "submission" WHERE group_id = $1 AND hackaton_task_id = $2
+        s = await conn.fetchrow(f"""
+            SELECT {_columns(_SUBMISSION_COLUMNS)} FROM "submission" WHERE group_id = $1 AND hackaton_task_id = $2
         """, team_id, stage_id)
-        if s:
-            result = _to_dict(s)
-            result['team_id'] = result.get('group_id')
-            result['stage_id'] = result.get('hackaton_task_id')
-            return result
-        return None
+        return Submission.from_record(s)
 
 
+@read_only
 async def get_stage_submissions(stage_id) -> List[Dict[str, Any]]:
     async with get_connection() as conn:
-        ss = await conn.fetch("""
-            SELECT s.*, g.name as team_name, g.code as team_code
+        ss = await conn.fetch(f"""
+            SELECT {_columns(_SUBMISSION_COLUMNS, 's')}, g.name as team_name, g.code as team_code
             FROM "submission" s JOIN "group" g ON s.group_id = g.id
             WHERE s.hackaton_task_id = $1 ORDER BY s.submitted_at DESC
         """, stage_id)
-        results = []
-        for s in ss:
-            d = _to_dict(s)
-            d['team_id'] = d.get('group_id')
-            d['stage_id'] = d.get('hackaton_task_id')
-            results.append(d)
-        return results
+        return [Submission.from_record(s) for s in ss]
 
 
+@read_only
 async def get_all_submissions() -> List[Dict[str, Any]]:
     async with get_connection() as conn:
         ss = await conn.fetch("""
@@ -747,55 +1696,159 @@ async def get_all_submissions() -> List[Dict[str, Any]]:
             JOIN "hackaton" h ON ht.hackaton_id = h.id
             ORDER BY s.submitted_at DESC
         """)
-        results = []
-        for s in ss:
-            d = _to_dict(s)
-            d['team_id'] = d.get('group_id')
-            d['stage_id'] = d.get('hackaton_task_id')
-            results.append(d)
-        return results
+        return [Submission.from_record(s) for s in ss]
+
+
+SUBMISSION_PAGE_SIZE = 20
+
+# Keyset cursor: timezone flag, microseconds since the epoch, submission uuid.
+# Versioned by a leading digit so the format can change without breaking old
+# buttons silently; 35 characters, small enough for callback data
+_SUBMISSION_CURSOR = struct.Struct('>?q16s')
+_SUBMISSION_CURSOR_VERSION = '1'
+_EPOCH = datetime(1970, 1, 1)
+_EPOCH_UTC = _EPOCH.replace(tzinfo=timezone.utc)
+
+
+def encode_submission_cursor(submitted_at: datetime, submission_id) -> str:
+    aware = submitted_at.tzinfo is not None
+    micros = (submitted_at - (_EPOCH_UTC if aware else _EPOCH)) // timedelta(microseconds=1)
+    raw = _SUBMISSION_CURSOR.pack(aware, micros, UUID(str(submission_id)).bytes)
+    return _SUBMISSION_CURSOR_VERSION + base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+
+def decode_submission_cursor(cursor: str) -> tuple:
+    """(submitted_at, UUID) from encode_submission_cursor; ValueError if malformed."""
+    if not cursor.startswith(_SUBMISSION_CURSOR_VERSION):
+        raise ValueError(f"Unknown submission cursor: {cursor!r}")
+    try:
+        body = cursor[len(_SUBMISSION_CURSOR_VERSION):]
+        aware, micros, uuid_bytes = _SUBMISSION_CURSOR.unpack(
+            base64.urlsafe_b64decode(body + '=' * (-len(body) % 4)))
+    except (struct.error, ValueError) as e:
+        raise ValueError(f"Malformed submission cursor: {cursor!r}") from e
+    return (_EPOCH_UTC if aware else _EPOCH) + timedelta(microseconds=micros), UUID(bytes=uuid_bytes)
+
+
+@read_only
+async def get_submissions_page(hackathon_id=None, stage_id=None, team_id=None, cursor: str = None,
+                               backward: bool = False, limit: int = SUBMISSION_PAGE_SIZE) -> Dict[str, Any]:
+    """
+    One page of submissions, newest first, keyset-paginated on (submitted_at, id).
+
+    `cursor` is the `next` or `prev` value of an earlier page; `backward`
+    pages towards newer submissions. Returns {'items', 'next', 'prev'}, a
+    cursor being None when there is nothing further that way.
+    """
+    conditions, args = [], []
+
+    def param(value) -> str:
+        args.append(value)
+        return f"${len(args)}"
+
+    if hackathon_id:
+        conditions.append(f"ht.hackaton_id = {param(hackathon_id)}")
+    if stage_id:
+        conditions.append(f"s.hackaton_task_id = {param(stage_id)}")
+    if team_id:
+        conditions.append(f"s.group_id = {param(team_id)}")
+    if cursor:
+        submitted_at, submission_id = decode_submission_cursor(cursor)
+        op = '>' if backward else '<'
+        conditions.append(f"(s.submitted_at, s.id) {op} ({param(submitted_at)}, {param(submission_id)})")
+    order = 'ASC' if backward else 'DESC'
+    where = f"WHERE {' AND '.join(conditions)}" if conditions else ''
+
+    async with get_connection() as conn:
+        rows = await conn.fetch(f"""
+            SELECT s.id, s.group_id, s.hackaton_task_id, s.submission_type, s.content,
+                   s.file_name, s.submitted_at, g.name as team_name, g.code as team_code,
+                   ht.name as stage_name, ht.stage_number, ht.hackaton_id
+            FROM "submission" s
+            JOIN "group" g ON s.group_id = g.id
+            JOIN "hackaton_task" ht ON s.hackaton_task_id = ht.id
+            {where}
+            ORDER BY s.submitted_at {order}, s.id {order}
+            LIMIT {param(limit + 1)}
+        """, *args)
+
+    more = len(rows) > limit
+    rows = rows[:limit]
+    if backward:
+        rows.reverse()
+    # Leaving the newest (oldest) page means there are rows on the other side
+    has_newer = more if backward else bool(cursor)
+    has_older = bool(cursor) if backward else more
+    return {
+        'items': [Submission.from_record(r) for r in rows],
+        'next': encode_submission_cursor(rows[-1]['submitted_at'], rows[-1]['id']) if rows and has_older else None,
+        'prev': encode_submission_cursor(rows[0]['submitted_at'], rows[0]['id']) if rows and has_newer else None,
+    }
 
 
 # ============================================================================
 # REGISTRATION STATE
 # ============================================================================
 
-async def set_registration_state(telegram_id: int, step: str, data: dict = None) -> None:
-    async with get_connection() as conn:
-        data_json = json.dumps(data, default=json_serializer) if data else '{}'
-        existing = await conn.fetchval('SELECT 1 FROM "registration_state" WHERE telegram_id = $1', telegram_id)
-        if existing:
-            await conn.execute("""
-                UPDATE "registration_state" SET current_step = $2, data = $3::jsonb, updated_at = NOW()
-                WHERE telegram_id = $1
-            """, telegram_id, step, data_json)
-        else:
+class PostgresStateBackend(StateBackend):
+    """registration_state table as the durable backend of the state store."""
+
+    async def load(self, telegram_id: int) -> Optional[Dict[str, Any]]:
+        async with get_connection() as conn:
+            s = await conn.fetchrow('SELECT * FROM "registration_state" WHERE telegram_id = $1', telegram_id)
+            return dict(s) if s else None
+
+    async def save(self, telegram_id: int, step: str, data: dict) -> None:
+        async with get_connection() as conn:
             await conn.execute("""
-                INSERT INTO "registration_state" (telegram_id, current_step, data)
-                VALUES ($1, $2, $3::jsonb)
-            """, telegram_id, step, data_json)
+                INSERT INTO "registration_state" (telegram_id, current_step, data, updated_at)
+                VALUES ($1, $2, $3::jsonb, NOW())
+                ON CONFLICT (telegram_id) DO UPDATE
+                    SET current_step = EXCLUDED.current_step, data = EXCLUDED.data, updated_at = EXCLUDED.updated_at
+            """, telegram_id, step, data or {})
+
+    async def delete(self, telegram_id: int) -> None:
+        async with get_connection() as conn:
+            await conn.execute('DELETE FROM "registration_state" WHERE telegram_id = $1', telegram_id)
+
+
+def _create_state_store() -> StateStore:
+    backend = PostgresStateBackend()
+    if STATE_STORE == 'postgres':
+        return DirectStateStore(backend)
+    return CachedStateStore(backend, max_entries=STATE_CACHE_SIZE, flush_delay=STATE_FLUSH_DELAY)
+
+
+_state_store: StateStore = _create_state_store()
+
+
+def get_state_store() -> StateStore:
+    return _state_store
+
+
+def set_state_store(store: StateStore) -> None:
+    """Swap the state store, e.g. for a backend shared between replicas."""
+    global _state_store
+    _state_store = store
+
+
+async def set_registration_state(telegram_id: int, step: str, data: dict = None) -> None:
+    await _state_store.set(telegram_id, step, data)
 
 
 async def get_registration_state(telegram_id: int) -> Optional[Dict[str, Any]]:
-    async with get_connection() as conn:
-        s = await conn.fetchrow('SELECT * FROM "registration_state" WHERE telegram_id = $1', telegram_id)
-        if s:
-            r = dict(s)
-            if isinstance(r.get('data'), str):
-                r['data'] = json.loads(r['data'])
-            return r
-        return None
+    return await _state_store.get(telegram_id)
 
 
 async def clear_registration_state(telegram_id: int) -> None:
-    async with get_connection() as conn:
-        await conn.execute('DELETE FROM "registration_state" WHERE telegram_id = $1', telegram_id)
+    await _state_store.clear(telegram_id)
 
 
 # ============================================================================
 # NOTIFICATIONS & LOGGING
 # ============================================================================
 
+@read_only
 async def get_hackathon_participants(hackathon_id) -> List[int]:
     async with get_connection() as conn:
         rows = await conn.fetch("""
@@ -808,6 +1861,22 @@ async def get_hackathon_participants(hackathon_id) -> List[int]:
         return [r['telegram_id'] for r in rows if r['telegram_id']]
 
 
+async def stream_hackathon_participants(hackathon_id, fields: Sequence[str] = ('telegram_id',),
+                                        chunk_size: int = STREAM_CHUNK_SIZE) -> AsyncIterator[Dict[str, Any]]:
+    columns = ', '.join(f'u."{f}"' for f in stream_projection(fields))
+    query = f"""
+        SELECT DISTINCT {columns} FROM "user" u
+        JOIN "group_user" gu ON u.id = gu.user_id
+        JOIN "group" g ON gu.group_id = g.id
+        JOIN "hackaton_group" hg ON g.id = hg.group_id
+        WHERE hg.hackaton_id = $1 AND g.is_active = TRUE AND u.telegram_id IS NOT NULL
+          AND u.id > $2
+        ORDER BY u.id LIMIT $3
+    """
+    async for row in _stream_keyset(query, (hackathon_id,), chunk_size):
+        yield row
+
+
 async def log_action(telegram_id: int, action: str, details: dict = None) -> None:
     async with get_connection() as conn:
         user = await conn.fetchrow('SELECT id FROM "user" WHERE telegram_id = $1', telegram_id)
@@ -815,17 +1884,149 @@ async def log_action(telegram_id: int, action: str, details: dict = None) -> Non
         await conn.execute("""
             INSERT INTO "audit_log" (id, user_id, telegram_id, action, details, created_at)
             VALUES (gen_random_uuid(), $1, $2, $3, $4::jsonb, NOW())
-        """, user_uuid, telegram_id, action, json.dumps(details) if details else None)
+        """, user_uuid, telegram_id, action, details or None)
+
+
+_COUNT_STATS_SQL = """
+    SELECT 
+        (SELECT COUNT(*) FROM "user" WHERE is_active = TRUE) as total_users,
+        (SELECT COUNT(*) FROM "user" WHERE consent_given = TRUE) as consented_users,
+        (SELECT COUNT(*) FROM "group" WHERE is_active = TRUE) as total_teams,
+        (SELECT COUNT(*) FROM "hackaton" WHERE is_active = TRUE) as active_hackathons,
+        (SELECT COUNT(*) FROM "submission") as total_submissions
+"""
+
+# Trigger-maintained totals plus per-hackathon/per-stage counts for the
+# running hackathons, as one row
+_COUNTER_STATS_SQL = """
+    SELECT t.total_users, t.consented_users, t.total_teams, t.active_hackathons,
+           t.total_submissions, t.reconciled_at,
+           (SELECT json_agg(json_build_object(
+                       'id', h.id, 'name', h.name,
+                       'teams', COALESCE(sh.teams, 0), 'submissions', COALESCE(sh.submissions, 0),
+                       'stages', (SELECT json_agg(json_build_object(
+                                             'id', ht.id, 'name', ht.name, 'stage_number', ht.stage_number,
+                                             'submissions', COALESCE(ss.submissions, 0))
+                                         ORDER BY ht.stage_number)
+                                  FROM "hackaton_task" ht
+                                  LEFT JOIN "stats_stage" ss ON ss.hackaton_task_id = ht.id
+                                  WHERE ht.hackaton_id = h.id))
+                   ORDER BY h.starts_at)
+              FROM "hackaton" h
+              LEFT JOIN "stats_hackathon" sh ON sh.hackaton_id = h.id
+              WHERE h.is_active = TRUE AND h.status IN ('OPEN_TO_REGISTRATION', 'ACTIVE')) AS hackathons
+    FROM "stats_totals" t WHERE t.id = 1
+"""
 
+STATS_TOTALS = ('total_users', 'consented_users', 'total_teams', 'active_hackathons', 'total_submissions')
 
+
+@read_only
 async def get_stats() -> Dict[str, Any]:
+    """Totals plus a `hackathons` breakdown (teams/submissions, per-stage submissions)."""
     async with get_connection() as conn:
-        stats = await conn.fetchrow("""
-            SELECT 
-                (SELECT COUNT(*) FROM "user" WHERE is_active = TRUE) as total_users,
-                (SELECT COUNT(*) FROM "user" WHERE consent_given = TRUE) as consented_users,
-                (SELECT COUNT(*) FROM "group" WHERE is_active = TRUE) as total_teams,
-                (SELECT COUNT(*) FROM "hackaton" WHERE is_active = TRUE) as active_hackathons,
-                (SELECT COUNT(*) FROM "submission") as total_submissions
-        """)
-        return dict(stats)
+        try:
+            stats = await conn.fetchrow(_COUNTER_STATS_SQL)
+        except asyncpg.UndefinedTableError:
+            # Counters migration not applied yet
+            stats = None
+        if stats is None:
+            result = dict(await conn.fetchrow(_COUNT_STATS_SQL))
+            result['hackathons'] = []
+            return result
+        result = dict(stats)
+        result['hackathons'] = stats['hackathons'] or []
+        return result
+
+
+async def reconcile_stats() -> Dict[str, int]:
+    """
+    Recount the stats counters from the source tables and return how far each
+    total had drifted. The counter tables are locked meanwhile, so trigger
+    updates from concurrent writes wait instead of being lost.
+    """
+    async with get_connection() as conn:
+        async with conn.transaction():
+            await conn.execute(
+                'LOCK TABLE "stats_totals", "stats_stage", "stats_hackathon" IN SHARE ROW EXCLUSIVE MODE'
+            )
+            before = await conn.fetchrow('SELECT * FROM "stats_totals" WHERE id = 1')
+            await conn.execute(migrations.STATS_REFRESH_SQL)
+            after = await conn.fetchrow('SELECT * FROM "stats_totals" WHERE id = 1')
+    drift = {key: after[key] - (before[key] if before else 0) for key in STATS_TOTALS}
+    drift = {key: value for key, value in drift.items() if value}
+    if drift:
+        logger.warning(f"Stats counters drifted, corrected: {drift}")
+    return drift
+
+
+# ============================================================================
+# STATS HISTORY
+# ============================================================================
+
+# (bucket width in seconds, age): samples older than `age` are merged into
+# buckets of that width, keeping the last value of each bucket
+STATS_DOWNSAMPLE = ((3600, timedelta(days=2)), (86400, timedelta(days=30)))
+
+
+def stats_sample(stats: Dict[str, Any]) -> Dict[str, Any]:
+    """Compact form of get_stats(): totals plus counts keyed by hackathon and stage id."""
+    data = {key: stats[key] for key in STATS_TOTALS}
+    data['hackathons'] = {h['id']: {'teams': h['teams'], 'submissions': h['submissions']}
+                          for h in stats['hackathons']}
+    data['stages'] = {s['id']: s['submissions'] for h in stats['hackathons'] for s in h.get('stages') or []}
+    return data
+
+
+def stats_bucket(at: datetime, width: int) -> datetime:
+    return datetime.fromtimestamp(int(at.timestamp()) // width * width, timezone.utc)
+
+
+async def record_stats_sample(interval: int) -> None:
+    """Store the current counters in the `interval`-second bucket containing now (first writer wins)."""
+    data = stats_sample(await get_stats())
+    async with get_connection() as conn:
+        await conn.execute("""
+            INSERT INTO "stats_sample" (bucket, resolution, data) VALUES ($1, $2, $3::jsonb)
+            ON CONFLICT (bucket, resolution) DO NOTHING
+        """, stats_bucket(datetime.now(timezone.utc), interval), interval, data)
+
+
+async def downsample_stats_samples() -> int:
+    """Apply STATS_DOWNSAMPLE; returns how many fine-grained samples were merged away."""
+    merged = 0
+    async with get_connection() as conn:
+        for width, age in STATS_DOWNSAMPLE:
+            cutoff = datetime.now(timezone.utc) - age
+            async with conn.transaction():
+                await conn.execute("""
+                    INSERT INTO "stats_sample" (bucket, resolution, data)
+                    SELECT DISTINCT ON (coarse) coarse, $1::integer, data
+                    FROM (SELECT to_timestamp(floor(extract(epoch FROM bucket) / $1::integer) * $1::integer) AS coarse,
+                                 bucket, data
+                          FROM "stats_sample" WHERE resolution < $1::integer AND bucket < $2) s
+                    ORDER BY coarse, bucket DESC
+                    ON CONFLICT (bucket, resolution) DO UPDATE SET data = EXCLUDED.data
+                """, width, cutoff)
+                result = await conn.execute(
+                    'DELETE FROM "stats_sample" WHERE resolution < $1 AND bucket < $2', width, cutoff
+                )
+                merged += int(result.split()[-1])
+    return merged
+
+
+@read_only
+async def get_stats_history(since: datetime) -> List[Dict[str, Any]]:
+    """Samples from `since` on, oldest first: stats_sample() dicts plus `at` and `resolution`."""
+    async with get_connection() as conn:
+        rows = await conn.fetch("""
+            SELECT bucket, resolution, data FROM "stats_sample"
+            WHERE bucket >= $1 ORDER BY bucket, resolution DESC
+        """, since)
+    history = []
+    for row in rows:
+        sample = row['data']
+        sample['at'] = row['bucket']
+        sample['resolution'] = row['resolution']
+        history.append(sample)
+    return history
@@ -67,9 +67,9 @@ async def export_users_csv(db) -> io.BytesIO:
 
 async def export_teams_csv(db, hackathon_id: int = None) -> io.BytesIO:
     """Export teams to CSV format."""
-    from database import get_connection
+    from database import get_read_connection
     
-    async with get_connection() as conn:
+    async with get_read_connection() as conn:
         if hackathon_id:
             teams = await conn.fetch("""
                 SELECT t.*, h.name as hackathon_name,
@@ -120,9 +120,9 @@ async def export_teams_csv(db, hackathon_id: int = None) -> io.BytesIO:
 
 async def export_team_members_csv(db, hackathon_id: int = None) -> io.BytesIO:
     """Export team members to CSV format."""
-    from database import get_connection
+    from database import get_read_connection
     
-    async with get_connection() as conn:
+    async with get_read_connection() as conn:
         if hackathon_id:
             members = await conn.fetch("""
                 SELECT 
@@ -179,9 +179,9 @@ async def export_team_members_csv(db, hackathon_id: int = None) -> io.BytesIO:
 
 async def export_submissions_csv(db, hackathon_id: int = None, stage_id: int = None) -> io.BytesIO:
     """Export submissions to CSV format."""
-    from database import get_connection
+    from database import get_read_connection
     
-    async with get_connection() as conn:
+    async with get_read_connection() as conn:
         query = """
             SELECT 
                 s.*, t.name as team_name, t.code as team_code,
@@ -5,13 +5,16 @@ Admin handlers for CBU Coding Hackathon Bot
 import logging
 import csv
 import io
-from datetime import datetime
+import html
+from datetime import datetime, timedelta, timezone
+from typing import Optional
+from uuid import UUID
 from telegram import Update, InputFile
 from telegram.ext import ContextTypes
 
-import database as db
+from repository import db
 from locales.translations import t
-from utils.keyboards import main_menu_keyboard, cancel_keyboard
+from utils.keyboards import main_menu_keyboard, cancel_keyboard, admin_submissions_page_keyboard
 from utils.helpers import UserState, validate_date, format_datetime
 
 logger = logging.getLogger(__name__)
@@ -21,11 +24,11 @@ async def admin_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Handle /admin command."""
     telegram_id = update.effective_user.id
     if not await db.is_admin(telegram_id):
-        user = await db.get_user(telegram_id)
+        user = await db.get_session_user(telegram_id)
         lang = user.get('language', 'uz') if user else 'uz'
         await update.message.reply_text(t('admin_only', lang))
         return
-    user = await db.get_user(telegram_id)
+    user = await db.get_session_user(telegram_id)
     lang = user.get('language', 'uz') if user else 'uz'
     await update.message.reply_text(t('admin_menu', lang))
 
@@ -35,7 +38,7 @@ async def stats_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     telegram_id = update.effective_user.id
     if not await db.is_admin(telegram_id):
         return
-    user = await db.get_user(telegram_id)
+    user = await db.get_session_user(telegram_id)
     lang = user.get('language', 'uz') if user else 'uz'
     stats = await db.get_stats()
     await update.message.reply_text(t('stats_message', lang,
@@ -44,7 +47,166 @@ async def stats_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
         total_teams=stats['total_teams'],
         active_hackathons=stats['active_hackathons'],
         total_submissions=stats['total_submissions']
-    ))
+    ) + format_stats_breakdown(stats.get('hackathons') or []) + "\n\n" + format_pool_stats(db.get_pool_stats()))
+
+
+def format_stats_breakdown(hackathons: list, max_length: int = 2500) -> str:
+    """Per-hackathon teams/submissions and per-stage submissions for /stats."""
+    lines = []
+    for h in hackathons:
+        lines.append(f"\n🏆 {h['name']}: {h['teams']} teams, {h['submissions']} submissions")
+        for stage in h.get('stages') or []:
+            lines.append(f"   • Stage {stage['stage_number']} {stage['name']}: {stage['submissions']} submissions")
+    text = "\n".join(lines)
+    if len(text) > max_length:
+        text = text[:max_length].rsplit("\n", 1)[0] + "\n…"
+    return "\n" + text if text else ""
+
+
+def format_pool_stats(pool_stats: dict, limit: int = 5) -> str:
+    """Render pool usage and the callers that wait longest for a connection."""
+    lines = [f"🗄 DB pool: {pool_stats['in_use']}/{pool_stats['max_size']} in use, "
+             f"{pool_stats['idle']} idle (min {pool_stats['min_size']})"]
+    if 'replica' in pool_stats:
+        replica = pool_stats['replica']
+        lines.append(f"🗄 Replica pool: {replica['size'] - replica['idle']} in use, {replica['idle']} idle")
+    callers = sorted(pool_stats['callers'].items(), key=lambda item: item[1]['wait_p95'], reverse=True)
+    for caller, c in callers[:limit]:
+        lines.append(f"• {caller}: {c['acquires']} acq, wait p95 {c['wait_p95'] * 1000:.1f}ms, "
+                     f"hold p95 {c['hold_p95'] * 1000:.1f}ms, in use p95 {c['in_use_p95']:.0f}")
+    return "\n".join(lines)
+
+
+async def dbstats_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Handle /dbstats [p95|p99|calls|rows|bytes|reset] command."""
+    telegram_id = update.effective_user.id
+    if not await db.is_admin(telegram_id):
+        return
+    arg = context.args[0] if context.args else 'total'
+    if arg == 'reset':
+        db.reset_query_stats()
+        await update.message.reply_text("✅ Query stats reset")
+        return
+    if arg not in QUERY_SORT_KEYS:
+        arg = 'total'
+    await update.message.reply_text(format_query_stats(db.get_query_stats(), arg))
+
+
+QUERY_SORT_KEYS = ('total', 'calls', 'p50', 'p95', 'p99', 'rows', 'bytes')
+
+
+def _format_query_entries(entries: dict, sort_key: str, limit: int, width: int) -> list:
+    top = sorted(entries.items(), key=lambda item: item[1][sort_key], reverse=True)[:limit]
+    if not top:
+        return ["• no queries recorded"]
+    lines = []
+    for name, e in top:
+        label = name if len(name) <= width else name[:width - 1] + "…"
+        lines.append(f"• {label}\n  {e['calls']} calls, {e['total']:.2f}s total, "
+                     f"p50/p95/p99 {e['p50'] * 1000:.1f}/{e['p95'] * 1000:.1f}/{e['p99'] * 1000:.1f}ms, "
+                     f"{e['rows']} rows, {e['bytes'] // 1024}KB")
+    return lines
+
+
+def format_query_stats(query_stats: dict, sort_key: str = 'total', limit: int = 10) -> str:
+    """Render the top database functions and statements by `sort_key`."""
+    lines = [f"📊 DB time by function (by {sort_key})"]
+    lines += _format_query_entries(query_stats['functions'], sort_key, limit, 60)
+    lines += ["", "📜 Statements"]
+    lines += _format_query_entries(query_stats['statements'], sort_key, limit, 120)
+    text = "\n".join(lines)
+    # Telegram caps messages at 4096 characters
+    return text if len(text) <= 4000 else text[:3990] + "\n…"
+
+
+SPARK_CHARS = "▁▂▃▄▅▆▇█"
+TREND_TOTALS = (('total_users', 'Users'), ('consented_users', 'Consented'),
+                ('total_teams', 'Teams'), ('total_submissions', 'Submissions'))
+TREND_UNITS = {'m': 60, 'h': 3600, 'd': 86400}
+
+
+def parse_period(arg: str) -> Optional[timedelta]:
+    """'90m', '24h', '7d' -> timedelta; None if it doesn't parse."""
+    unit = TREND_UNITS.get(arg[-1:].lower())
+    if not unit or not arg[:-1].isdigit() or int(arg[:-1]) == 0:
+        return None
+    return timedelta(seconds=int(arg[:-1]) * unit)
+
+
+def sparkline(values: list) -> str:
+    known = [v for v in values if v is not None]
+    if not known:
+        return " " * len(values)
+    low, high = min(known), max(known)
+    span = (high - low) or 1
+    return "".join(" " if v is None else SPARK_CHARS[(v - low) * (len(SPARK_CHARS) - 1) // span] for v in values)
+
+
+def resample(history: list, since: datetime, until: datetime, points: int) -> list:
+    """Last sample at or before the end of each of `points` equal slots (None before the first)."""
+    step = (until - since) / points
+    slots, i, current = [], 0, None
+    for n in range(1, points + 1):
+        slot_end = since + step * n
+        while i < len(history) and history[i]['at'] <= slot_end:
+            current = history[i]
+            i += 1
+        slots.append(current)
+    return slots
+
+
+def format_trend(history: list, stats: dict, period: timedelta, points: int = 24) -> str:
+    """Sparklines for the totals and for each running hackathon's teams and stage submissions."""
+    until = datetime.now(timezone.utc)
+    slots = resample(history, until - period, until, points)
+
+    def row(label: str, values: list) -> str:
+        known = [v for v in values if v is not None]
+        change = f" (+{known[-1] - known[0]})" if len(known) > 1 and known[-1] > known[0] else ""
+        return f"{html.escape(label[:14]):<14} {sparkline(values)} {known[-1] if known else '—'}{change}"
+
+    lines = [f"📈 Last {format_period(period)}, {points} steps of {format_period(period / points)}", "<pre>"]
+    for key, label in TREND_TOTALS:
+        lines.append(row(label, [s[key] if s else None for s in slots]))
+    lines.append("</pre>")
+    for h in stats.get('hackathons') or []:
+        lines += [f"🏆 {html.escape(h['name'])}", "<pre>"]
+        lines.append(row("Teams", [s['hackathons'].get(h['id'], {}).get('teams') if s else None for s in slots]))
+        for stage in h.get('stages') or []:
+            lines.append(row(f"Stage {stage['stage_number']}",
+                             [s['stages'].get(stage['id']) if s else None for s in slots]))
+        lines.append("</pre>")
+    text = "\n".join(lines)
+    if len(text) > 4000:
+        # Cut at a block boundary so the HTML stays balanced
+        text = text[:text.rfind("</pre>", 0, 3990) + len("</pre>")] + "\n…"
+    return text
+
+
+def format_period(period: timedelta) -> str:
+    seconds = int(period.total_seconds())
+    for unit, size in (('d', 86400), ('h', 3600), ('m', 60)):
+        if seconds >= size and seconds % size == 0:
+            return f"{seconds // size}{unit}"
+    return f"{seconds // 60}m" if seconds >= 60 else f"{seconds}s"
+
+
+async def trend_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Handle /trend [24h|7d|90m] command."""
+    telegram_id = update.effective_user.id
+    if not await db.is_admin(telegram_id):
+        return
+    period = parse_period(context.args[0]) if context.args else timedelta(hours=24)
+    if period is None:
+        await update.message.reply_text("Usage: /trend [90m|24h|7d]")
+        return
+    history = await db.get_stats_history(datetime.now(timezone.utc) - period)
+    if not history:
+        await update.message.reply_text("No stats samples recorded for this period yet")
+        return
+    # Current counters only supply the hackathon/stage names and ids
+    stats = await db.get_stats()
+    await update.message.reply_text(format_trend(history, stats, period), parse_mode='HTML')
 
 
 async def broadcast_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -52,31 +214,36 @@ async def broadcast_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     telegram_id = update.effective_user.id
     if not await db.is_admin(telegram_id):
         return
-    user = await db.get_user(telegram_id)
+    user = await db.get_session_user(telegram_id)
     lang = user.get('language', 'uz') if user else 'uz'
     await db.set_registration_state(telegram_id, UserState.ADMIN_BROADCAST, {})
     await update.message.reply_text(t('broadcast_prompt', lang), reply_markup=cancel_keyboard(lang))
 
 
+USER_EXPORT_FIELDS = ('telegram_id', 'username', 'first_name', 'last_name', 'phone', 'birth_date',
+                      'gender', 'living_place', 'pinfl', 'language', 'consent_given', 'created_at')
+
+
 async def export_users_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Export users to CSV."""
     telegram_id = update.effective_user.id
     if not await db.is_admin(telegram_id):
         return
-    users = await db.get_all_consented_users()
     output = io.StringIO()
     writer = csv.writer(output)
     writer.writerow(['ID', 'Telegram ID', 'Username', 'First Name', 'Last Name', 'Phone', 
                      'Birth Date', 'Gender', 'Location', 'PINFL', 'Language', 'Consent', 'Created'])
-    for u in users:
-        writer.writerow([u['id'], u['telegram_id'], u.get('username', ''), u.get('first_name', ''),
-            u.get('last_name', ''), u.get('phone', ''), str(u.get('birth_date', '')),
-            u.get('gender', ''), u.get('location', ''), u.get('pinfl', ''),
-            u.get('language', ''), u.get('consent_given', ''), str(u.get('created_at', ''))])
+    count = 0
+    async for u in db.stream_consented_users(USER_EXPORT_FIELDS):
+        writer.writerow([u['id'], u['telegram_id'], u['username'] or '', u['first_name'] or '',
+            u['last_name'] or '', u['phone'] or '', str(u['birth_date'] or ''),
+            u['gender'] or '', u['living_place'] or '', u['pinfl'] or '',
+            u['language'] or '', u['consent_given'], str(u['created_at'] or '')])
+        count += 1
     output.seek(0)
     await update.message.reply_document(
         document=InputFile(io.BytesIO(output.getvalue().encode('utf-8')), filename='users.csv'),
-        caption=f"✅ {len(users)} users exported")
+        caption=f"✅ {count} users exported")
 
 
 async def export_teams_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -84,7 +251,7 @@ async def export_teams_command(update: Update, context: ContextTypes.DEFAULT_TYP
     telegram_id = update.effective_user.id
     if not await db.is_admin(telegram_id):
         return
-    async with db.get_connection() as conn:
+    async with db.get_read_connection() as conn:
         teams = await conn.fetch("""
             SELECT t.*, h.name as hackathon_name,
                    (SELECT COUNT(*) FROM team_members WHERE team_id = t.id) as member_count
@@ -107,7 +274,7 @@ async def export_members_command(update: Update, context: ContextTypes.DEFAULT_T
     telegram_id = update.effective_user.id
     if not await db.is_admin(telegram_id):
         return
-    async with db.get_connection() as conn:
+    async with db.get_read_connection() as conn:
         members = await conn.fetch("""
             SELECT tm.*, u.first_name, u.last_name, u.username, u.phone, t.name as team_name, t.code as team_code
             FROM team_members tm
@@ -232,15 +399,17 @@ async def notify_hackathon_command(update: Update, context: ContextTypes.DEFAULT
     try:
         hackathon_id = int(context.args[0])
         message = ' '.join(context.args[1:])
-        participants = await db.get_hackathon_participants(hackathon_id)
-        sent = 0
-        for user_id in participants:
-            try:
-                await context.bot.send_message(chat_id=user_id, text=message)
-                sent += 1
-            except Exception as e:
-                logger.error(f"Failed to send to {user_id}: {e}")
-        await update.message.reply_text(f"✅ Sent to {sent}/{len(participants)} participants")
+        sent = total = 0
+        async with db.outside_unit_of_work():
+            async for participant in db.stream_hackathon_participants(hackathon_id):
+                user_id = participant['telegram_id']
+                total += 1
+                try:
+                    await context.bot.send_message(chat_id=user_id, text=message)
+                    sent += 1
+                except Exception as e:
+                    logger.error(f"Failed to send to {user_id}: {e}")
+        await update.message.reply_text(f"✅ Sent to {sent}/{total} participants")
     except ValueError:
         await update.message.reply_text("❌ Invalid hackathon_id")
 
@@ -261,16 +430,18 @@ async def handle_admin_message(update: Update, context: ContextTypes.DEFAULT_TYP
     
     # Broadcast
     if current_step == UserState.ADMIN_BROADCAST:
-        users = await db.get_all_consented_users()
-        sent = 0
-        for u in users:
-            try:
-                await context.bot.send_message(chat_id=u['telegram_id'], text=text)
-                sent += 1
-            except Exception as e:
-                logger.error(f"Broadcast failed to {u['telegram_id']}: {e}")
+        sent = total = 0
+        # The send loop takes minutes; don't keep this update's connection for it
+        async with db.outside_unit_of_work():
+            async for u in db.stream_consented_users():
+                total += 1
+                try:
+                    await context.bot.send_message(chat_id=u['telegram_id'], text=text)
+                    sent += 1
+                except Exception as e:
+                    logger.error(f"Broadcast failed to {u['telegram_id']}: {e}")
         await db.clear_registration_state(telegram_id)
-        await update.message.reply_text(f"✅ Broadcast sent to {sent}/{len(users)} users")
+        await update.message.reply_text(f"✅ Broadcast sent to {sent}/{total} users")
         return True
     
     # Create hackathon flow - MULTI-LANGUAGE
@@ -460,7 +631,7 @@ async def download_submission_command(update: Update, context: ContextTypes.DEFA
     
     try:
         submission_id = int(context.args[0])
-        async with db.get_connection() as conn:
+        async with db.get_read_connection() as conn:
             sub = await conn.fetchrow("""
                 SELECT s.*, t.name as team_name, hs.name as stage_name 
                 FROM submissions s 
@@ -495,28 +666,67 @@ async def download_submission_command(update: Update, context: ContextTypes.DEFA
         await update.message.reply_text("❌ Invalid submission ID")
 
 
+SUBMISSION_FILTERS = {'hackathon': 'hackathon_id', 'stage': 'stage_id', 'team': 'team_id'}
+SUBMISSIONS_USAGE = "Usage: /submissions [hackathon=<id>] [stage=<id>] [team=<code>]"
+# /submissions messages per admin whose Newer/Older buttons keep working
+SUBMISSION_LISTS_KEPT = 20
+
+
+def format_submissions_page(items: list) -> str:
+    """HTML listing of one get_submissions_page page."""
+    if not items:
+        return "📭 No submissions"
+    lines = ["📋 <b>Submissions</b>"]
+    for s in items:
+        if s['submission_type'] == 'file':
+            kind = f"📎 {html.escape(s.get('file_name') or 'file')}"
+        else:
+            kind = "🔗 Link"
+        lines.append(
+            f"\n<code>{s['id']}</code>\n"
+            f"{html.escape(s.get('team_name') or '?')} | Stage {s.get('stage_number', '?')} | "
+            f"{kind} | {format_datetime(s.get('submitted_at'))}"
+        )
+    return "\n".join(lines)
+
+
 async def list_submissions_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    """Handle /submissions [hackathon_id] - list all submissions."""
+    """Handle /submissions [hackathon=<id>] [stage=<id>] [team=<code>] - browse submissions, newest first."""
     telegram_id = update.effective_user.id
     if not await db.is_admin(telegram_id):
         return
     
-    submissions = await db.get_all_submissions()
-    
-    if not submissions:
-        await update.message.reply_text("📭 No submissions yet")
-        return
-    
-    # Group by hackathon/stage
-    text = "📋 **All Submissions:**\n\n"
-    for s in submissions[:50]:  # Limit to 50
-        file_info = f"📎 {s.get('file_name', 'file')}" if s['submission_type'] == 'file' else f"🔗 Link"
-        text += f"**#{s['id']}** | {s.get('team_name', '?')} | Stage {s.get('stage_number', '?')} | {file_info}\n"
-    
-    if len(submissions) > 50:
-        text += f"\n... and {len(submissions) - 50} more. Use /export_submissions for full list."
+    filters = {}
+    for arg in context.args or []:
+        name, _, value = arg.partition('=')
+        if name not in SUBMISSION_FILTERS or not value:
+            await update.message.reply_text(SUBMISSIONS_USAGE)
+            return
+        if name == 'team':
+            team = await db.get_team_by_code(value)
+            if not team:
+                await update.message.reply_text(f"❌ Team {value} not found")
+                return
+            value = team['id']
+        else:
+            try:
+                value = str(UUID(value))
+            except ValueError:
+                await update.message.reply_text(f"❌ Invalid {name} ID")
+                return
+        filters[SUBMISSION_FILTERS[name]] = value
     
-    await update.message.reply_text(text, parse_mode='Markdown')
+    page = await db.get_submissions_page(**filters)
+    message = await update.message.reply_text(
+        format_submissions_page(page['items']),
+        parse_mode='HTML',
+        reply_markup=admin_submissions_page_keyboard(page)
+    )
+    # Kept per message for its Newer/Older buttons, whose callback data only fits the cursor
+    lists = context.user_data.setdefault('submission_filters', {})
+    lists[message.message_id] = filters
+    while len(lists) > SUBMISSION_LISTS_KEPT:
+        del lists[next(iter(lists))]
 
 
 async def export_all_files_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -537,7 +747,7 @@ async def export_all_files_command(update: Update, context: ContextTypes.DEFAULT
             return
     
     # Get submissions with files
-    async with db.get_connection() as conn:
+    async with db.get_read_connection() as conn:
         if hackathon_id:
             submissions = await conn.fetch("""
                 SELECT s.*, t.name as team_name, t.code as team_code, 
@@ -622,7 +832,7 @@ async def export_all_files_command(update: Update, context: ContextTypes.DEFAULT
             zipf.writestr("_index.csv", index_csv)
             
             # Add links to a separate file
-            async with db.get_connection() as conn:
+            async with db.get_read_connection() as conn:
                 if hackathon_id:
                     link_subs = await conn.fetch("""
                         SELECT s.*, t.name as team_name, t.code as team_code, 
@@ -678,7 +888,7 @@ async def export_team_files_command(update: Update, context: ContextTypes.DEFAUL
     await update.message.reply_text(f"📦 Downloading files for team: {team['name']}...")
     
     # Get team submissions with files
-    async with db.get_connection() as conn:
+    async with db.get_read_connection() as conn:
         submissions = await conn.fetch("""
             SELECT s.*, hs.name as stage_name, hs.stage_number
             FROM submissions s 
@@ -689,7 +899,7 @@ async def export_team_files_command(update: Update, context: ContextTypes.DEFAUL
     
     if not submissions:
         # Check for links
-        async with db.get_connection() as conn:
+        async with db.get_read_connection() as conn:
             link_subs = await conn.fetch("""
                 SELECT s.*, hs.stage_number FROM submissions s 
                 JOIN hackathon_stages hs ON s.stage_id = hs.id
@@ -759,7 +969,7 @@ async def export_stage_files_command(update: Update, context: ContextTypes.DEFAU
     await update.message.reply_text(f"📦 Downloading files for Stage {stage['stage_number']}...")
     
     # Get stage submissions with files
-    async with db.get_connection() as conn:
+    async with db.get_read_connection() as conn:
         submissions = await conn.fetch("""
             SELECT s.*, t.name as team_name, t.code as team_code
             FROM submissions s 
@@ -819,3 +1029,24 @@ async def handle_admin_callback(update: Update, context: ContextTypes.DEFAULT_TY
     if data == 'admin_cancel':
         await db.clear_registration_state(telegram_id)
         await query.edit_message_text("❌ Cancelled")
+    
+    elif data.startswith(('admin_subs_n_', 'admin_subs_p_')):
+        filters = context.user_data.get('submission_filters', {}).get(query.message.message_id)
+        if filters is None:
+            # Lost on restart or pushed out by newer lists; paging unfiltered would mislead
+            await query.edit_message_text("❌ This list has expired, run /submissions again")
+            return
+        try:
+            page = await db.get_submissions_page(
+                cursor=data[len('admin_subs_n_'):],
+                backward=data.startswith('admin_subs_p_'),
+                **filters
+            )
+        except ValueError:
+            await query.edit_message_text("❌ This list has expired, run /submissions again")
+            return
+        await query.edit_message_text(
+            format_submissions_page(page['items']),
+            parse_mode='HTML',
+            reply_markup=admin_submissions_page_keyboard(page)
+        )
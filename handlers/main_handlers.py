@@ -9,7 +9,7 @@ from telegram import Update
 from telegram.ext import ContextTypes
 from telegram.constants import ParseMode
 
-import database as db
+from repository import db
 from database import get_localized_field
 from locales.translations import t
 from utils.keyboards import (
@@ -42,12 +42,29 @@ def _strip_prefix(value: str, prefix: str) -> str:
         return value.split(prefix, 1)[1]
     return value
 
-def _is_uuid(value: str) -> bool:
-    try:
-        uuid.UUID(str(value))
-        return True
-    except Exception:
-        return False
+_JOIN_FAILURE_MESSAGES = {
+    db.TeamJoinResult.INVALID_CODE: 'invalid_team_code',
+    db.TeamJoinResult.TEAM_FULL: 'team_full',
+    db.TeamJoinResult.ALREADY_REGISTERED: 'already_registered',
+}
+
+
+def _join_failure_message(reason: str) -> str:
+    """Translation key for a failed team join."""
+    return _JOIN_FAILURE_MESSAGES.get(reason, 'error_occurred')
+
+
+def _set_draft(data: dict, **fields) -> None:
+    """Store registration answers in the state draft."""
+    data.setdefault('draft', {}).update(fields)
+
+
+def _draft_fields(data: dict) -> dict:
+    """Registration draft as update_user kwargs (dates come back as ISO strings from the DB)."""
+    fields = dict(data.get('draft', {}))
+    if isinstance(fields.get('birth_date'), str):
+        fields['birth_date'] = datetime.fromisoformat(fields['birth_date'])
+    return fields
 
 
 # =============================================================================
@@ -66,7 +83,7 @@ async def start_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
         return
     
     # Check if user exists
-    existing_user = await db.get_user(telegram_id)
+    existing_user = await db.get_session_user(telegram_id)
     
     if existing_user:
         # Check if user has given consent
@@ -102,7 +119,7 @@ async def start_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
 async def help_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Handle /help command."""
-    user = await db.get_user(update.effective_user.id)
+    user = await db.get_session_user(update.effective_user.id)
     lang = user.get('language', 'uz') if user else 'uz'
     
     await update.message.reply_text(
@@ -113,7 +130,7 @@ async def help_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
 async def settings_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Handle /settings command."""
-    user = await db.get_user(update.effective_user.id)
+    user = await db.get_session_user(update.effective_user.id)
     if not user or not user.get('consent_given'):
         await update.message.reply_text(t('offer_required', 'uz'))
         return
@@ -134,7 +151,7 @@ async def handle_message(update: Update, context: ContextTypes.DEFAULT_TYPE):
     telegram_id = update.effective_user.id
     text = update.message.text
     
-    user = await db.get_user(telegram_id)
+    user = await db.get_session_user(telegram_id)
     if not user:
         await update.message.reply_text(t('please_start', 'en'), reply_markup=remove_keyboard())
         return
@@ -175,21 +192,22 @@ async def handle_contact(update: Update, context: ContextTypes.DEFAULT_TYPE):
     telegram_id = update.effective_user.id
     contact = update.message.contact
     
-    user = await db.get_user(telegram_id)
+    user = await db.get_session_user(telegram_id)
     lang = user.get('language', 'uz') if user else 'uz'
     
     state = await db.get_registration_state(telegram_id)
     
     if state and state['current_step'] == UserState.REG_PHONE:
-        await db.update_user(telegram_id, phone=contact.phone_number)
-        await db.set_registration_state(telegram_id, UserState.REG_EMAIL, state.get('data', {}))
+        data = state.get('data', {})
+        _set_draft(data, phone=contact.phone_number)
+        await db.set_registration_state(telegram_id, UserState.REG_EMAIL, data)
         await update.message.reply_text(t('enter_email', lang), reply_markup=remove_keyboard())
 
 
 async def handle_file(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Handle file submissions (documents, photos, videos, audio)."""
     telegram_id = update.effective_user.id
-    user = await db.get_user(telegram_id)
+    user = await db.get_session_user(telegram_id)
     
     if not user or not user.get('consent_given'):
         return
@@ -267,13 +285,15 @@ async def handle_registration_input(update: Update, context: ContextTypes.DEFAUL
     current_step = state['current_step']
     data = state.get('data', {})
     
+    # Registration answers are collected in the state draft and written to
+    # the user row in one UPDATE once the last step (PINFL) is valid.
     if current_step == UserState.REG_FIRST_NAME:
-        await db.update_user(telegram_id, first_name=clean_name(text))
+        _set_draft(data, first_name=clean_name(text))
         await db.set_registration_state(telegram_id, UserState.REG_LAST_NAME, data)
         await update.message.reply_text(t('enter_last_name', lang))
         
     elif current_step == UserState.REG_LAST_NAME:
-        await db.update_user(telegram_id, last_name=clean_name(text))
+        _set_draft(data, last_name=clean_name(text))
         await db.set_registration_state(telegram_id, UserState.REG_BIRTH_DATE, data)
         await update.message.reply_text(t('enter_birth_date', lang))
         
@@ -282,12 +302,12 @@ async def handle_registration_input(update: Update, context: ContextTypes.DEFAUL
         if not is_valid:
             await update.message.reply_text(t('invalid_date', lang))
             return
-        await db.update_user(telegram_id, birth_date=parsed_date)
+        _set_draft(data, birth_date=parsed_date)
         await db.set_registration_state(telegram_id, UserState.REG_GENDER, data)
         await update.message.reply_text(t('enter_gender', lang), reply_markup=gender_keyboard(lang))
         
     elif current_step == UserState.REG_LOCATION:
-        await db.update_user(telegram_id, location=text)
+        _set_draft(data, location=text)
         await db.set_registration_state(telegram_id, UserState.REG_PHONE, data)
         await update.message.reply_text(t('enter_phone', lang), reply_markup=phone_keyboard(lang))
     
@@ -295,7 +315,7 @@ async def handle_registration_input(update: Update, context: ContextTypes.DEFAUL
         if not validate_email(text):
             await update.message.reply_text(t('invalid_email', lang))
             return
-        await db.update_user(telegram_id, email=text)
+        _set_draft(data, email=text)
         await db.set_registration_state(telegram_id, UserState.REG_PINFL, data)
         await update.message.reply_text(t('enter_pinfl', lang))
         
@@ -303,35 +323,26 @@ async def handle_registration_input(update: Update, context: ContextTypes.DEFAUL
         if not validate_pinfl(text):
             await update.message.reply_text(t('invalid_pinfl', lang))
             return
-        await db.update_user(telegram_id, pinfl=text, registration_complete=True)
+        await db.update_user(telegram_id, **_draft_fields(data), pinfl=text, registration_complete=True)
         await db.clear_registration_state(telegram_id)
         await db.log_action(telegram_id, 'completed_registration', {})
         await update.message.reply_text(t('registration_almost_done', lang), reply_markup=main_menu_keyboard(lang))
         
     # Team creation flow
     elif current_step == UserState.TEAM_JOIN_CODE:
-        team = await db.get_team_by_code(text.strip())
-        if not team:
-            await update.message.reply_text(t('invalid_team_code', lang))
-            return
-        
-        # Check team size
-        members = await db.get_team_members(team['id'])
-        if len(members) >= 5:
-            await update.message.reply_text(t('team_full', lang))
-            await db.clear_registration_state(telegram_id)
-            return
-        
-        # Check if already in a team for this hackathon
-        existing = await db.get_user_team_for_hackathon(telegram_id, team['hackathon_id'])
-        if existing:
-            await update.message.reply_text(t('already_registered', lang))
-            await db.clear_registration_state(telegram_id)
+        code = text.strip()
+        check = await db.check_team_join(code, telegram_id)
+        if not check['success']:
+            await update.message.reply_text(t(_join_failure_message(check['reason']), lang))
+            # A wrong code can be retyped; any other failure ends the flow
+            if check['reason'] != db.TeamJoinResult.INVALID_CODE:
+                await db.clear_registration_state(telegram_id)
             return
         
         # Save team info and ask for role
-        data['join_team_id'] = team['id']
-        data['join_team_name'] = team['name']
+        data['join_team_code'] = code
+        data['join_team_id'] = check['team_id']
+        data['join_team_name'] = check['team_name']
         await db.set_registration_state(telegram_id, UserState.SELECT_TEAM_ROLE, data)
         await update.message.reply_text(
             t('select_team_role', lang),
@@ -496,7 +507,7 @@ async def show_my_hackathons(update: Update, context: ContextTypes.DEFAULT_TYPE,
 async def show_personal_data(update: Update, context: ContextTypes.DEFAULT_TYPE, lang: str):
     """Show user's personal data."""
     telegram_id = update.effective_user.id
-    user = await db.get_user(telegram_id)
+    user = await db.get_user_profile(telegram_id)
     
     text = t('your_data', lang,
         first_name=user.get('first_name', '—'),
@@ -522,7 +533,7 @@ async def handle_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
     data = query.data
     parts = data.split('_')
     
-    user = await db.get_user(telegram_id)
+    user = await db.get_session_user(telegram_id)
     lang = user.get('language', 'uz') if user else 'uz'
     
     # Language selection
@@ -590,12 +601,21 @@ async def handle_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
             team_id = state_data.get('join_team_id')
             team_name = state_data.get('join_team_name', 'Team')
             
-            if team_id:
-                success = await db.add_team_member(team_id, telegram_id, role)
+            team_code = state_data.get('join_team_code')
+            if not team_code and team_id:
+                # State saved before join codes were kept in the draft
+                team = await db.get_team(team_id)
+                team_code = team['code'] if team else None
+            
+            if team_code or team_id:
+                if team_code:
+                    result = await db.join_team_by_code(team_code, telegram_id, role)
+                else:
+                    result = {'success': False, 'reason': db.TeamJoinResult.INVALID_CODE}
                 await db.clear_registration_state(telegram_id)
                 
-                if success:
-                    await db.log_action(telegram_id, 'joined_team', {'team_id': team_id, 'role': role})
+                if result['success']:
+                    await db.log_action(telegram_id, 'joined_team', {'team_id': result.get('team_id', team_id), 'role': role})
                     await query.edit_message_text(
                         t('joined_team_with_role', lang, name=team_name, role=role)
                     )
@@ -605,7 +625,7 @@ async def handle_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
                         reply_markup=main_menu_keyboard(lang)
                     )
                 else:
-                    await query.edit_message_text(t('error_occurred', lang))
+                    await query.edit_message_text(t(_join_failure_message(result['reason']), lang))
             else:
                 await query.edit_message_text(t('error_occurred', lang))
         return
@@ -722,23 +742,17 @@ async def handle_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
     # Stage view
     if data.startswith('stage_'):
         stage_id = parts[1]
-        stage = await db.get_stage(stage_id)
-        if not stage:
+        stage = await db.get_stage_view(stage_id, telegram_id)
+        if not stage or not stage.get('team_id'):
             await query.edit_message_text(t('error_occurred', lang))
             return
         
-        hackathon = await db.get_hackathon(stage['hackathon_id'])
-        user_team = await db.get_user_team_for_hackathon(telegram_id, stage['hackathon_id'])
-        
-        if not user_team:
-            await query.edit_message_text(t('error_occurred', lang))
-            return
-        
-        submission = await db.get_submission(user_team['id'], stage_id)
-        deadline_passed = stage.get('deadline') and datetime.now(stage['deadline'].tzinfo) > stage['deadline'] if stage.get('deadline') else False
+        # Keep the row so the submit button can check the deadline without another query
+        context.user_data['stage_view'] = stage
+        deadline_passed = db.is_stage_deadline_passed(stage)
         
         # Get localized content
-        h_name = get_localized_field(hackathon, 'name', lang)
+        h_name = get_localized_field(stage['hackathon'], 'name', lang)
         s_name = get_localized_field(stage, 'name', lang)
         s_task = get_localized_field(stage, 'task_description', lang)
         
@@ -752,7 +766,7 @@ async def handle_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
         
         await query.edit_message_text(
             text,
-            reply_markup=stage_keyboard(stage_id, user_team['id'], submission is not None, deadline_passed, lang)
+            reply_markup=stage_keyboard(stage_id, stage['team_id'], stage['has_submission'], deadline_passed, lang)
         )
         return
     
@@ -761,11 +775,12 @@ async def handle_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
         stage_id = parts[1]
         team_id = parts[2]
         
-        stage = await db.get_stage(stage_id)
-        if stage and stage.get('deadline'):
-            if datetime.now(stage['deadline'].tzinfo) > stage['deadline']:
-                await query.answer(t('deadline_passed', lang), show_alert=True)
-                return
+        stage = context.user_data.get('stage_view')
+        if not stage or str(stage['id']) != stage_id:
+            stage = await db.get_stage_view(stage_id, telegram_id)
+        if stage and db.is_stage_deadline_passed(stage):
+            await query.answer(t('deadline_passed', lang), show_alert=True)
+            return
         
         await db.set_registration_state(telegram_id, UserState.SUBMIT_LINK, {'stage_id': stage_id, 'team_id': team_id})
         await query.edit_message_text(t('submit_prompt', lang), reply_markup=cancel_keyboard(lang))
@@ -847,7 +862,7 @@ async def handle_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
         return
     
     if data == 'edit_personal_data':
-        user = await db.get_user(telegram_id)
+        user = await db.get_user_profile(telegram_id)
         text = t('your_data', lang,
             first_name=user.get('first_name', '—'),
             last_name=user.get('last_name', '—'),
@@ -887,13 +902,13 @@ async def handle_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
     # Gender selection
     if data.startswith('gender_'):
         gender = 'male' if data == 'gender_male' else 'female'
-        await db.update_user(telegram_id, gender=gender)
-        
         state = await db.get_registration_state(telegram_id)
+        
         if state and state.get('data', {}).get('editing'):
+            await db.update_user(telegram_id, gender=gender)
             await db.clear_registration_state(telegram_id)
             await query.edit_message_text(t('data_updated', lang))
-            user = await db.get_user(telegram_id)
+            user = await db.get_user_profile(telegram_id)
             text = t('your_data', lang,
                 first_name=user.get('first_name', '—'),
                 last_name=user.get('last_name', '—'),
@@ -904,7 +919,9 @@ async def handle_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
             await context.bot.send_message(chat_id=telegram_id, text=text, reply_markup=edit_data_keyboard(lang))
         else:
             # Continue registration
-            await db.set_registration_state(telegram_id, UserState.REG_LOCATION, state.get('data', {}) if state else {})
+            state_data = state.get('data', {}) if state else {}
+            _set_draft(state_data, gender=gender)
+            await db.set_registration_state(telegram_id, UserState.REG_LOCATION, state_data)
             await query.edit_message_text(t('enter_location', lang))
         return
     
@@ -932,7 +949,7 @@ async def handle_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
 async def handle_team_join(update: Update, context: ContextTypes.DEFAULT_TYPE, team_code: str):
     """Handle deep link team join."""
     telegram_id = update.effective_user.id
-    user = await db.get_user(telegram_id)
+    user = await db.get_session_user(telegram_id)
     
     if not user:
         await start_command(update, context)
@@ -944,24 +961,9 @@ async def handle_team_join(update: Update, context: ContextTypes.DEFAULT_TYPE, t
     
     lang = user.get('language', 'uz')
     
-    team = await db.get_team_by_code(team_code)
-    if not team:
-        await update.message.reply_text(t('invalid_team_code', lang), reply_markup=main_menu_keyboard(lang))
-        return
-    
-    existing = await db.get_user_team_for_hackathon(telegram_id, team['hackathon_id'])
-    if existing:
-        await update.message.reply_text(t('already_registered', lang), reply_markup=main_menu_keyboard(lang))
-        return
-    
-    members = await db.get_team_members(team['id'])
-    if len(members) >= 5:
-        await update.message.reply_text(t('team_full', lang), reply_markup=main_menu_keyboard(lang))
-        return
-    
-    success = await db.add_team_member(team['id'], telegram_id, "Member")
-    if success:
-        await db.log_action(telegram_id, 'joined_team', {'team_id': team['id']})
-        await update.message.reply_text(t('joined_team', lang, name=team['name']), reply_markup=main_menu_keyboard(lang))
+    result = await db.join_team_by_code(team_code, telegram_id, "Member")
+    if result['success']:
+        await db.log_action(telegram_id, 'joined_team', {'team_id': result['team_id']})
+        await update.message.reply_text(t('joined_team', lang, name=result['team_name']), reply_markup=main_menu_keyboard(lang))
     else:
-        await update.message.reply_text(t('error_occurred', lang), reply_markup=main_menu_keyboard(lang))
+        await update.message.reply_text(t(_join_failure_message(result['reason']), lang), reply_markup=main_menu_keyboard(lang))
@@ -0,0 +1,778 @@
+"""
+In-memory backend for CBU Coding Hackathon Bot
+Same API and return shapes as database.py, backed by dicts instead of Postgres.
+Used for load tests, handler benchmarks and local runs without a database
+(DB_BACKEND=memory); nothing survives a restart.
+"""
+
+import copy
+import uuid
+import base64
+import logging
+from contextlib import asynccontextmanager
+from datetime import datetime, timezone
+from typing import Optional, List, Dict, Any, AsyncIterator, Sequence
+
+from database import (
+    HACKATON_STATUS, TEAM_ROLES, LANGUAGES, MAX_TEAM_SIZE, STATS_DOWNSAMPLE, SUBMISSION_PAGE_SIZE, STREAM_CHUNK_SIZE,
+    TeamJoinResult, stream_projection,
+    get_env_admin_ids, generate_password, generate_team_code, json_dumps, json_loads, stats_sample, stats_bucket,
+    encode_submission_cursor, decode_submission_cursor,
+)
+from repository import Repository
+from state_store import StateBackend, StateStore, DirectStateStore
+
+logger = logging.getLogger(__name__)
+
+_ACTIVE_HACKATON_STATUS = ('OPEN_TO_REGISTRATION', 'ACTIVE')
+
+
+def _new_id() -> str:
+    return str(uuid.uuid4())
+
+
+def _now() -> datetime:
+    return datetime.now()
+
+
+class _MemoryStateBackend(StateBackend):
+    """registration_state kept in a dict, stored as JSON like the jsonb column."""
+
+    def __init__(self):
+        self.rows: Dict[int, Dict[str, Any]] = {}
+
+    async def load(self, telegram_id: int) -> Optional[Dict[str, Any]]:
+        row = self.rows.get(telegram_id)
+        if row is None:
+            return None
+        return {**row, 'data': json_loads(row['data'])}
+
+    async def save(self, telegram_id: int, step: str, data: dict) -> None:
+        self.rows[telegram_id] = {
+            'telegram_id': telegram_id, 'current_step': step,
+            'data': json_dumps(data) if data else '{}',
+            'updated_at': datetime.now(timezone.utc),
+        }
+
+    async def delete(self, telegram_id: int) -> None:
+        self.rows.pop(telegram_id, None)
+
+
+class MemoryRepository(Repository):
+    """
+    Tables are dicts keyed like their primary/unique keys. Every method runs
+    without awaiting in between, so each call is atomic on the event loop the
+    way the row locks make the Postgres versions atomic.
+    """
+
+    def __init__(self, state_store: StateStore = None):
+        self.users: Dict[int, Dict[str, Any]] = {}          # by telegram_id
+        self.hackathons: Dict[str, Dict[str, Any]] = {}
+        self.hackathon_langs: Dict[str, Dict[str, Dict[str, Any]]] = {}
+        self.stages: Dict[str, Dict[str, Any]] = {}
+        self.stage_langs: Dict[str, Dict[str, Dict[str, Any]]] = {}
+        self.teams: Dict[str, Dict[str, Any]] = {}
+        self.team_codes: Dict[str, str] = {}
+        self.team_hackathon: Dict[str, str] = {}
+        self.members: Dict[str, List[Dict[str, Any]]] = {}   # by group_id, in join order
+        self.submissions: Dict[tuple, Dict[str, Any]] = {}   # by (group_id, hackaton_task_id)
+        self.audit_log: List[Dict[str, Any]] = []
+        self.stats_samples: Dict[tuple, Dict[str, Any]] = {}  # by (bucket, resolution)
+        self._state_store = state_store or DirectStateStore(_MemoryStateBackend())
+
+    # ------------------------------------------------------------------
+    # Lifecycle / infrastructure
+    # ------------------------------------------------------------------
+
+    async def create_tables(self) -> None:
+        logger.info("In-memory backend: no tables to create")
+
+    async def close_pool(self) -> None:
+        await self._state_store.flush()
+
+    async def start_cache_listener(self) -> None:
+        """Nothing is cached in front of the in-memory data."""
+
+    @asynccontextmanager
+    async def unit_of_work(self, transaction: bool = False, label: str = None):
+        yield None
+
+    @asynccontextmanager
+    async def outside_unit_of_work(self):
+        yield
+
+    def get_read_connection(self):
+        raise NotImplementedError("Raw SQL reports need the Postgres backend (DB_BACKEND=postgres)")
+
+    def get_pool_stats(self) -> Dict[str, Any]:
+        return {'min_size': 0, 'max_size': 0, 'size': 0, 'idle': 0, 'in_use': 0, 'callers': {}}
+
+    def get_query_stats(self) -> Dict[str, Any]:
+        return {'functions': {}, 'statements': {}}
+
+    def reset_query_stats(self) -> None:
+        pass
+
+    def get_state_store(self) -> StateStore:
+        return self._state_store
+
+    # ------------------------------------------------------------------
+    # Row helpers
+    # ------------------------------------------------------------------
+
+    def _user_by_uuid(self, user_uuid: str) -> Optional[Dict[str, Any]]:
+        return next((u for u in self.users.values() if u['id'] == user_uuid), None)
+
+    def _user_uuid(self, telegram_id: int) -> Optional[str]:
+        user = self.users.get(telegram_id)
+        return user['id'] if user else None
+
+    def _membership(self, team_id, user_uuid: str) -> Optional[Dict[str, Any]]:
+        return next((m for m in self.members.get(str(team_id), []) if m['user_id'] == user_uuid), None)
+
+    def _team_row(self, team: Dict[str, Any]) -> Dict[str, Any]:
+        """get_team shape: group columns plus hackathon and owner lookups."""
+        result = dict(team)
+        hackathon_id = self.team_hackathon.get(team['id'])
+        hackathon = self.hackathons.get(hackathon_id)
+        owner = self._user_by_uuid(team['owner_id'])
+        result['hackathon_name'] = hackathon['name'] if hackathon else None
+        result['hackathon_id'] = hackathon_id
+        result['owner_telegram_id'] = owner['telegram_id'] if owner else None
+        result['owner_id'] = result['owner_telegram_id']
+        return result
+
+    def _active_team_for(self, user_uuid: str, hackathon_id) -> Optional[Dict[str, Any]]:
+        for team_id, members in self.members.items():
+            team = self.teams[team_id]
+            if (team['is_active'] and self.team_hackathon.get(team_id) == str(hackathon_id)
+                    and any(m['user_id'] == user_uuid for m in members)):
+                return team
+        return None
+
+    def _hackathon_row(self, h: Dict[str, Any]) -> Dict[str, Any]:
+        result = dict(h)
+        for lang_code, lang in self.hackathon_langs.get(h['id'], {}).items():
+            result[f'name_{lang_code}'] = lang['name']
+            result[f'description_{lang_code}'] = lang['description']
+            if lang.get('prize_pool'):
+                result[f'prize_pool_{lang_code}'] = lang['prize_pool']
+        result['start_date'] = result.get('starts_at')
+        result['end_date'] = result.get('ends_at')
+        return result
+
+    def _stage_row(self, s: Dict[str, Any]) -> Dict[str, Any]:
+        result = dict(s)
+        for lang_code, lang in self.stage_langs.get(s['id'], {}).items():
+            if lang_code == 'uz':
+                result['task_description'] = lang.get('task_description')
+            else:
+                result[f'name_{lang_code}'] = lang['name']
+                result[f'description_{lang_code}'] = lang['description']
+                result[f'task_description_{lang_code}'] = lang.get('task_description')
+        return result
+
+    def _submission_row(self, s: Dict[str, Any]) -> Dict[str, Any]:
+        result = dict(s)
+        result['team_id'] = result.get('group_id')
+        result['stage_id'] = result.get('hackaton_task_id')
+        return result
+
+    # ------------------------------------------------------------------
+    # Users
+    # ------------------------------------------------------------------
+
+    async def add_user(self, telegram_id: int, first_name: str, username: str = None,
+                       last_name: str = None, email: str = None) -> Dict[str, Any]:
+        user = self.users.get(telegram_id)
+        if user:
+            for key, value in (('username', username), ('first_name', first_name),
+                               ('last_name', last_name), ('email', email)):
+                if value is not None:
+                    user[key] = value
+            user['modified_at'] = _now()
+            user['modified_by'] = 'telegram_bot'
+        else:
+            user = self.users[telegram_id] = {
+                'id': _new_id(), 'telegram_id': telegram_id, 'username': username,
+                'first_name': first_name, 'last_name': last_name, 'email': email,
+                'password': generate_password(), 'birth_date': None, 'gender': None,
+                'living_place': None, 'phone': None, 'pinfl': None, 'language': 'uz',
+                'consent_given': False, 'consent_given_at': None, 'consent_version': None,
+                'registration_complete': False, 'is_active': True, 'is_admin': False,
+                'created_at': _now(), 'created_by': 'telegram_bot', 'modified_at': None, 'modified_by': None,
+            }
+        return dict(user)
+
+    async def get_user(self, telegram_id: int) -> Optional[Dict[str, Any]]:
+        user = self.users.get(telegram_id)
+        if not user:
+            return None
+        result = dict(user)
+        result['location'] = result.get('living_place')
+        return result
+
+    async def get_session_user(self, telegram_id: int) -> Optional[Dict[str, Any]]:
+        user = self.users.get(telegram_id)
+        if not user:
+            return None
+        return {'id': user['id'], 'telegram_id': telegram_id, 'language': user['language'],
+                'consent_given': user['consent_given'],
+                'is_admin': user['is_admin'] is True or telegram_id in get_env_admin_ids()}
+
+    async def get_user_profile(self, telegram_id: int) -> Optional[Dict[str, Any]]:
+        user = self.users.get(telegram_id)
+        if not user:
+            return None
+        return {'id': user['id'], 'first_name': user['first_name'], 'last_name': user['last_name'],
+                'birth_date': user['birth_date'], 'gender': user['gender'], 'location': user['living_place']}
+
+    async def get_user_by_id(self, user_id: str) -> Optional[Dict[str, Any]]:
+        user = self._user_by_uuid(str(user_id))
+        return dict(user) if user else None
+
+    async def get_user_by_email(self, email: str) -> Optional[Dict[str, Any]]:
+        user = next((u for u in self.users.values() if u['email'] == email), None)
+        return dict(user) if user else None
+
+    async def update_user(self, telegram_id: int, **kwargs) -> bool:
+        if not kwargs:
+            return False
+        if 'language' in kwargs:
+            lang = kwargs['language']
+            if lang and lang.lower() not in LANGUAGES:
+                kwargs['language'] = 'uz'
+            elif lang:
+                kwargs['language'] = lang.lower()
+        user = self.users.get(telegram_id)
+        if not user:
+            return False
+        for key, value in kwargs.items():
+            user['living_place' if key == 'location' else key] = value
+        user['modified_at'] = _now()
+        user['modified_by'] = 'telegram_bot'
+        return True
+
+    async def set_user_password(self, telegram_id: int, password: str = None) -> str:
+        if password is None:
+            password = generate_password()
+        else:
+            password = base64.b64encode(password.encode()).decode()
+        user = self.users.get(telegram_id)
+        if user:
+            user['password'] = password
+            user['modified_at'] = _now()
+        return password
+
+    async def get_user_password(self, telegram_id: int) -> Optional[str]:
+        user = self.users.get(telegram_id)
+        return user['password'] if user else None
+
+    async def set_user_consent(self, telegram_id: int, consented: bool, version: str = "1.0") -> bool:
+        user = self.users.get(telegram_id)
+        if user:
+            if consented:
+                user.update(consent_given=True, consent_given_at=_now(), consent_version=version)
+            else:
+                user.update(consent_given=False, consent_given_at=None, is_active=False)
+            user['modified_at'] = _now()
+            user['modified_by'] = 'telegram_bot'
+        await self.log_action(telegram_id, 'consent_decision', {'consented': consented, 'version': version})
+        return user is not None
+
+    async def has_user_consented(self, telegram_id: int) -> bool:
+        user = self.users.get(telegram_id)
+        return bool(user) and user['consent_given'] is True
+
+    async def get_all_active_users(self) -> List[Dict[str, Any]]:
+        users = [u for u in self.users.values() if u['is_active']]
+        return [dict(u) for u in sorted(users, key=lambda u: u['created_at'])]
+
+    async def get_all_consented_users(self) -> List[Dict[str, Any]]:
+        return [dict(u) for u in self.users.values() if u['is_active'] and u['consent_given']]
+
+    async def _stream_users(self, users, fields: Sequence[str]) -> AsyncIterator[Dict[str, Any]]:
+        columns = stream_projection(fields)
+        for u in sorted(users, key=lambda u: uuid.UUID(u['id'])):
+            yield {c: u[c] for c in columns}
+
+    def stream_active_users(self, fields: Sequence[str] = ('telegram_id',),
+                            chunk_size: int = STREAM_CHUNK_SIZE) -> AsyncIterator[Dict[str, Any]]:
+        return self._stream_users([u for u in self.users.values() if u['is_active']], fields)
+
+    def stream_consented_users(self, fields: Sequence[str] = ('telegram_id',),
+                               chunk_size: int = STREAM_CHUNK_SIZE) -> AsyncIterator[Dict[str, Any]]:
+        return self._stream_users(
+            [u for u in self.users.values() if u['is_active'] and u['consent_given']], fields)
+
+    async def is_admin(self, telegram_id: int) -> bool:
+        if telegram_id in get_env_admin_ids():
+            return True
+        user = self.users.get(telegram_id)
+        return bool(user) and user['is_admin'] is True
+
+    async def set_admin(self, telegram_id: int, is_admin_status: bool) -> bool:
+        return await self.update_user(telegram_id, is_admin=is_admin_status)
+
+    # ------------------------------------------------------------------
+    # Hackathons
+    # ------------------------------------------------------------------
+
+    async def create_hackathon(self, name: str, description: str = None, prize_pool: str = None,
+                               start_date=None, end_date=None, registration_deadline=None,
+                               name_ru: str = None, name_en: str = None,
+                               description_ru: str = None, description_en: str = None,
+                               prize_pool_ru: str = None, prize_pool_en: str = None,
+                               status: str = 'DRAFT') -> Dict[str, Any]:
+        if status not in HACKATON_STATUS:
+            status = 'DRAFT'
+        h = {
+            'id': _new_id(), 'name': name, 'description': description, 'prize_pool': prize_pool,
+            'starts_at': start_date, 'ends_at': end_date, 'registration_deadline': registration_deadline,
+            'status': status, 'is_active': True, 'created_at': _now(), 'created_by': 'telegram_bot',
+            'modified_at': None,
+        }
+        self.hackathons[h['id']] = h
+        langs = self.hackathon_langs[h['id']] = {}
+        if name_ru or description_ru or prize_pool_ru:
+            langs['ru'] = {'name': name_ru or name, 'description': description_ru, 'prize_pool': prize_pool_ru}
+        if name_en or description_en or prize_pool_en:
+            langs['en'] = {'name': name_en or name, 'description': description_en, 'prize_pool': prize_pool_en}
+        result = dict(h)
+        result['start_date'] = result['starts_at']
+        result['end_date'] = result['ends_at']
+        return result
+
+    async def get_hackathon(self, hackathon_id) -> Optional[Dict[str, Any]]:
+        h = self.hackathons.get(str(hackathon_id))
+        return self._hackathon_row(h) if h else None
+
+    async def get_active_hackathons(self) -> List[Dict[str, Any]]:
+        hs = [h for h in self.hackathons.values()
+              if h['is_active'] and h['status'] in _ACTIVE_HACKATON_STATUS]
+        # ORDER BY starts_at puts NULLs last
+        hs.sort(key=lambda h: (h['starts_at'] is None, h['starts_at'] or 0))
+        return [self._hackathon_row(h) for h in hs]
+
+    async def update_hackathon_status(self, hackathon_id, status: str) -> bool:
+        h = self.hackathons.get(str(hackathon_id))
+        if status not in HACKATON_STATUS or not h:
+            return False
+        h['status'] = status
+        h['modified_at'] = _now()
+        return True
+
+    # ------------------------------------------------------------------
+    # Stages
+    # ------------------------------------------------------------------
+
+    async def create_stage(self, hackathon_id, stage_number: int, name: str, description: str = None,
+                           task_description: str = None, start_date=None, deadline=None,
+                           name_ru: str = None, name_en: str = None,
+                           description_ru: str = None, description_en: str = None,
+                           task_description_ru: str = None, task_description_en: str = None) -> Dict[str, Any]:
+        s = {
+            'id': _new_id(), 'hackaton_id': str(hackathon_id), 'name': name, 'description': description,
+            'stage_number': stage_number, 'deadline': deadline, 'start_date': start_date,
+            'is_active': False, 'created_at': _now(), 'created_by': 'telegram_bot',
+        }
+        self.stages[s['id']] = s
+        langs = self.stage_langs[s['id']] = {
+            'uz': {'name': name, 'description': description or '', 'task_description': task_description},
+        }
+        if name_ru or description_ru or task_description_ru:
+            langs['ru'] = {'name': name_ru or name, 'description': description_ru or '',
+                           'task_description': task_description_ru}
+        if name_en or description_en or task_description_en:
+            langs['en'] = {'name': name_en or name, 'description': description_en or '',
+                           'task_description': task_description_en}
+        return dict(s)
+
+    async def get_stage(self, stage_id) -> Optional[Dict[str, Any]]:
+        s = self.stages.get(str(stage_id))
+        return self._stage_row(s) if s else None
+
+    async def get_stages(self, hackathon_id) -> List[Dict[str, Any]]:
+        stages = [s for s in self.stages.values() if s['hackaton_id'] == str(hackathon_id)]
+        return [self._stage_row(s) for s in sorted(stages, key=lambda s: s['stage_number'])]
+
+    async def get_active_stage(self, hackathon_id) -> Optional[Dict[str, Any]]:
+        stages = [s for s in self.stages.values() if s['hackaton_id'] == str(hackathon_id) and s['is_active']]
+        if not stages:
+            return None
+        return self._stage_row(min(stages, key=lambda s: s['stage_number']))
+
+    async def get_stage_view(self, stage_id, telegram_id: int) -> Optional[Dict[str, Any]]:
+        s = self.stages.get(str(stage_id))
+        h = self.hackathons.get(s['hackaton_id']) if s else None
+        if not h:
+            return None
+        result = self._stage_row(s)
+        result['hackathon_id'] = h['id']
+        result['hackathon_name'] = h['name']
+
+        user_uuid = self._user_uuid(telegram_id)
+        team = self._active_team_for(user_uuid, h['id']) if user_uuid else None
+        submission = self.submissions.get((team['id'], s['id'])) if team else None
+        result['team_id'] = team['id'] if team else None
+        result['submission_id'] = submission['id'] if submission else None
+        deadline = s['deadline']
+        result['deadline_passed'] = bool(deadline) and datetime.now(deadline.tzinfo) > deadline
+
+        hackathon = {'id': h['id'], 'name': h['name']}
+        for lang_code, lang in self.hackathon_langs.get(h['id'], {}).items():
+            hackathon[f'name_{lang_code}'] = lang['name']
+        result['hackathon'] = hackathon
+        result['has_submission'] = submission is not None
+        return result
+
+    async def activate_stage(self, stage_id) -> bool:
+        s = self.stages.get(str(stage_id))
+        if not s:
+            return False
+        for other in self.stages.values():
+            if other['hackaton_id'] == s['hackaton_id']:
+                other['is_active'] = False
+        s['is_active'] = True
+        return True
+
+    # ------------------------------------------------------------------
+    # Teams
+    # ------------------------------------------------------------------
+
+    async def create_team(self, hackathon_id, name: str, owner_id: int, owner_role: str = "PROJECT_MANAGER",
+                          field: str = None, portfolio_link: str = None) -> Dict[str, Any]:
+        if owner_role not in TEAM_ROLES:
+            owner_role = "PROJECT_MANAGER"
+        user_uuid = self._user_uuid(owner_id)
+        if not user_uuid:
+            raise ValueError(f"User with telegram_id {owner_id} not found")
+
+        code = generate_team_code()
+        while code in self.team_codes:
+            code = generate_team_code()
+
+        team = {
+            'id': _new_id(), 'name': name, 'code': code, 'owner_id': user_uuid, 'field': field,
+            'portfolio_link': portfolio_link, 'is_active': True, 'created_at': _now(),
+            'created_by': 'telegram_bot', 'modified_at': None,
+        }
+        self.teams[team['id']] = team
+        self.team_codes[code] = team['id']
+        self.team_hackathon[team['id']] = str(hackathon_id)
+        self.members[team['id']] = [{
+            'id': _new_id(), 'user_id': user_uuid, 'group_id': team['id'],
+            'user_role_in_group': owner_role, 'is_team_lead': True, 'joined_at': _now(),
+        }]
+
+        result = dict(team)
+        result['hackathon_id'] = str(hackathon_id)
+        result['owner_telegram_id'] = owner_id
+        return result
+
+    async def get_team(self, team_id) -> Optional[Dict[str, Any]]:
+        team = self.teams.get(str(team_id))
+        return self._team_row(team) if team else None
+
+    async def get_team_by_code(self, code: str) -> Optional[Dict[str, Any]]:
+        team = self.teams.get(self.team_codes.get(code))
+        if not team or not team['is_active']:
+            return None
+        return self._team_row(team)
+
+    async def get_user_teams(self, telegram_id: int) -> List[Dict[str, Any]]:
+        user_uuid = self._user_uuid(telegram_id)
+        results = []
+        for team_id, members in self.members.items():
+            team = self.teams[team_id]
+            member = next((m for m in members if m['user_id'] == user_uuid), None)
+            if not member or not team['is_active']:
+                continue
+            hackathon = self.hackathons.get(self.team_hackathon.get(team_id))
+            results.append({
+                **team,
+                'hackathon_name': hackathon['name'] if hackathon else None,
+                'is_team_lead': member['is_team_lead'],
+                'role': member['user_role_in_group'],
+                'hackathon_id': self.team_hackathon.get(team_id),
+            })
+        results.sort(key=lambda t: t['created_at'], reverse=True)
+        return results
+
+    async def get_user_team_for_hackathon(self, telegram_id: int, hackathon_id) -> Optional[Dict[str, Any]]:
+        user_uuid = self._user_uuid(telegram_id)
+        team = self._active_team_for(user_uuid, hackathon_id) if user_uuid else None
+        if not team:
+            return None
+        member = self._membership(team['id'], user_uuid)
+        return {**team, 'is_team_lead': member['is_team_lead'], 'role': member['user_role_in_group']}
+
+    async def add_team_member(self, team_id, user_id: int, role: str = "BACKEND") -> bool:
+        if role not in TEAM_ROLES:
+            role = "BACKEND"
+        user_uuid = self._user_uuid(user_id)
+        members = self.members.get(str(team_id))
+        # (group_id, user_id) is unique in group_user; the insert fails for a second row
+        if not user_uuid or members is None or self._membership(team_id, user_uuid):
+            return False
+        if len(members) >= MAX_TEAM_SIZE:
+            return False
+        members.append({
+            'id': _new_id(), 'user_id': user_uuid, 'group_id': str(team_id),
+            'user_role_in_group': role, 'is_team_lead': False, 'joined_at': _now(),
+        })
+        return True
+
+    def _team_join(self, code: str, telegram_id: int, role: str, insert: bool) -> Dict[str, Any]:
+        team = self.teams.get(self.team_codes.get(code))
+        if not team or not team['is_active'] or team['id'] not in self.team_hackathon:
+            return {"success": False, "reason": TeamJoinResult.INVALID_CODE}
+        hackathon_id = self.team_hackathon[team['id']]
+        result = {"success": False, "team_id": team['id'], "team_name": team['name'],
+                  "hackathon_id": hackathon_id}
+        user_uuid = self._user_uuid(telegram_id)
+        members = self.members[team['id']]
+        if not user_uuid:
+            result['reason'] = TeamJoinResult.USER_NOT_FOUND
+        elif self._active_team_for(user_uuid, hackathon_id):
+            result['reason'] = TeamJoinResult.ALREADY_REGISTERED
+        elif len(members) >= MAX_TEAM_SIZE:
+            result['reason'] = TeamJoinResult.TEAM_FULL
+        else:
+            if insert:
+                members.append({
+                    'id': _new_id(), 'user_id': user_uuid, 'group_id': team['id'],
+                    'user_role_in_group': role, 'is_team_lead': False, 'joined_at': _now(),
+                })
+            result['success'] = True
+            result['reason'] = TeamJoinResult.JOINED if insert else TeamJoinResult.CAN_JOIN
+        return result
+
+    async def check_team_join(self, code: str, telegram_id: int) -> Dict[str, Any]:
+        return self._team_join(code, telegram_id, TEAM_ROLES[0], insert=False)
+
+    async def join_team_by_code(self, code: str, telegram_id: int, role: str = "BACKEND") -> Dict[str, Any]:
+        if role not in TEAM_ROLES:
+            role = "BACKEND"
+        return self._team_join(code, telegram_id, role, insert=True)
+
+    async def update_member_role(self, team_id, user_id: int, role: str) -> bool:
+        if role not in TEAM_ROLES:
+            return False
+        user_uuid = self._user_uuid(user_id)
+        member = self._membership(team_id, user_uuid) if user_uuid else None
+        if not member:
+            return False
+        member['user_role_in_group'] = role
+        return True
+
+    async def get_team_members(self, team_id) -> List[Dict[str, Any]]:
+        members = sorted(self.members.get(str(team_id), []),
+                         key=lambda m: (not m['is_team_lead'], m['joined_at']))
+        results = []
+        for m in members:
+            user = self._user_by_uuid(m['user_id'])
+            d = dict(m)
+            for key in ('first_name', 'last_name', 'username', 'telegram_id', 'email'):
+                d[key] = user[key] if user else None
+            d['role'] = m['user_role_in_group']
+            d['user_id'] = d['telegram_id']
+            results.append(d)
+        return results
+
+    async def remove_team_member(self, team_id, user_id: int) -> bool:
+        user_uuid = self._user_uuid(user_id)
+        member = self._membership(team_id, user_uuid) if user_uuid else None
+        if not member or member['is_team_lead']:
+            return False
+        self.members[str(team_id)].remove(member)
+        return True
+
+    async def leave_team(self, team_id, user_id: int) -> Dict[str, Any]:
+        user_uuid = self._user_uuid(user_id)
+        if not user_uuid:
+            return {"success": False, "reason": "user_not_found"}
+        member = self._membership(team_id, user_uuid)
+        if not member:
+            return {"success": False, "reason": "not_member"}
+        if member['is_team_lead']:
+            team = self.teams[str(team_id)]
+            team['is_active'] = False
+            team['modified_at'] = _now()
+            return {"success": True, "team_deactivated": True}
+        self.members[str(team_id)].remove(member)
+        return {"success": True, "team_deactivated": False}
+
+    # ------------------------------------------------------------------
+    # Submissions
+    # ------------------------------------------------------------------
+
+    async def create_submission(self, team_id, stage_id, submitted_by: int, content: str = None,
+                                submission_type: str = 'link', file_id: str = None,
+                                file_name: str = None, file_type: str = None) -> Dict[str, Any]:
+        key = (str(team_id), str(stage_id))
+        s = self.submissions.get(key)
+        if s is None:
+            s = self.submissions[key] = {'id': _new_id(), 'group_id': key[0], 'hackaton_task_id': key[1]}
+        s.update(content=content, submission_type=submission_type, file_id=file_id, file_name=file_name,
+                 file_type=file_type, submitted_by=self._user_uuid(submitted_by), submitted_at=_now())
+        return self._submission_row(s)
+
+    async def get_submission(self, team_id, stage_id) -> Optional[Dict[str, Any]]:
+        s = self.submissions.get((str(team_id), str(stage_id)))
+        return self._submission_row(s) if s else None
+
+    async def get_stage_submissions(self, stage_id) -> List[Dict[str, Any]]:
+        results = []
+        for s in self.submissions.values():
+            team = self.teams.get(s['group_id'])
+            if s['hackaton_task_id'] != str(stage_id) or not team:
+                continue
+            d = self._submission_row(s)
+            d['team_name'] = team['name']
+            d['team_code'] = team['code']
+            results.append(d)
+        results.sort(key=lambda d: d['submitted_at'], reverse=True)
+        return results
+
+    async def get_all_submissions(self) -> List[Dict[str, Any]]:
+        results = []
+        for s in self.submissions.values():
+            team = self.teams.get(s['group_id'])
+            stage = self.stages.get(s['hackaton_task_id'])
+            hackathon = self.hackathons.get(stage['hackaton_id']) if stage else None
+            if not team or not hackathon:
+                continue
+            d = self._submission_row(s)
+            d.update(team_name=team['name'], team_code=team['code'], stage_name=stage['name'],
+                     stage_number=stage['stage_number'], hackathon_name=hackathon['name'])
+            results.append(d)
+        results.sort(key=lambda d: d['submitted_at'], reverse=True)
+        return results
+
+    async def get_submissions_page(self, hackathon_id=None, stage_id=None, team_id=None, cursor: str = None,
+                                   backward: bool = False, limit: int = SUBMISSION_PAGE_SIZE) -> Dict[str, Any]:
+        key = lambda d: (d['submitted_at'], uuid.UUID(d['id']))
+        rows = []
+        for s in self.submissions.values():
+            team = self.teams.get(s['group_id'])
+            stage = self.stages.get(s['hackaton_task_id'])
+            if not team or not stage:
+                continue
+            if ((hackathon_id and stage['hackaton_id'] != str(hackathon_id))
+                    or (stage_id and s['hackaton_task_id'] != str(stage_id))
+                    or (team_id and s['group_id'] != str(team_id))):
+                continue
+            d = self._submission_row(s)
+            d.update(team_name=team['name'], team_code=team['code'], stage_name=stage['name'],
+                     stage_number=stage['stage_number'], hackaton_id=stage['hackaton_id'])
+            rows.append(d)
+        if cursor:
+            position = decode_submission_cursor(cursor)
+            rows = [d for d in rows if (key(d) > position if backward else key(d) < position)]
+        rows.sort(key=key, reverse=not backward)
+        more = len(rows) > limit
+        items = rows[:limit]
+        if backward:
+            items.reverse()
+        has_newer = more if backward else bool(cursor)
+        has_older = bool(cursor) if backward else more
+        return {
+            'items': items,
+            'next': encode_submission_cursor(*key(items[-1])) if items and has_older else None,
+            'prev': encode_submission_cursor(*key(items[0])) if items and has_newer else None,
+        }
+
+    # ------------------------------------------------------------------
+    # Conversation state, notifications, audit, stats
+    # ------------------------------------------------------------------
+
+    async def set_registration_state(self, telegram_id: int, step: str, data: dict = None) -> None:
+        await self._state_store.set(telegram_id, step, data)
+
+    async def get_registration_state(self, telegram_id: int) -> Optional[Dict[str, Any]]:
+        return await self._state_store.get(telegram_id)
+
+    async def clear_registration_state(self, telegram_id: int) -> None:
+        await self._state_store.clear(telegram_id)
+
+    async def get_hackathon_participants(self, hackathon_id) -> List[int]:
+        telegram_ids = set()
+        for team_id, members in self.members.items():
+            if not self.teams[team_id]['is_active'] or self.team_hackathon.get(team_id) != str(hackathon_id):
+                continue
+            for m in members:
+                user = self._user_by_uuid(m['user_id'])
+                if user and user['telegram_id']:
+                    telegram_ids.add(user['telegram_id'])
+        return list(telegram_ids)
+
+    def stream_hackathon_participants(self, hackathon_id, fields: Sequence[str] = ('telegram_id',),
+                                      chunk_size: int = STREAM_CHUNK_SIZE) -> AsyncIterator[Dict[str, Any]]:
+        users = {}
+        for team_id, members in self.members.items():
+            if not self.teams[team_id]['is_active'] or self.team_hackathon.get(team_id) != str(hackathon_id):
+                continue
+            for m in members:
+                user = self._user_by_uuid(m['user_id'])
+                if user and user['telegram_id']:
+                    users[user['id']] = user
+        return self._stream_users(users.values(), fields)
+
+    async def log_action(self, telegram_id: int, action: str, details: dict = None) -> None:
+        self.audit_log.append({
+            'id': _new_id(), 'user_id': self._user_uuid(telegram_id), 'telegram_id': telegram_id,
+            'action': action, 'details': copy.deepcopy(details) if details else None, 'created_at': _now(),
+        })
+
+    async def get_stats(self) -> Dict[str, Any]:
+        # Counted on demand: the dicts are small and there is nothing to keep in sync
+        hackathons = []
+        running = [h for h in self.hackathons.values()
+                   if h['is_active'] and h['status'] in _ACTIVE_HACKATON_STATUS]
+        for h in sorted(running, key=lambda h: (h['starts_at'] is None, h['starts_at'] or 0)):
+            stages = sorted((s for s in self.stages.values() if s['hackaton_id'] == h['id']),
+                            key=lambda s: s['stage_number'])
+            stage_counts = [{
+                'id': s['id'], 'name': s['name'], 'stage_number': s['stage_number'],
+                'submissions': sum(1 for key in self.submissions if key[1] == s['id']),
+            } for s in stages]
+            hackathons.append({
+                'id': h['id'], 'name': h['name'],
+                'teams': sum(1 for team_id, hid in self.team_hackathon.items()
+                             if hid == h['id'] and self.teams[team_id]['is_active']),
+                'submissions': sum(s['submissions'] for s in stage_counts),
+                'stages': stage_counts or None,
+            })
+        return {
+            'total_users': sum(1 for u in self.users.values() if u['is_active']),
+            'consented_users': sum(1 for u in self.users.values() if u['consent_given']),
+            'total_teams': sum(1 for t in self.teams.values() if t['is_active']),
+            'active_hackathons': sum(1 for h in self.hackathons.values() if h['is_active']),
+            'total_submissions': len(self.submissions),
+            'reconciled_at': None,
+            'hackathons': hackathons,
+        }
+
+    async def reconcile_stats(self) -> Dict[str, int]:
+        return {}
+
+    async def record_stats_sample(self, interval: int) -> None:
+        key = (stats_bucket(datetime.now(timezone.utc), interval), interval)
+        if key not in self.stats_samples:
+            self.stats_samples[key] = stats_sample(await self.get_stats())
+
+    async def downsample_stats_samples(self) -> int:
+        merged = 0
+        for width, age in STATS_DOWNSAMPLE:
+            cutoff = datetime.now(timezone.utc) - age
+            old = sorted((key for key in self.stats_samples if key[1] < width and key[0] < cutoff))
+            for bucket, resolution in old:
+                # Ascending order, so the last sample of each coarse bucket wins
+                self.stats_samples[(stats_bucket(bucket, width), width)] = self.stats_samples.pop((bucket, resolution))
+            merged += len(old)
+        return merged
+
+    async def get_stats_history(self, since) -> List[Dict[str, Any]]:
+        keys = sorted((key for key in self.stats_samples if key[0] >= since), key=lambda k: (k[0], -k[1]))
+        return [{**copy.deepcopy(self.stats_samples[key]), 'at': key[0], 'resolution': key[1]} for key in keys]
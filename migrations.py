@@ -0,0 +1,554 @@
+"""
+Schema migrations for CBU Coding Hackathon Bot
+Versioned DDL for the tables and indexes the bot relies on. The core tables
+belong to the web platform; the bot only adds its own tables, the indexes its
+hot queries need and the unique constraints its writes assume.
+
+  python migrations.py            # show applied/pending versions
+  python migrations.py migrate    # apply pending migrations
+  python migrations.py verify     # EXPLAIN the hot queries
+
+database.create_tables() runs migrate() at startup. When schema_version is
+already at the latest version that is two catalog reads and no DDL.
+"""
+
+import sys
+import json
+import asyncio
+import logging
+from typing import Any, Dict, List, Optional, Sequence
+
+logger = logging.getLogger(__name__)
+
+# pg_advisory_lock key so replicas starting together don't race the DDL
+MIGRATION_LOCK_ID = 7_340_021
+
+_NIL_UUID = "'00000000-0000-0000-0000-000000000000'::uuid"
+
+
+class SQL:
+    """Plain DDL, applied inside the migration's transaction."""
+
+    concurrent = False
+
+    def __init__(self, statement: str):
+        self.statement = statement
+
+    async def apply(self, conn) -> bool:
+        await conn.execute(self.statement)
+        return True
+
+
+class Index:
+    """
+    CREATE INDEX CONCURRENTLY, skipped when an equivalent index already exists.
+
+    With `constraint`, the (unique) index is then attached as a named UNIQUE
+    constraint. If existing rows violate uniqueness, a plain index is built
+    instead and a warning reports how many duplicates need cleaning up.
+    """
+
+    concurrent = True
+
+    def __init__(self, name: str, table: str, columns: Sequence[str], unique: bool = False,
+                 constraint: bool = False):
+        self.name = name
+        self.table = table
+        self.columns = list(columns)
+        self.unique = unique or constraint
+        self.constraint = constraint
+
+    @property
+    def relation(self) -> str:
+        return f'"public"."{self.table}"'
+
+    def _column_list(self) -> str:
+        return ', '.join(f'"{c}"' for c in self.columns)
+
+    async def apply(self, conn) -> bool:
+        if not await conn.fetchval('SELECT to_regclass($1) IS NOT NULL', self.relation):
+            logger.warning(f"Migration: table {self.table} does not exist, can't create {self.name}")
+            return False
+
+        own = await conn.fetchrow("""
+            SELECT i.indisvalid, i.indisunique FROM pg_index i
+            JOIN pg_class c ON c.oid = i.indexrelid
+            WHERE c.relname = $1 AND c.relnamespace = 'public'::regnamespace
+        """, self.name)
+        if own and not own['indisvalid']:
+            # Left behind by an interrupted CONCURRENTLY build
+            await conn.execute(f'DROP INDEX CONCURRENTLY IF EXISTS "public"."{self.name}"')
+            own = None
+
+        if own is None:
+            existing = await self._equivalent_index(conn)
+            if existing:
+                logger.info(f"Migration: {self.table}({', '.join(self.columns)}) already covered by {existing}")
+                return True
+            unique = self.unique
+            if unique:
+                duplicates = await conn.fetchval(f"""
+                    SELECT COUNT(*) FROM (
+                        SELECT 1 FROM {self.relation} WHERE {' AND '.join(f'"{c}" IS NOT NULL' for c in self.columns)}
+                        GROUP BY {self._column_list()} HAVING COUNT(*) > 1
+                    ) d
+                """)
+                if duplicates:
+                    logger.warning(f"Migration: {duplicates} duplicate {self.table}({', '.join(self.columns)}) "
+                                   f"values, building {self.name} as a non-unique index")
+                    unique = False
+            await conn.execute(f"""
+                CREATE {'UNIQUE ' if unique else ''}INDEX CONCURRENTLY IF NOT EXISTS "{self.name}"
+                ON {self.relation} ({self._column_list()})
+            """)
+            own = {'indisunique': unique}
+
+        if self.constraint and own['indisunique']:
+            has_constraint = await conn.fetchval("""
+                SELECT 1 FROM pg_constraint WHERE conname = $1 AND conrelid = $2::regclass
+            """, self.name, self.relation)
+            if not has_constraint:
+                await conn.execute(
+                    f'ALTER TABLE {self.relation} ADD CONSTRAINT "{self.name}" UNIQUE USING INDEX "{self.name}"'
+                )
+        return True
+
+    async def _equivalent_index(self, conn) -> Optional[str]:
+        """A valid, non-partial index on the same leading columns (unique if we need unique)."""
+        rows = await conn.fetch("""
+            SELECT c.relname, i.indisunique,
+                   ARRAY(SELECT a.attname::text FROM unnest(i.indkey) WITH ORDINALITY k(attnum, ord)
+                         JOIN pg_attribute a ON a.attrelid = i.indrelid AND a.attnum = k.attnum
+                         ORDER BY k.ord) AS columns
+            FROM pg_index i JOIN pg_class c ON c.oid = i.indexrelid
+            WHERE i.indrelid = $1::regclass AND i.indisvalid AND i.indpred IS NULL
+        """, self.relation)
+        for row in rows:
+            columns = list(row['columns'])
+            if self.unique:
+                if row['indisunique'] and columns == self.columns:
+                    return row['relname']
+            elif columns[:len(self.columns)] == self.columns:
+                return row['relname']
+        return None
+
+
+class Migration:
+    def __init__(self, version: int, name: str, steps: Sequence, requires: Sequence[str] = ()):
+        self.version = version
+        self.name = name
+        self.steps = list(steps)
+        # Web platform tables the steps reference; missing ones keep the version pending
+        self.requires = list(requires)
+
+    @property
+    def concurrent(self) -> bool:
+        # CREATE INDEX CONCURRENTLY can't run inside a transaction block
+        return any(step.concurrent for step in self.steps)
+
+    async def apply(self, conn) -> bool:
+        """Apply all steps; False if one couldn't be (the version then stays pending)."""
+        for table in self.requires:
+            if not await conn.fetchval('SELECT to_regclass($1) IS NOT NULL', f'"public"."{table}"'):
+                logger.warning(f"Migration {self.version}: table {table} does not exist")
+                return False
+        if self.concurrent:
+            complete = True
+            for step in self.steps:
+                complete = await step.apply(conn) and complete
+            return complete
+        async with conn.transaction():
+            for step in self.steps:
+                await step.apply(conn)
+        return True
+
+
+# ============================================================================
+# STATS COUNTERS
+# ============================================================================
+
+# Recount every counter from the source tables. Also run by
+# database.reconcile_stats() with the counter tables locked.
+STATS_REFRESH_SQL = """
+    INSERT INTO "public"."stats_totals" (id, total_users, consented_users, total_teams,
+                                         active_hackathons, total_submissions, reconciled_at)
+    SELECT 1,
+        (SELECT COUNT(*) FROM "user" WHERE is_active = TRUE),
+        (SELECT COUNT(*) FROM "user" WHERE consent_given = TRUE),
+        (SELECT COUNT(*) FROM "group" WHERE is_active = TRUE),
+        (SELECT COUNT(*) FROM "hackaton" WHERE is_active = TRUE),
+        (SELECT COUNT(*) FROM "submission"),
+        NOW()
+    ON CONFLICT (id) DO UPDATE SET
+        total_users = EXCLUDED.total_users, consented_users = EXCLUDED.consented_users,
+        total_teams = EXCLUDED.total_teams, active_hackathons = EXCLUDED.active_hackathons,
+        total_submissions = EXCLUDED.total_submissions, reconciled_at = EXCLUDED.reconciled_at;
+
+    DELETE FROM "public"."stats_hackathon";
+    INSERT INTO "public"."stats_hackathon" (hackaton_id, teams, submissions)
+    SELECT h.id,
+        (SELECT COUNT(*) FROM "hackaton_group" hg JOIN "group" g ON g.id = hg.group_id
+          WHERE hg.hackaton_id = h.id AND g.is_active = TRUE),
+        (SELECT COUNT(*) FROM "submission" s JOIN "hackaton_task" ht ON ht.id = s.hackaton_task_id
+          WHERE ht.hackaton_id = h.id)
+    FROM "hackaton" h;
+
+    DELETE FROM "public"."stats_stage";
+    INSERT INTO "public"."stats_stage" (hackaton_task_id, submissions)
+    SELECT hackaton_task_id, COUNT(*) FROM "submission"
+    WHERE hackaton_task_id IS NOT NULL GROUP BY hackaton_task_id;
+"""
+
+_STATS_TABLES_SQL = """
+    CREATE TABLE IF NOT EXISTS "public"."stats_totals" (
+        "id" SMALLINT PRIMARY KEY CHECK ("id" = 1),
+        "total_users" BIGINT NOT NULL DEFAULT 0,
+        "consented_users" BIGINT NOT NULL DEFAULT 0,
+        "total_teams" BIGINT NOT NULL DEFAULT 0,
+        "active_hackathons" BIGINT NOT NULL DEFAULT 0,
+        "total_submissions" BIGINT NOT NULL DEFAULT 0,
+        "reconciled_at" TIMESTAMP WITH TIME ZONE
+    );
+    CREATE TABLE IF NOT EXISTS "public"."stats_hackathon" (
+        "hackaton_id" UUID PRIMARY KEY,
+        "teams" BIGINT NOT NULL DEFAULT 0,
+        "submissions" BIGINT NOT NULL DEFAULT 0
+    );
+    CREATE TABLE IF NOT EXISTS "public"."stats_stage" (
+        "hackaton_task_id" UUID PRIMARY KEY,
+        "submissions" BIGINT NOT NULL DEFAULT 0
+    );
+"""
+
+# Row triggers keep the counters current for writes from the bot and the web
+# platform alike. Counter rows are always locked in the order totals, stage,
+# hackathon so concurrent writers can't deadlock on them. Deleting a team
+# outright (the bot only deactivates) can leave the per-hackathon team count
+# off until the next reconciliation.
+_STATS_TRIGGERS_SQL = """
+    CREATE OR REPLACE FUNCTION "public"."stats_on_user"() RETURNS trigger AS $$
+    DECLARE
+        d_active INT := 0;
+        d_consent INT := 0;
+    BEGIN
+        IF TG_OP <> 'DELETE' THEN
+            d_active := d_active + CASE WHEN NEW.is_active THEN 1 ELSE 0 END;
+            d_consent := d_consent + CASE WHEN NEW.consent_given THEN 1 ELSE 0 END;
+        END IF;
+        IF TG_OP <> 'INSERT' THEN
+            d_active := d_active - CASE WHEN OLD.is_active THEN 1 ELSE 0 END;
+            d_consent := d_consent - CASE WHEN OLD.consent_given THEN 1 ELSE 0 END;
+        END IF;
+        IF d_active <> 0 OR d_consent <> 0 THEN
+            UPDATE "public"."stats_totals"
+            SET total_users = total_users + d_active, consented_users = consented_users + d_consent
+            WHERE id = 1;
+        END IF;
+        RETURN NULL;
+    END
+    $$ LANGUAGE plpgsql;
+
+    CREATE OR REPLACE FUNCTION "public"."stats_on_group"() RETURNS trigger AS $$
+    DECLARE
+        d INT := 0;
+    BEGIN
+        IF TG_OP <> 'DELETE' THEN
+            d := d + CASE WHEN NEW.is_active THEN 1 ELSE 0 END;
+        END IF;
+        IF TG_OP <> 'INSERT' THEN
+            d := d - CASE WHEN OLD.is_active THEN 1 ELSE 0 END;
+        END IF;
+        IF d <> 0 THEN
+            UPDATE "public"."stats_totals" SET total_teams = total_teams + d WHERE id = 1;
+            -- A new team isn't linked to its hackathon yet; stats_on_hackaton_group counts it
+            IF TG_OP = 'UPDATE' THEN
+                INSERT INTO "public"."stats_hackathon" (hackaton_id, teams)
+                SELECT hackaton_id, d FROM "hackaton_group" WHERE group_id = NEW.id
+                ON CONFLICT (hackaton_id) DO UPDATE SET teams = "stats_hackathon".teams + EXCLUDED.teams;
+            END IF;
+        END IF;
+        RETURN NULL;
+    END
+    $$ LANGUAGE plpgsql;
+
+    CREATE OR REPLACE FUNCTION "public"."stats_on_hackaton_group"() RETURNS trigger AS $$
+    BEGIN
+        IF TG_OP = 'INSERT' THEN
+            IF EXISTS (SELECT 1 FROM "group" WHERE id = NEW.group_id AND is_active = TRUE) THEN
+                INSERT INTO "public"."stats_hackathon" (hackaton_id, teams) VALUES (NEW.hackaton_id, 1)
+                ON CONFLICT (hackaton_id) DO UPDATE SET teams = "stats_hackathon".teams + 1;
+            END IF;
+        ELSIF EXISTS (SELECT 1 FROM "group" WHERE id = OLD.group_id AND is_active = TRUE) THEN
+            UPDATE "public"."stats_hackathon" SET teams = teams - 1 WHERE hackaton_id = OLD.hackaton_id;
+        END IF;
+        RETURN NULL;
+    END
+    $$ LANGUAGE plpgsql;
+
+    CREATE OR REPLACE FUNCTION "public"."stats_on_hackaton"() RETURNS trigger AS $$
+    DECLARE
+        d INT := 0;
+    BEGIN
+        IF TG_OP <> 'DELETE' THEN
+            d := d + CASE WHEN NEW.is_active THEN 1 ELSE 0 END;
+        END IF;
+        IF TG_OP <> 'INSERT' THEN
+            d := d - CASE WHEN OLD.is_active THEN 1 ELSE 0 END;
+        END IF;
+        IF d <> 0 THEN
+            UPDATE "public"."stats_totals" SET active_hackathons = active_hackathons + d WHERE id = 1;
+        END IF;
+        RETURN NULL;
+    END
+    $$ LANGUAGE plpgsql;
+
+    CREATE OR REPLACE FUNCTION "public"."stats_on_submission"() RETURNS trigger AS $$
+    DECLARE
+        d INT;
+        task UUID;
+    BEGIN
+        IF TG_OP = 'INSERT' THEN
+            d := 1;
+            task := NEW.hackaton_task_id;
+        ELSE
+            d := -1;
+            task := OLD.hackaton_task_id;
+        END IF;
+        UPDATE "public"."stats_totals" SET total_submissions = total_submissions + d WHERE id = 1;
+        IF task IS NOT NULL THEN
+            INSERT INTO "public"."stats_stage" (hackaton_task_id, submissions) VALUES (task, d)
+            ON CONFLICT (hackaton_task_id) DO UPDATE SET submissions = "stats_stage".submissions + d;
+            INSERT INTO "public"."stats_hackathon" (hackaton_id, submissions)
+            SELECT hackaton_id, d FROM "hackaton_task" WHERE id = task
+            ON CONFLICT (hackaton_id) DO UPDATE
+                SET submissions = "stats_hackathon".submissions + EXCLUDED.submissions;
+        END IF;
+        RETURN NULL;
+    END
+    $$ LANGUAGE plpgsql;
+
+    DROP TRIGGER IF EXISTS stats_user_rows ON "public"."user";
+    CREATE TRIGGER stats_user_rows AFTER INSERT OR DELETE ON "public"."user"
+        FOR EACH ROW EXECUTE FUNCTION "public"."stats_on_user"();
+    DROP TRIGGER IF EXISTS stats_user_flags ON "public"."user";
+    CREATE TRIGGER stats_user_flags AFTER UPDATE OF is_active, consent_given ON "public"."user"
+        FOR EACH ROW
+        WHEN (OLD.is_active IS DISTINCT FROM NEW.is_active OR OLD.consent_given IS DISTINCT FROM NEW.consent_given)
+        EXECUTE FUNCTION "public"."stats_on_user"();
+
+    DROP TRIGGER IF EXISTS stats_group_rows ON "public"."group";
+    CREATE TRIGGER stats_group_rows AFTER INSERT OR DELETE ON "public"."group"
+        FOR EACH ROW EXECUTE FUNCTION "public"."stats_on_group"();
+    DROP TRIGGER IF EXISTS stats_group_active ON "public"."group";
+    CREATE TRIGGER stats_group_active AFTER UPDATE OF is_active ON "public"."group"
+        FOR EACH ROW WHEN (OLD.is_active IS DISTINCT FROM NEW.is_active)
+        EXECUTE FUNCTION "public"."stats_on_group"();
+
+    DROP TRIGGER IF EXISTS stats_hackaton_group_rows ON "public"."hackaton_group";
+    CREATE TRIGGER stats_hackaton_group_rows AFTER INSERT OR DELETE ON "public"."hackaton_group"
+        FOR EACH ROW EXECUTE FUNCTION "public"."stats_on_hackaton_group"();
+
+    DROP TRIGGER IF EXISTS stats_hackaton_rows ON "public"."hackaton";
+    CREATE TRIGGER stats_hackaton_rows AFTER INSERT OR DELETE ON "public"."hackaton"
+        FOR EACH ROW EXECUTE FUNCTION "public"."stats_on_hackaton"();
+    DROP TRIGGER IF EXISTS stats_hackaton_active ON "public"."hackaton";
+    CREATE TRIGGER stats_hackaton_active AFTER UPDATE OF is_active ON "public"."hackaton"
+        FOR EACH ROW WHEN (OLD.is_active IS DISTINCT FROM NEW.is_active)
+        EXECUTE FUNCTION "public"."stats_on_hackaton"();
+
+    DROP TRIGGER IF EXISTS stats_submission_rows ON "public"."submission";
+    CREATE TRIGGER stats_submission_rows AFTER INSERT OR DELETE ON "public"."submission"
+        FOR EACH ROW EXECUTE FUNCTION "public"."stats_on_submission"();
+"""
+
+
+MIGRATIONS: List[Migration] = [
+    Migration(1, "registration_state table", [
+        SQL("""
+            CREATE TABLE IF NOT EXISTS "public"."registration_state" (
+                "telegram_id" BIGINT PRIMARY KEY,
+                "current_step" VARCHAR(50) NOT NULL,
+                "data" JSONB DEFAULT '{}',
+                "updated_at" TIMESTAMP WITH TIME ZONE DEFAULT NOW()
+            )
+        """),
+    ]),
+    Migration(2, "hot query indexes and unique constraints", [
+        # Every handler resolves the telegram user first
+        Index('uq_user_telegram_id', 'user', ['telegram_id'], constraint=True),
+        # Team codes are generated unique across all teams, active or not
+        Index('uq_group_code', 'group', ['code'], constraint=True),
+        # Membership checks and member lists; one row per user and team
+        Index('uq_group_user_group_user', 'group_user', ['group_id', 'user_id'], constraint=True),
+        # get_user_teams / "already in a team for this hackathon" start from the user
+        Index('idx_group_user_user_id', 'group_user', ['user_id']),
+        # create_submission upserts one submission per team and stage
+        Index('uq_submission_group_task', 'submission', ['group_id', 'hackaton_task_id'], constraint=True),
+        # Stage submission lists, newest first
+        Index('idx_submission_task_submitted_at', 'submission', ['hackaton_task_id', 'submitted_at']),
+        Index('idx_hackaton_group_hackaton_id', 'hackaton_group', ['hackaton_id']),
+        Index('idx_hackaton_group_group_id', 'hackaton_group', ['group_id']),
+        Index('idx_hackaton_task_hackaton_id', 'hackaton_task', ['hackaton_id', 'stage_number']),
+        Index('idx_audit_log_created_at', 'audit_log', ['created_at']),
+    ]),
+    # CREATE TRIGGER locks the tables against writes until commit, so the
+    # initial fill can't miss a concurrent insert
+    Migration(3, "stats counters maintained by triggers", [
+        SQL(_STATS_TABLES_SQL),
+        SQL(_STATS_TRIGGERS_SQL),
+        SQL(STATS_REFRESH_SQL),
+    ], requires=['user', 'group', 'hackaton', 'hackaton_group', 'hackaton_task', 'submission']),
+    Migration(4, "stats samples", [
+        # One row per sampled bucket; `resolution` is the bucket width in
+        # seconds, growing as old samples are downsampled
+        SQL("""
+            CREATE TABLE IF NOT EXISTS "public"."stats_sample" (
+                "bucket" TIMESTAMP WITH TIME ZONE NOT NULL,
+                "resolution" INTEGER NOT NULL,
+                "data" JSONB NOT NULL,
+                PRIMARY KEY ("bucket", "resolution")
+            )
+        """),
+    ]),
+    Migration(5, "submissions keyset index", [
+        # /submissions pages walk (submitted_at, id) from a cursor
+        Index('idx_submission_submitted_at_id', 'submission', ['submitted_at', 'id']),
+    ], requires=['submission']),
+]
+
+LATEST_VERSION = MIGRATIONS[-1].version
+
+
+async def current_version(conn) -> int:
+    if not await conn.fetchval("SELECT to_regclass('public.schema_version') IS NOT NULL"):
+        return 0
+    return await conn.fetchval('SELECT COALESCE(MAX(version), 0) FROM "public"."schema_version"')
+
+
+async def migrate(conn, verify: bool = True) -> int:
+    """Apply pending migrations and return the schema version reached."""
+    version = await current_version(conn)
+    if version >= LATEST_VERSION:
+        return version
+
+    await conn.execute('SELECT pg_advisory_lock($1)', MIGRATION_LOCK_ID)
+    try:
+        await conn.execute("""
+            CREATE TABLE IF NOT EXISTS "public"."schema_version" (
+                "version" INTEGER PRIMARY KEY,
+                "name" VARCHAR(200) NOT NULL,
+                "applied_at" TIMESTAMP WITH TIME ZONE DEFAULT NOW()
+            )
+        """)
+        # Another replica may have migrated while we waited for the lock
+        version = await current_version(conn)
+        for migration in MIGRATIONS:
+            if migration.version <= version:
+                continue
+            logger.info(f"Migration {migration.version}: {migration.name}")
+            if not await migration.apply(conn):
+                logger.warning(f"Migration {migration.version} incomplete, will retry on next start")
+                break
+            await conn.execute(
+                'INSERT INTO "public"."schema_version" (version, name) VALUES ($1, $2)',
+                migration.version, migration.name,
+            )
+            version = migration.version
+    finally:
+        await conn.execute('SELECT pg_advisory_unlock($1)', MIGRATION_LOCK_ID)
+
+    if verify:
+        for result in await verify_plans(conn):
+            if result['seq_scans']:
+                logger.warning(f"Hot query '{result['query']}' still scans {', '.join(result['seq_scans'])}")
+    return version
+
+
+# ============================================================================
+# PLAN VERIFICATION
+# ============================================================================
+
+# The lookups behind most handlers, with placeholder values; each should be
+# answered from an index whatever the table size
+HOT_QUERIES = {
+    'user by telegram_id': 'SELECT id FROM "user" WHERE telegram_id = 0',
+    'team by code': """SELECT id FROM "group" WHERE code = '000000' AND is_active = TRUE""",
+    'team members': f'SELECT user_id FROM "group_user" WHERE group_id = {_NIL_UUID}',
+    'team membership': f'SELECT 1 FROM "group_user" WHERE group_id = {_NIL_UUID} AND user_id = {_NIL_UUID}',
+    'user teams': f'SELECT group_id FROM "group_user" WHERE user_id = {_NIL_UUID}',
+    'hackathon teams': f'SELECT group_id FROM "hackaton_group" WHERE hackaton_id = {_NIL_UUID}',
+    'team hackathon': f'SELECT hackaton_id FROM "hackaton_group" WHERE group_id = {_NIL_UUID}',
+    'submission': f'SELECT id FROM "submission" WHERE group_id = {_NIL_UUID} AND hackaton_task_id = {_NIL_UUID}',
+    'stage submissions': f"""SELECT id FROM "submission" WHERE hackaton_task_id = {_NIL_UUID}
+                             ORDER BY submitted_at DESC LIMIT 50""",
+    'submissions page': f"""SELECT id FROM "submission" WHERE (submitted_at, id) < (NOW(), {_NIL_UUID})
+                            ORDER BY submitted_at DESC, id DESC LIMIT 21""",
+    'hackathon stages': f'SELECT id FROM "hackaton_task" WHERE hackaton_id = {_NIL_UUID} ORDER BY stage_number',
+    'recent audit log': 'SELECT id FROM "audit_log" ORDER BY created_at DESC LIMIT 50',
+}
+
+
+def _walk_plan(plan: Dict[str, Any], indexes: List[str], seq_scans: List[str]) -> None:
+    if plan.get('Index Name'):
+        indexes.append(plan['Index Name'])
+    if plan.get('Node Type') == 'Seq Scan':
+        seq_scans.append(plan.get('Relation Name', '?'))
+    for child in plan.get('Plans', []):
+        _walk_plan(child, indexes, seq_scans)
+
+
+async def verify_plans(conn) -> List[Dict[str, Any]]:
+    """
+    EXPLAIN each hot query with sequential scans discouraged, so the planner
+    picks an index if one is usable even on small tables. A seq scan left in
+    the plan means no index can serve the query.
+    """
+    results = []
+    for name, query in HOT_QUERIES.items():
+        indexes, seq_scans = [], []
+        try:
+            async with conn.transaction():
+                await conn.execute('SET LOCAL enable_seqscan = off')
+                plan = await conn.fetchval(f'EXPLAIN (FORMAT JSON) {query}')
+        except Exception as e:
+            results.append({'query': name, 'indexes': [], 'seq_scans': [], 'error': str(e)})
+            continue
+        if isinstance(plan, str):
+            plan = json.loads(plan)
+        _walk_plan(plan[0]['Plan'], indexes, seq_scans)
+        results.append({'query': name, 'indexes': indexes, 'seq_scans': seq_scans})
+    return results
+
+
+async def _main(command: str) -> int:
+    import database as db
+
+    try:
+        async with db.get_connection() as conn:
+            if command == 'migrate':
+                version = await migrate(conn, verify=False)
+                print(f"Schema version {version} (latest {LATEST_VERSION})")
+                return 0 if version >= LATEST_VERSION else 1
+            if command == 'verify':
+                failed = 0
+                for result in await verify_plans(conn):
+                    if result.get('error'):
+                        status = f"ERROR {result['error']}"
+                    elif result['seq_scans']:
+                        status = f"SEQ SCAN {', '.join(result['seq_scans'])}"
+                    else:
+                        status = f"index {', '.join(result['indexes'])}"
+                    failed += bool(result.get('error') or result['seq_scans'])
+                    print(f"{result['query']:<22} {status}")
+                return 1 if failed else 0
+            version = await current_version(conn)
+            for migration in MIGRATIONS:
+                state = 'applied' if migration.version <= version else 'pending'
+                print(f"{migration.version:>3}  {state:<8} {migration.name}")
+            return 0
+    finally:
+        await db.close_pool()
+
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(_main(sys.argv[1] if len(sys.argv) > 1 else 'status')))
@@ -0,0 +1,140 @@
+"""
+Row models for CBU Coding Hackathon Bot
+Slotted, read-only objects built from database.py records. They keep the
+mapping interface (`m['name']`, `m.get('role')`, `'code' in m`) the handlers
+and keyboards were written against, plus attribute access.
+"""
+
+from collections.abc import Mapping
+from typing import Any, Dict, FrozenSet, Iterator, Tuple
+
+
+class Model(Mapping):
+    """
+    Columns listed in `__slots__` are stored as attributes; anything else a
+    query returns (joined names, web-only columns from SELECT *) lands in a
+    small `_extra` dict. A column the query didn't select is missing, as it
+    would be from the dict, rather than None.
+    """
+
+    __slots__ = ('_extra',)
+    _fields: FrozenSet[str] = frozenset()
+    _field_order: Tuple[str, ...] = ()
+    # Older key names resolved to a column on lookup, e.g. team_id -> group_id
+    aliases: Dict[str, str] = {}
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        order = []
+        for klass in reversed(cls.__mro__):
+            order.extend(s for s in vars(klass).get('__slots__', ()) if not s.startswith('_'))
+        cls._field_order = tuple(dict.fromkeys(order))
+        cls._fields = frozenset(order)
+
+    def __init__(self, **values):
+        object.__setattr__(self, '_extra', None)
+        self._fill(values.items())
+
+    def _fill(self, items) -> None:
+        fields = self._fields
+        for name, value in items:
+            if name in fields:
+                object.__setattr__(self, name, value)
+            else:
+                if self._extra is None:
+                    object.__setattr__(self, '_extra', {})
+                self._extra[name] = value
+
+    @classmethod
+    def from_record(cls, record, **values):
+        """Model from an asyncpg record (None stays None); `values` add or override columns."""
+        if record is None:
+            return None
+        model = cls.__new__(cls)
+        object.__setattr__(model, '_extra', None)
+        model._fill(record.items())
+        if values:
+            model._fill(values.items())
+        return model
+
+    def __setattr__(self, name, value):
+        raise AttributeError(f"{type(self).__name__} is read-only")
+
+    def __delattr__(self, name):
+        raise AttributeError(f"{type(self).__name__} is read-only")
+
+    def __getitem__(self, key: str) -> Any:
+        if key in self._fields:
+            try:
+                return object.__getattribute__(self, key)
+            except AttributeError:
+                pass
+        elif self._extra is not None and key in self._extra:
+            return self._extra[key]
+        alias = self.aliases.get(key)
+        if alias is not None:
+            return self[alias]
+        raise KeyError(key)
+
+    def __iter__(self) -> Iterator[str]:
+        for name in self._field_order:
+            if hasattr(self, name):
+                yield name
+        if self._extra:
+            yield from self._extra
+
+    def __len__(self) -> int:
+        return sum(1 for _ in self)
+
+    def __repr__(self) -> str:
+        return f"{type(self).__name__}({', '.join(f'{k}={v!r}' for k, v in self.items())})"
+
+    def __reduce__(self):
+        return (_rebuild, (type(self), dict(self.items())))
+
+    def to_dict(self) -> Dict[str, Any]:
+        return dict(self.items())
+
+
+def _rebuild(cls, values):
+    return cls(**values)
+
+
+class User(Model):
+    __slots__ = ('id', 'telegram_id', 'username', 'first_name', 'last_name', 'email', 'phone',
+                 'birth_date', 'gender', 'living_place', 'pinfl', 'language', 'consent_given',
+                 'consent_given_at', 'registration_complete', 'is_active', 'is_admin', 'created_at',
+                 'location')
+    aliases = {'location': 'living_place'}
+
+
+class Hackathon(Model):
+    __slots__ = ('id', 'name', 'description', 'prize_pool', 'starts_at', 'ends_at',
+                 'registration_deadline', 'status', 'is_active',
+                 'name_ru', 'name_en', 'description_ru', 'description_en', 'prize_pool_ru', 'prize_pool_en')
+    aliases = {'start_date': 'starts_at', 'end_date': 'ends_at'}
+
+
+class Stage(Model):
+    __slots__ = ('id', 'hackaton_id', 'name', 'description', 'stage_number', 'start_date', 'deadline',
+                 'is_active', 'task_description', 'name_ru', 'name_en', 'description_ru', 'description_en',
+                 'task_description_ru', 'task_description_en')
+    aliases = {'hackathon_id': 'hackaton_id'}
+
+
+class Team(Model):
+    __slots__ = ('id', 'name', 'code', 'field', 'portfolio_link', 'is_active', 'created_at',
+                 'hackathon_id', 'hackathon_name', 'owner_id', 'owner_telegram_id', 'is_team_lead', 'role')
+
+
+class Member(Model):
+    __slots__ = ('id', 'group_id', 'user_id', 'telegram_id', 'first_name', 'last_name', 'username',
+                 'email', 'role', 'is_team_lead', 'joined_at')
+    aliases = {'team_id': 'group_id'}
+
+
+class Submission(Model):
+    __slots__ = ('id', 'group_id', 'hackaton_task_id', 'content', 'submission_type', 'file_id',
+                 'file_name', 'file_type', 'submitted_at', 'team_name', 'team_code', 'stage_name',
+                 'stage_number', 'hackaton_id')
+    aliases = {'team_id': 'group_id', 'stage_id': 'hackaton_task_id', 'hackathon_id': 'hackaton_id'}
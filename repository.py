@@ -0,0 +1,368 @@
+"""
+Repository layer for CBU Coding Hackathon Bot
+Handlers use `db` from this module; it forwards to the active backend:
+database.py (asyncpg, the default) or MemoryRepository (memory_repository.py)
+
+  from repository import db
+  await db.get_user(telegram_id)
+
+Set DB_BACKEND=memory (or call use_memory()) to run the bot, load tests or
+handler benchmarks without Postgres.
+"""
+
+import os
+import logging
+from abc import ABC, abstractmethod
+from typing import Optional, List, Dict, Any, AsyncIterator, Sequence
+
+import database
+
+logger = logging.getLogger(__name__)
+
+DB_BACKEND = os.getenv("DB_BACKEND", "postgres").lower()
+
+
+class Repository(ABC):
+    """
+    Data API the handlers depend on. database.py implements it as module
+    functions; MemoryRepository implements it as methods, so a missing one
+    fails when the class is instantiated. Constants and pure helpers
+    (TeamJoinResult, get_localized_field, ...) stay in database.py.
+    """
+
+    # Lifecycle / infrastructure
+    @abstractmethod
+    async def create_tables(self) -> None:
+        ...
+
+    @abstractmethod
+    async def close_pool(self) -> None:
+        ...
+
+    @abstractmethod
+    async def start_cache_listener(self) -> None:
+        ...
+
+    @abstractmethod
+    def unit_of_work(self, transaction: bool = False, label: str = None):
+        ...
+
+    @abstractmethod
+    def outside_unit_of_work(self):
+        ...
+
+    @abstractmethod
+    def get_read_connection(self):
+        ...
+
+    @abstractmethod
+    def get_pool_stats(self) -> Dict[str, Any]:
+        ...
+
+    @abstractmethod
+    def get_query_stats(self) -> Dict[str, Any]:
+        ...
+
+    @abstractmethod
+    def reset_query_stats(self) -> None:
+        ...
+
+    @abstractmethod
+    def get_state_store(self):
+        ...
+
+    # Users
+    @abstractmethod
+    async def add_user(self, telegram_id: int, first_name: str, username: str = None,
+                       last_name: str = None, email: str = None) -> Dict[str, Any]:
+        ...
+
+    @abstractmethod
+    async def get_user(self, telegram_id: int) -> Optional[Dict[str, Any]]:
+        ...
+
+    @abstractmethod
+    async def get_session_user(self, telegram_id: int) -> Optional[Dict[str, Any]]:
+        ...
+
+    @abstractmethod
+    async def get_user_profile(self, telegram_id: int) -> Optional[Dict[str, Any]]:
+        ...
+
+    @abstractmethod
+    async def get_user_by_id(self, user_id: str) -> Optional[Dict[str, Any]]:
+        ...
+
+    @abstractmethod
+    async def get_user_by_email(self, email: str) -> Optional[Dict[str, Any]]:
+        ...
+
+    @abstractmethod
+    async def update_user(self, telegram_id: int, **kwargs) -> bool:
+        ...
+
+    @abstractmethod
+    async def set_user_password(self, telegram_id: int, password: str = None) -> str:
+        ...
+
+    @abstractmethod
+    async def get_user_password(self, telegram_id: int) -> Optional[str]:
+        ...
+
+    @abstractmethod
+    async def set_user_consent(self, telegram_id: int, consented: bool, version: str = "1.0") -> bool:
+        ...
+
+    @abstractmethod
+    async def has_user_consented(self, telegram_id: int) -> bool:
+        ...
+
+    @abstractmethod
+    async def get_all_active_users(self) -> List[Dict[str, Any]]:
+        ...
+
+    @abstractmethod
+    async def get_all_consented_users(self) -> List[Dict[str, Any]]:
+        ...
+
+    @abstractmethod
+    def stream_active_users(self, fields: Sequence[str] = ('telegram_id',),
+                            chunk_size: int = 1000) -> AsyncIterator[Dict[str, Any]]:
+        ...
+
+    @abstractmethod
+    def stream_consented_users(self, fields: Sequence[str] = ('telegram_id',),
+                               chunk_size: int = 1000) -> AsyncIterator[Dict[str, Any]]:
+        ...
+
+    @abstractmethod
+    async def is_admin(self, telegram_id: int) -> bool:
+        ...
+
+    @abstractmethod
+    async def set_admin(self, telegram_id: int, is_admin_status: bool) -> bool:
+        ...
+
+    # Hackathons and stages
+    @abstractmethod
+    async def create_hackathon(self, name: str, **kwargs) -> Dict[str, Any]:
+        ...
+
+    @abstractmethod
+    async def get_hackathon(self, hackathon_id) -> Optional[Dict[str, Any]]:
+        ...
+
+    @abstractmethod
+    async def get_active_hackathons(self) -> List[Dict[str, Any]]:
+        ...
+
+    @abstractmethod
+    async def update_hackathon_status(self, hackathon_id, status: str) -> bool:
+        ...
+
+    @abstractmethod
+    async def create_stage(self, hackathon_id, stage_number: int, name: str, **kwargs) -> Dict[str, Any]:
+        ...
+
+    @abstractmethod
+    async def get_stage(self, stage_id) -> Optional[Dict[str, Any]]:
+        ...
+
+    @abstractmethod
+    async def get_stages(self, hackathon_id) -> List[Dict[str, Any]]:
+        ...
+
+    @abstractmethod
+    async def get_active_stage(self, hackathon_id) -> Optional[Dict[str, Any]]:
+        ...
+
+    @abstractmethod
+    async def get_stage_view(self, stage_id, telegram_id: int) -> Optional[Dict[str, Any]]:
+        ...
+
+    @abstractmethod
+    async def activate_stage(self, stage_id) -> bool:
+        ...
+
+    # Teams
+    @abstractmethod
+    async def create_team(self, hackathon_id, name: str, owner_id: int, owner_role: str = "PROJECT_MANAGER",
+                          field: str = None, portfolio_link: str = None) -> Dict[str, Any]:
+        ...
+
+    @abstractmethod
+    async def get_team(self, team_id) -> Optional[Dict[str, Any]]:
+        ...
+
+    @abstractmethod
+    async def get_team_by_code(self, code: str) -> Optional[Dict[str, Any]]:
+        ...
+
+    @abstractmethod
+    async def get_user_teams(self, telegram_id: int) -> List[Dict[str, Any]]:
+        ...
+
+    @abstractmethod
+    async def get_user_team_for_hackathon(self, telegram_id: int, hackathon_id) -> Optional[Dict[str, Any]]:
+        ...
+
+    @abstractmethod
+    async def add_team_member(self, team_id, user_id: int, role: str = "BACKEND") -> bool:
+        ...
+
+    @abstractmethod
+    async def check_team_join(self, code: str, telegram_id: int) -> Dict[str, Any]:
+        ...
+
+    @abstractmethod
+    async def join_team_by_code(self, code: str, telegram_id: int, role: str = "BACKEND") -> Dict[str, Any]:
+        ...
+
+    @abstractmethod
+    async def update_member_role(self, team_id, user_id: int, role: str) -> bool:
+        ...
+
+    @abstractmethod
+    async def get_team_members(self, team_id) -> List[Dict[str, Any]]:
+        ...
+
+    @abstractmethod
+    async def remove_team_member(self, team_id, user_id: int) -> bool:
+        ...
+
+    @abstractmethod
+    async def leave_team(self, team_id, user_id: int) -> Dict[str, Any]:
+        ...
+
+    # Submissions
+    @abstractmethod
+    async def create_submission(self, team_id, stage_id, submitted_by: int, content: str = None,
+                                submission_type: str = 'link', file_id: str = None,
+                                file_name: str = None, file_type: str = None) -> Dict[str, Any]:
+        ...
+
+    @abstractmethod
+    async def get_submission(self, team_id, stage_id) -> Optional[Dict[str, Any]]:
+        ...
+
+    @abstractmethod
+    async def get_stage_submissions(self, stage_id) -> List[Dict[str, Any]]:
+        ...
+
+    @abstractmethod
+    async def get_all_submissions(self) -> List[Dict[str, Any]]:
+        ...
+
+    @abstractmethod
+    async def get_submissions_page(self, hackathon_id=None, stage_id=None, team_id=None, cursor: str = None,
+                                   backward: bool = False, limit: int = 20) -> Dict[str, Any]:
+        ...
+
+    # Conversation state, notifications, audit, stats
+    @abstractmethod
+    async def set_registration_state(self, telegram_id: int, step: str, data: dict = None) -> None:
+        ...
+
+    @abstractmethod
+    async def get_registration_state(self, telegram_id: int) -> Optional[Dict[str, Any]]:
+        ...
+
+    @abstractmethod
+    async def clear_registration_state(self, telegram_id: int) -> None:
+        ...
+
+    @abstractmethod
+    async def get_hackathon_participants(self, hackathon_id) -> List[int]:
+        ...
+
+    @abstractmethod
+    def stream_hackathon_participants(self, hackathon_id, fields: Sequence[str] = ('telegram_id',),
+                                      chunk_size: int = 1000) -> AsyncIterator[Dict[str, Any]]:
+        ...
+
+    @abstractmethod
+    async def log_action(self, telegram_id: int, action: str, details: dict = None) -> None:
+        ...
+
+    @abstractmethod
+    async def get_stats(self) -> Dict[str, Any]:
+        ...
+
+    @abstractmethod
+    async def reconcile_stats(self) -> Dict[str, int]:
+        ...
+
+    @abstractmethod
+    async def record_stats_sample(self, interval: int) -> None:
+        ...
+
+    @abstractmethod
+    async def downsample_stats_samples(self) -> int:
+        ...
+
+    @abstractmethod
+    async def get_stats_history(self, since) -> List[Dict[str, Any]]:
+        ...
+
+
+REPOSITORY_METHODS = tuple(sorted(Repository.__abstractmethods__))
+
+
+def missing_methods(backend) -> List[str]:
+    """Interface methods `backend` doesn't provide (database.py included)."""
+    missing = []
+    for name in REPOSITORY_METHODS:
+        impl = getattr(backend, name, None)
+        if impl is None or getattr(impl, '__func__', None) is vars(Repository)[name]:
+            missing.append(name)
+    return missing
+
+
+class RepositoryProxy:
+    """
+    Stable handle on the active backend. Attributes outside the interface
+    (TeamJoinResult, MAX_TEAM_SIZE, get_localized_field, ...) come from database.py
+    whatever the backend.
+    """
+
+    def __init__(self, backend=database):
+        object.__setattr__(self, '_backend', backend)
+
+    def __getattr__(self, name):
+        if name in REPOSITORY_METHODS:
+            return getattr(self._backend, name)
+        return getattr(database, name)
+
+    def __setattr__(self, name, value):
+        raise AttributeError("Use repository.set_backend() to change the data backend")
+
+
+db = RepositoryProxy()
+
+
+def get_backend():
+    return db._backend
+
+
+def set_backend(backend) -> None:
+    missing = missing_methods(backend)
+    if missing:
+        raise TypeError(f"{type(backend).__name__} does not implement: {', '.join(missing)}")
+    object.__setattr__(db, '_backend', backend)
+    logger.info(f"Data backend: {getattr(backend, '__name__', type(backend).__name__)}")
+
+
+def use_memory():
+    """Switch to a fresh in-memory backend and return it."""
+    from memory_repository import MemoryRepository
+    backend = MemoryRepository()
+    set_backend(backend)
+    return backend
+
+
+def use_postgres() -> None:
+    set_backend(database)
+
+
+if DB_BACKEND == 'memory':
+    use_memory()
@@ -0,0 +1,210 @@
+"""
+Conversation state store for CBU Coding Hackathon Bot
+Hot registration/wizard states are kept in memory, Postgres stays the durable copy
+"""
+
+import asyncio
+import copy
+import logging
+import contextvars
+from collections import OrderedDict
+from datetime import datetime, timezone
+from typing import Optional, Dict, Any
+
+logger = logging.getLogger(__name__)
+
+
+class StateBackend:
+    """Durable storage behind a state store (see PostgresStateBackend in database.py)."""
+
+    async def load(self, telegram_id: int) -> Optional[Dict[str, Any]]:
+        raise NotImplementedError
+
+    async def save(self, telegram_id: int, step: str, data: dict) -> None:
+        raise NotImplementedError
+
+    async def delete(self, telegram_id: int) -> None:
+        raise NotImplementedError
+
+
+class StateStore:
+    """Interface used by database.get/set/clear_registration_state."""
+
+    async def get(self, telegram_id: int) -> Optional[Dict[str, Any]]:
+        raise NotImplementedError
+
+    async def set(self, telegram_id: int, step: str, data: dict = None) -> None:
+        raise NotImplementedError
+
+    async def clear(self, telegram_id: int) -> None:
+        raise NotImplementedError
+
+    async def flush(self) -> None:
+        """Write out anything not yet persisted."""
+
+    def stats(self) -> Dict[str, Any]:
+        return {}
+
+
+class DirectStateStore(StateStore):
+    """Every call goes straight to the backend. Use when several replicas share state."""
+
+    def __init__(self, backend: StateBackend):
+        self.backend = backend
+
+    async def get(self, telegram_id: int) -> Optional[Dict[str, Any]]:
+        return await self.backend.load(telegram_id)
+
+    async def set(self, telegram_id: int, step: str, data: dict = None) -> None:
+        await self.backend.save(telegram_id, step, data or {})
+
+    async def clear(self, telegram_id: int) -> None:
+        await self.backend.delete(telegram_id)
+
+
+class CachedStateStore(StateStore):
+    """
+    Bounded in-memory state map with coalesced write-behind.
+
+    Reads are served locally once a user's state (or its absence) is known.
+    Writes update memory immediately and are flushed to the backend after
+    `flush_delay` seconds, so several steps in quick succession cost one write.
+    Pending writes are kept outside the LRU and are never evicted before they
+    reach the backend. Only safe with a single bot process.
+
+    While the backend is failing, flushes back off exponentially up to
+    `max_retry_delay` seconds and the outage is logged once, not per attempt.
+    """
+
+    def __init__(self, backend: StateBackend, max_entries: int = 10000, flush_delay: float = 0.5,
+                 max_retry_delay: float = 60.0):
+        self.backend = backend
+        self.max_entries = max_entries
+        self.flush_delay = flush_delay
+        self.max_retry_delay = max_retry_delay
+        # 0 while the backend is healthy
+        self._retry_delay = 0.0
+        self._backoff_until = 0.0
+        self._outage_errors = 0
+        self._cache: "OrderedDict[int, Optional[Dict[str, Any]]]" = OrderedDict()
+        self._dirty: Dict[int, Optional[Dict[str, Any]]] = {}
+        self._timers: Dict[int, asyncio.TimerHandle] = {}
+        self._inflight: set = set()
+        self._tasks: set = set()
+        self._counters = {'hits': 0, 'misses': 0, 'writes': 0, 'coalesced': 0, 'flushes': 0, 'flush_errors': 0}
+
+    async def get(self, telegram_id: int) -> Optional[Dict[str, Any]]:
+        if telegram_id in self._dirty:
+            self._counters['hits'] += 1
+            return copy.deepcopy(self._dirty[telegram_id])
+        if telegram_id in self._cache:
+            self._counters['hits'] += 1
+            self._cache.move_to_end(telegram_id)
+            return copy.deepcopy(self._cache[telegram_id])
+
+        self._counters['misses'] += 1
+        state = await self.backend.load(telegram_id)
+        # A write may have landed while we were loading; it wins
+        if telegram_id in self._dirty:
+            return copy.deepcopy(self._dirty[telegram_id])
+        self._remember(telegram_id, state)
+        return copy.deepcopy(state)
+
+    async def set(self, telegram_id: int, step: str, data: dict = None) -> None:
+        state = {
+            'telegram_id': telegram_id,
+            'current_step': step,
+            'data': copy.deepcopy(data) if data else {},
+            'updated_at': datetime.now(timezone.utc),
+        }
+        self._write(telegram_id, state)
+
+    async def clear(self, telegram_id: int) -> None:
+        self._write(telegram_id, None)
+
+    async def flush(self) -> None:
+        for handle in self._timers.values():
+            handle.cancel()
+        self._timers.clear()
+        for telegram_id in list(self._dirty):
+            if telegram_id not in self._inflight:
+                self._start_flush(telegram_id)
+        if self._tasks:
+            await asyncio.gather(*list(self._tasks), return_exceptions=True)
+
+    def stats(self) -> Dict[str, Any]:
+        return dict(self._counters, entries=len(self._cache), pending=len(self._dirty),
+                    retry_delay=self._retry_delay)
+
+    def _remember(self, telegram_id: int, state: Optional[Dict[str, Any]]) -> None:
+        self._cache[telegram_id] = state
+        self._cache.move_to_end(telegram_id)
+        while len(self._cache) > self.max_entries:
+            self._cache.popitem(last=False)
+
+    def _write(self, telegram_id: int, state: Optional[Dict[str, Any]]) -> None:
+        self._counters['writes'] += 1
+        self._dirty[telegram_id] = state
+        self._remember(telegram_id, copy.deepcopy(state))
+        self._schedule(telegram_id)
+
+    def _schedule(self, telegram_id: int) -> None:
+        if telegram_id in self._timers:
+            self._counters['coalesced'] += 1
+            return
+        loop = asyncio.get_running_loop()
+        # Flushes run detached from the update that triggered them
+        self._timers[telegram_id] = loop.call_later(
+            max(self.flush_delay, self._retry_delay), self._start_flush, telegram_id,
+            context=contextvars.Context()
+        )
+
+    def _start_flush(self, telegram_id: int) -> None:
+        self._timers.pop(telegram_id, None)
+        if telegram_id in self._inflight:
+            # The running flush loops until no newer value is pending
+            return
+        self._inflight.add(telegram_id)
+        task = asyncio.ensure_future(self._flush_user(telegram_id))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _flush_user(self, telegram_id: int) -> None:
+        try:
+            while telegram_id in self._dirty:
+                state = self._dirty.pop(telegram_id)
+                try:
+                    if state is None:
+                        await self.backend.delete(telegram_id)
+                    else:
+                        await self.backend.save(telegram_id, state['current_step'], state['data'])
+                    self._counters['flushes'] += 1
+                    self._flush_succeeded()
+                except Exception as e:
+                    self._counters['flush_errors'] += 1
+                    self._flush_failed(e)
+                    # Keep the value for a retry unless something newer replaced it
+                    self._dirty.setdefault(telegram_id, state)
+                    self._schedule(telegram_id)
+                    return
+        finally:
+            self._inflight.discard(telegram_id)
+
+    def _flush_failed(self, error: Exception) -> None:
+        now = asyncio.get_running_loop().time()
+        self._outage_errors += 1
+        if not self._retry_delay:
+            logger.error(f"State flushes failing, {len(self._dirty) + 1} pending, retrying with backoff: {error}")
+            self._retry_delay = self.flush_delay
+        elif now >= self._backoff_until:
+            # Grow once per retry round, not once per user failing in the same round
+            self._retry_delay = min(self._retry_delay * 2, self.max_retry_delay)
+        else:
+            return
+        self._backoff_until = now + self._retry_delay
+
+    def _flush_succeeded(self) -> None:
+        if self._retry_delay:
+            logger.info(f"State flushes recovered after {self._outage_errors} failed attempts")
+            self._retry_delay = 0.0
+            self._outage_errors = 0
@@ -0,0 +1,100 @@
+"""
+Handler and Telegram API instrumentation for Hackathon Bot
+Feeds utils.metrics; everything shows up on the METRICS_PORT endpoint
+"""
+
+import re
+import time
+import functools
+from contextlib import contextmanager
+from typing import Callable
+
+from telegram.error import NetworkError, TimedOut
+from telegram.request import HTTPXRequest
+
+from utils import metrics
+
+HANDLER_LATENCY = metrics.histogram(
+    'bot_handler_seconds', 'Time spent handling one update', ('handler',))
+HANDLER_UPDATES = metrics.counter(
+    'bot_handler_updates_total', 'Updates handled', ('handler', 'outcome'))
+HANDLERS_IN_FLIGHT = metrics.gauge(
+    'bot_handlers_in_flight', 'Updates currently being handled')
+
+API_LATENCY = metrics.histogram(
+    'telegram_api_seconds', 'Telegram Bot API call latency', ('method',))
+API_ERRORS = metrics.counter(
+    'telegram_api_errors_total', 'Failed Telegram Bot API calls', ('method', 'reason'))
+
+QUEUE_DEPTH = metrics.gauge(
+    'bot_queue_depth', 'Items waiting in in-process queues', ('queue',))
+
+# Callback data segments that carry ids rather than route names
+_ID_SEGMENT = re.compile(r'\d|-')
+
+
+def callback_route(data: str) -> str:
+    """`submit_<stage>_<team>` -> `submit`, `team_role_BACKEND` stays as is."""
+    parts = []
+    for part in (data or '').split('_'):
+        if _ID_SEGMENT.search(part):
+            break
+        parts.append(part)
+    return '_'.join(parts) or 'unknown'
+
+
+@contextmanager
+def track_handler(name: str):
+    """Time the enclosed block as one update handled by `name`."""
+    HANDLERS_IN_FLIGHT.inc()
+    started = time.perf_counter()
+    outcome = 'error'
+    try:
+        yield
+        outcome = 'ok'
+    finally:
+        HANDLERS_IN_FLIGHT.dec()
+        HANDLER_LATENCY.labels(name).observe(time.perf_counter() - started)
+        HANDLER_UPDATES.labels(name, outcome).inc()
+
+
+def timed_handler(name: str, callback: Callable) -> Callable:
+    """Wrap a handler callback so each update is timed under `name`."""
+    @functools.wraps(callback)
+    async def wrapper(update, context):
+        with track_handler(name):
+            return await callback(update, context)
+    return wrapper
+
+
+class InstrumentedRequest(HTTPXRequest):
+    """HTTPXRequest that records latency and failures per Bot API method."""
+
+    async def do_request(self, url: str, method: str, *args, **kwargs):
+        api_method = url.rsplit('/', 1)[-1]
+        started = time.perf_counter()
+        try:
+            status, payload = await super().do_request(url, method, *args, **kwargs)
+        except Exception as e:
+            API_ERRORS.labels(api_method, _error_reason(e)).inc()
+            raise
+        finally:
+            API_LATENCY.labels(api_method).observe(time.perf_counter() - started)
+        if status >= 400:
+            API_ERRORS.labels(api_method, str(status)).inc()
+        return status, payload
+
+
+def _error_reason(error: Exception) -> str:
+    if isinstance(error, TimedOut):
+        return 'timeout'
+    if isinstance(error, NetworkError):
+        return 'network'
+    return type(error).__name__
+
+
+def watch_application(application) -> None:
+    """Export the depth of the application's update queue on every scrape."""
+    def collect_queues():
+        QUEUE_DEPTH.labels('updates').set(application.update_queue.qsize())
+    metrics.add_collector(collect_queues)
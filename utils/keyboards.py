@@ -296,6 +296,16 @@ def admin_stages_keyboard(stages: list, hackathon_id: int, lang: str = 'uz'):
     return InlineKeyboardMarkup(keyboard)
 
 
+def admin_submissions_page_keyboard(page: dict):
+    """Newer/older buttons for a /submissions page; None when there is only one page."""
+    row = []
+    if page.get('prev'):
+        row.append(InlineKeyboardButton("⬅️ Newer", callback_data=f"admin_subs_p_{page['prev']}"))
+    if page.get('next'):
+        row.append(InlineKeyboardButton("Older ➡️", callback_data=f"admin_subs_n_{page['next']}"))
+    return InlineKeyboardMarkup([row]) if row else None
+
+
 def team_role_keyboard(lang: str = 'uz'):
     """Team role selection keyboard for joining/creating team."""
     keyboard = [
@@ -0,0 +1,267 @@
+"""
+In-process metrics for Hackathon Bot
+Prometheus-style labelled counters, gauges and histograms without extra dependencies
+"""
+
+import asyncio
+import logging
+import threading
+from bisect import bisect_left
+from typing import Callable, Dict, List, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Seconds; tuned for DB/API latencies from sub-millisecond to tens of seconds
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1,
+                   0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+class _HistogramChild:
+    """One label combination of a histogram."""
+    __slots__ = ('buckets', 'counts', 'sum', 'count')
+
+    def __init__(self, buckets: Tuple[float, ...]):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)  # last slot is +Inf
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def percentile(self, q: float) -> float:
+        """Estimate the q-th quantile (0..1) by interpolating inside buckets."""
+        if not self.count:
+            return 0.0
+        rank = q * self.count
+        seen = 0
+        for i, bucket_count in enumerate(self.counts):
+            if seen + bucket_count >= rank and bucket_count:
+                lower = self.buckets[i - 1] if i > 0 else 0.0
+                upper = self.buckets[i] if i < len(self.buckets) else self.buckets[-1]
+                return lower + (upper - lower) * (rank - seen) / bucket_count
+            seen += bucket_count
+        return self.buckets[-1]
+
+    def summary(self) -> Dict[str, float]:
+        return {
+            'count': self.count,
+            'sum': self.sum,
+            'p50': self.percentile(0.50),
+            'p95': self.percentile(0.95),
+            'p99': self.percentile(0.99),
+        }
+
+
+class _CounterChild:
+    __slots__ = ('value',)
+
+    def __init__(self):
+        self.value = 0.0
+
+    def inc(self, amount: float = 1.0) -> None:
+        self.value += amount
+
+
+class _GaugeChild:
+    __slots__ = ('value',)
+
+    def __init__(self):
+        self.value = 0.0
+
+    def set(self, value: float) -> None:
+        self.value = value
+
+    def inc(self, amount: float = 1.0) -> None:
+        self.value += amount
+
+    def dec(self, amount: float = 1.0) -> None:
+        self.value -= amount
+
+
+class _Metric:
+    type = ''
+
+    def __init__(self, name: str, documentation: str, labelnames: Tuple[str, ...] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._children = {}
+        self._lock = threading.Lock()
+
+    def _new_child(self):
+        raise NotImplementedError
+
+    def labels(self, *values):
+        key = tuple(str(v) for v in values)
+        child = self._children.get(key)
+        if child is None:
+            with self._lock:
+                child = self._children.setdefault(key, self._new_child())
+        return child
+
+    def items(self) -> list:
+        return list(self._children.items())
+
+    def reset(self) -> None:
+        with self._lock:
+            self._children.clear()
+
+
+class Counter(_Metric):
+    """Labelled monotonic counter: `c.labels('get_user').inc()`."""
+    type = 'counter'
+
+    def _new_child(self) -> _CounterChild:
+        return _CounterChild()
+
+    def inc(self, amount: float = 1.0) -> None:
+        self.labels().inc(amount)
+
+
+class Gauge(_Metric):
+    """Labelled value that can go up and down: `g.labels('update_queue').set(3)`."""
+    type = 'gauge'
+
+    def _new_child(self) -> _GaugeChild:
+        return _GaugeChild()
+
+    def set(self, value: float) -> None:
+        self.labels().set(value)
+
+    def inc(self, amount: float = 1.0) -> None:
+        self.labels().inc(amount)
+
+    def dec(self, amount: float = 1.0) -> None:
+        self.labels().dec(amount)
+
+
+class Histogram(_Metric):
+    """Labelled histogram: `h.labels('get_user').observe(0.003)`."""
+    type = 'histogram'
+
+    def __init__(self, name: str, documentation: str, labelnames: Tuple[str, ...] = (),
+                 buckets: Tuple[float, ...] = LATENCY_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def _new_child(self) -> _HistogramChild:
+        return _HistogramChild(self.buckets)
+
+    def observe(self, value: float) -> None:
+        self.labels().observe(value)
+
+
+_registry: Dict[str, _Metric] = {}
+_collectors: List[Callable[[], None]] = []
+
+
+def _register(cls, name: str, documentation: str, labelnames: Tuple[str, ...], **kwargs):
+    metric = _registry.get(name)
+    if metric is None:
+        metric = _registry[name] = cls(name, documentation, labelnames, **kwargs)
+    return metric
+
+
+def histogram(name: str, documentation: str, labelnames: Tuple[str, ...] = (),
+              buckets: Tuple[float, ...] = LATENCY_BUCKETS) -> Histogram:
+    """Get or create a histogram registered under `name`."""
+    return _register(Histogram, name, documentation, labelnames, buckets=buckets)
+
+
+def counter(name: str, documentation: str, labelnames: Tuple[str, ...] = ()) -> Counter:
+    """Get or create a counter registered under `name`."""
+    return _register(Counter, name, documentation, labelnames)
+
+
+def gauge(name: str, documentation: str, labelnames: Tuple[str, ...] = ()) -> Gauge:
+    """Get or create a gauge registered under `name`."""
+    return _register(Gauge, name, documentation, labelnames)
+
+
+def add_collector(collect: Callable[[], None]) -> None:
+    """Run `collect` before every scrape, e.g. to copy pool sizes into gauges."""
+    if collect not in _collectors:
+        _collectors.append(collect)
+
+
+def collect() -> None:
+    for fn in list(_collectors):
+        try:
+            fn()
+        except Exception as e:
+            logger.debug(f"Metrics collector {fn.__name__} failed: {e}")
+
+
+def get_registry() -> Dict[str, _Metric]:
+    return _registry
+
+
+# ============================================================================
+# TEXT EXPOSITION
+# ============================================================================
+
+def _escape(value: str) -> str:
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _label_str(names: Tuple[str, ...], values: Tuple[str, ...], extra: str = '') -> str:
+    parts = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return '{' + ','.join(parts) + '}' if parts else ''
+
+
+def render_text() -> str:
+    """All registered metrics in the Prometheus text exposition format."""
+    collect()
+    lines = []
+    for metric in list(_registry.values()):
+        lines.append(f"# HELP {metric.name} {metric.documentation}")
+        lines.append(f"# TYPE {metric.name} {metric.type}")
+        for values, child in metric.items():
+            if isinstance(metric, Histogram):
+                cumulative = 0
+                for bound, count in zip(metric.buckets, child.counts):
+                    cumulative += count
+                    labels = _label_str(metric.labelnames, values, f'le="{bound}"')
+                    lines.append(f"{metric.name}_bucket{labels} {cumulative}")
+                labels = _label_str(metric.labelnames, values, 'le="+Inf"')
+                lines.append(f"{metric.name}_bucket{labels} {child.count}")
+                labels = _label_str(metric.labelnames, values)
+                lines.append(f"{metric.name}_sum{labels} {child.sum}")
+                lines.append(f"{metric.name}_count{labels} {child.count}")
+            else:
+                lines.append(f"{metric.name}{_label_str(metric.labelnames, values)} {child.value}")
+    return '\n'.join(lines) + '\n'
+
+
+async def _handle_http(reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+    try:
+        request_line = await reader.readline()
+        # Drain headers; the request body (if any) is ignored
+        while (await reader.readline()).strip():
+            pass
+        parts = request_line.decode('latin-1').split()
+        if len(parts) >= 2 and parts[0] == 'GET' and parts[1].split('?')[0] == '/metrics':
+            status, body = '200 OK', render_text().encode()
+        else:
+            status, body = '404 Not Found', b'not found\n'
+        writer.write(
+            f"HTTP/1.1 {status}\r\nContent-Type: text/plain; version=0.0.4; charset=utf-8\r\n"
+            f"Content-Length: {len(body)}\r\nConnection: close\r\n\r\n".encode() + body
+        )
+        await writer.drain()
+    except Exception as e:
+        logger.debug(f"Metrics request failed: {e}")
+    finally:
+        writer.close()
+
+
+async def start_http_server(port: int, host: str = '0.0.0.0') -> asyncio.AbstractServer:
+    """Serve GET /metrics from the running event loop."""
+    server = await asyncio.start_server(_handle_http, host, port)
+    logger.info(f"📈 Metrics endpoint on http://{host}:{port}/metrics")
+    return server
@@ -0,0 +1,199 @@
+"""
+Update recorder for Hackathon Bot
+Writes incoming updates to an anonymized, gzip-compressed JSONL trace that
+benchmarks/replay.py can feed back through the handlers
+
+Trace format: first line is a header, then one update per line
+  {"trace": 1, "started_at": "...", "hostname": "..."}
+  {"t": 12.345, "update": {...}}
+where `t` is seconds since the trace started.
+"""
+
+import os
+import re
+import gzip
+import hmac
+import json
+import time
+import queue
+import socket
+import hashlib
+import logging
+import secrets
+import threading
+from datetime import datetime, timezone
+from typing import Any, Optional
+
+from locales.translations import TRANSLATIONS
+
+logger = logging.getLogger(__name__)
+
+# Path of the trace file (strftime placeholders allowed); unset disables recording
+RECORD_UPDATES = os.getenv("RECORD_UPDATES")
+# Key for hashing ids; a random one per process means traces can't be joined
+RECORD_SALT = os.getenv("RECORD_SALT")
+
+_NAME_FIELDS = {'first_name', 'last_name', 'username', 'title', 'vcard'}
+_ID_CONTAINERS = {'from', 'chat', 'user', 'sender_chat', 'forward_from', 'forward_from_chat'}
+
+# Menu buttons are part of the traffic shape, not personal data
+_BUTTON_TEXTS = {text for key, langs in TRANSLATIONS.items() if key.startswith('btn_') for text in langs.values()}
+
+_DATE_RE = re.compile(r'^\d{2}[./-]\d{2}[./-]\d{4}$')
+_EMAIL_RE = re.compile(r'^[^@\s]+@[^@\s]+\.[a-zA-Z]{2,}$')
+_URL_RE = re.compile(r'^https?://', re.IGNORECASE)
+_DIGITS_RE = re.compile(r'^\+?[\d\s()-]{7,}$')
+_TEAM_CODE_RE = re.compile(r'^[A-Z0-9]{6}$')
+_COMMAND_RE = re.compile(r'^(\s*/\S+)(.*)$', re.DOTALL)
+# Telegram ids inside callback data, e.g. remove_member_<team uuid>_<telegram id>
+_CALLBACK_ID_RE = re.compile(r'(?<=_)\d+(?=_|$)')
+# Callback data that is an opaque token (paging cursors), not ids
+_OPAQUE_CALLBACKS = ('admin_subs_',)
+
+
+class Anonymizer:
+    """Replaces ids and PII with stable pseudonyms that still pass the bot's validators."""
+
+    def __init__(self, salt: Optional[str] = None):
+        self._key = (salt or secrets.token_hex(16)).encode()
+
+    def _digest(self, value: Any) -> str:
+        return hmac.new(self._key, str(value).encode(), hashlib.sha256).hexdigest()
+
+    def user_id(self, value: int) -> int:
+        # Same id -> same pseudonym within a trace; stays in the positive int64 range
+        return 10 ** 12 + int(self._digest(value)[:12], 16) % 10 ** 12
+
+    def digits(self, value: str, length: int) -> str:
+        return str(int(self._digest(value), 16))[:length].rjust(length, '0')
+
+    @staticmethod
+    def mask(text: str) -> str:
+        """Keep the length and shape of free text, drop the content."""
+        return ''.join('x' if c.isalpha() else '0' if c.isdigit() else c for c in text)
+
+    def callback_data(self, data: str) -> str:
+        # Same pseudonyms as the users' own ids, so replay still finds the member
+        if data.startswith(_OPAQUE_CALLBACKS):
+            return data
+        return _CALLBACK_ID_RE.sub(lambda m: str(self.user_id(int(m.group()))), data)
+
+    def text(self, text: str) -> str:
+        stripped = text.strip()
+        command = _COMMAND_RE.match(text)
+        if command:
+            # Arguments (deep-link codes, /broadcast text, admin ids) are masked like free text
+            return command.group(1) + self.mask(command.group(2))
+        if not stripped or stripped in _BUTTON_TEXTS or _TEAM_CODE_RE.match(stripped):
+            return text
+        if _URL_RE.match(stripped):
+            return f"https://example.com/{self._digest(stripped)[:12]}"
+        if _EMAIL_RE.match(stripped):
+            return f"user{self._digest(stripped)[:10]}@example.com"
+        if _DATE_RE.match(stripped):
+            return "01.01.2000"
+        if stripped.isdigit():
+            # PINFL and other numbers keep their length
+            return self.digits(stripped, len(stripped))
+        if _DIGITS_RE.match(stripped):
+            return '+' + self.digits(stripped, 12)
+        # Free text (names, team names, locations): keep the length, drop the content
+        return self.mask(text)
+
+    def update(self, data: Any, parent: str = '') -> Any:
+        if isinstance(data, list):
+            return [self.update(item, parent) for item in data]
+        if not isinstance(data, dict):
+            return data
+        result = {}
+        for key, value in data.items():
+            if key == 'id' and parent in _ID_CONTAINERS:
+                result[key] = self.user_id(value)
+            elif key in ('user_id', 'chat_id') and isinstance(value, int):
+                result[key] = self.user_id(value)
+            elif key in _NAME_FIELDS and isinstance(value, str):
+                result[key] = f"u{self._digest(value)[:8]}"
+            elif key == 'chat_instance':
+                result[key] = self._digest(value)[:16]
+            elif key == 'phone_number':
+                result[key] = '+' + self.digits(value, 12)
+            elif key in ('text', 'caption') and isinstance(value, str):
+                result[key] = self.text(value)
+            elif ((key == 'data' and parent == 'callback_query') or key == 'callback_data') and isinstance(value, str):
+                result[key] = self.callback_data(value)
+            elif key == 'file_name' and isinstance(value, str):
+                ext = os.path.splitext(value)[1][:8]
+                result[key] = f"file{ext}"
+            elif key in ('entities', 'caption_entities'):
+                # Offsets stay valid because text keeps its length; drop payloads like urls/users
+                result[key] = [{k: v for k, v in e.items() if k in ('type', 'offset', 'length')} for e in value]
+            elif key == 'location':
+                result[key] = {'latitude': 0.0, 'longitude': 0.0}
+            else:
+                result[key] = self.update(value, key)
+        return result
+
+
+class UpdateRecorder:
+    """
+    Appends anonymized updates to a gzip JSONL trace from a background thread.
+
+    `record` only serializes and enqueues, so the event loop never waits on
+    compression or disk I/O. If the writer falls behind, updates are dropped
+    (and counted) rather than growing memory without bound.
+    """
+
+    def __init__(self, path: str, salt: Optional[str] = None, max_pending: int = 10000):
+        self.path = datetime.now().strftime(path)
+        self.anonymizer = Anonymizer(salt)
+        self.recorded = 0
+        self.dropped = 0
+        self._started = time.monotonic()
+        self._queue: "queue.Queue[Optional[str]]" = queue.Queue(maxsize=max_pending)
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self) -> None:
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        header = {'trace': 1, 'started_at': datetime.now(timezone.utc).isoformat(), 'hostname': socket.gethostname()}
+        self._queue.put(json.dumps(header))
+        self._thread = threading.Thread(target=self._write, name='update-recorder', daemon=True)
+        self._thread.start()
+        logger.info(f"🎞 Recording anonymized updates to {self.path}")
+
+    def stop(self) -> None:
+        if self._thread:
+            self._queue.put(None)
+            self._thread.join(timeout=10)
+            self._thread = None
+        logger.info(f"🎞 Recorded {self.recorded} updates ({self.dropped} dropped)")
+
+    async def record(self, update, context) -> None:
+        """TypeHandler callback; register in a group that runs before the routers."""
+        line = json.dumps({
+            't': round(time.monotonic() - self._started, 4),
+            'update': self.anonymizer.update(update.to_dict()),
+        }, ensure_ascii=False, separators=(',', ':'))
+        try:
+            self._queue.put_nowait(line)
+            self.recorded += 1
+        except queue.Full:
+            self.dropped += 1
+
+    def _write(self) -> None:
+        with gzip.open(self.path, 'at', encoding='utf-8') as f:
+            while True:
+                line = self._queue.get()
+                if line is None:
+                    break
+                f.write(line + '\n')
+                # Flush whenever the queue drains so a crash loses little
+                if self._queue.empty():
+                    f.flush()
+
+
+def create_recorder() -> Optional[UpdateRecorder]:
+    if not RECORD_UPDATES:
+        return None
+    return UpdateRecorder(RECORD_UPDATES, RECORD_SALT)
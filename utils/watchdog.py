@@ -0,0 +1,134 @@
+"""
+Event-loop lag watchdog for Hackathon Bot
+Finds synchronous code (zip/CSV building, file I/O) that stalls every update
+"""
+
+import os
+import sys
+import time
+import asyncio
+import logging
+import threading
+import traceback
+from collections import Counter as FrameCounter
+from typing import Optional
+
+from utils import metrics
+
+logger = logging.getLogger(__name__)
+
+# off | on (one stack sample per stall) | debug (continuous sampling + asyncio debug mode)
+LOOP_WATCHDOG = os.getenv("LOOP_WATCHDOG", "on").lower()
+LOOP_LAG_THRESHOLD_MS = float(os.getenv("LOOP_LAG_THRESHOLD_MS", "200"))
+
+LOOP_LAG = metrics.histogram('event_loop_lag_seconds', 'Event loop scheduling lag')
+LOOP_STALLS = metrics.counter('event_loop_stalls_total', 'Times the loop was blocked past the threshold')
+
+_PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def _format_stack(frame, project_only: bool = True) -> str:
+    stack = traceback.extract_stack(frame)
+    if project_only:
+        own = [f for f in stack if f.filename.startswith(_PROJECT_ROOT) and 'site-packages' not in f.filename]
+        if not own:
+            stack = stack[-5:]
+        elif own[-1] is not stack[-1]:
+            # Keep the library call our code is stuck in (zipfile.write, os.remove...)
+            stack = own + [stack[-1]]
+        else:
+            stack = own
+    return ''.join(traceback.format_list(stack))
+
+
+class LoopWatchdog:
+    """
+    Measures how late the loop runs a periodic heartbeat.
+
+    A coroutine records a heartbeat every `interval`; a daemon thread notices
+    when the heartbeat is older than `threshold` and samples the loop thread's
+    stack while it is still blocked. In debug mode the thread keeps sampling
+    for the whole stall and reports the hottest frames when it ends.
+    """
+
+    def __init__(self, threshold: float = 0.2, interval: float = 0.1, debug: bool = False):
+        self.threshold = threshold
+        self.interval = interval
+        self.debug = debug
+        self.sample_interval = 0.01 if debug else interval
+        self._beat = time.monotonic()
+        self._loop_thread_id: Optional[int] = None
+        self._task: Optional[asyncio.Task] = None
+        self._thread: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+
+    def start(self) -> None:
+        loop = asyncio.get_running_loop()
+        self._loop_thread_id = threading.get_ident()
+        if self.debug:
+            loop.set_debug(True)
+            loop.slow_callback_duration = self.threshold
+        self._beat = time.monotonic()
+        self._task = loop.create_task(self._heartbeat())
+        self._thread = threading.Thread(target=self._monitor, name='loop-watchdog', daemon=True)
+        self._thread.start()
+        logger.info(f"⏱ Loop watchdog on (threshold {self.threshold * 1000:.0f}ms{', debug' if self.debug else ''})")
+
+    async def stop(self) -> None:
+        self._stop.set()
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+        if self._thread:
+            self._thread.join(timeout=1)
+
+    async def _heartbeat(self) -> None:
+        while True:
+            expected = time.monotonic() + self.interval
+            await asyncio.sleep(self.interval)
+            now = time.monotonic()
+            LOOP_LAG.observe(max(0.0, now - expected))
+            self._beat = now
+
+    def _monitor(self) -> None:
+        reported_beat = None
+        samples = FrameCounter()
+        stall_started = None
+        while not self._stop.wait(self.sample_interval):
+            beat = self._beat
+            blocked_for = time.monotonic() - beat
+            if blocked_for < self.threshold + self.interval:
+                if samples:
+                    self._report_profile(samples, time.monotonic() - stall_started)
+                    samples.clear()
+                continue
+
+            frame = sys._current_frames().get(self._loop_thread_id)
+            if frame is None:
+                continue
+            if beat != reported_beat:
+                reported_beat = beat
+                stall_started = beat + self.interval
+                LOOP_STALLS.inc()
+                logger.warning(f"Event loop blocked for {blocked_for * 1000:.0f}ms at:\n{_format_stack(frame)}")
+            if self.debug:
+                samples[_format_stack(frame)] += 1
+
+    def _report_profile(self, samples: FrameCounter, duration: float) -> None:
+        total = sum(samples.values())
+        lines = [f"Loop stall ended after ~{duration * 1000:.0f}ms, {total} samples:"]
+        for stack, count in samples.most_common(3):
+            lines.append(f"--- {count * 100 // total}% ---\n{stack}")
+        logger.warning('\n'.join(lines))
+
+
+def start_watchdog() -> Optional[LoopWatchdog]:
+    """Start the watchdog configured by LOOP_WATCHDOG; call from the running loop."""
+    if LOOP_WATCHDOG == 'off':
+        return None
+    watchdog = LoopWatchdog(threshold=LOOP_LAG_THRESHOLD_MS / 1000, debug=LOOP_WATCHDOG == 'debug')
+    watchdog.start()
+    return watchdog